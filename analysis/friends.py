@@ -0,0 +1,249 @@
+from typing import Optional, Iterable, Dict, Tuple, Any
+from scipy.sparse import csgraph
+from scipy import sparse
+from psycopg2 import extensions
+import pyarrow as pa
+import numpy as np
+import argparse
+import io
+import os
+from utils.database.connector import connect_to_database
+from analysis.helper import _copy_batches
+
+# The graph of steam.friends as NumPy arrays, each memory-mapped on load:
+#   ids      - the steamid of every node; a node keeps its position across rebuilds
+#   crawled  - the nodes whose friend lists are exported (the watermark of the rebuilds)
+#   sources, targets - the exported friend lists as directed edges
+#   indptr, indices  - the undirected adjacency in CSR form, without duplicates and self-loops
+FRIENDS_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'friends')
+
+
+def _path(name: str) -> str:
+    return os.path.join(FRIENDS_DIRECTORY, f'{name}.npy')
+
+
+class FriendGraph:
+    """
+    The undirected friend graph of Steam players, with integer-coded nodes.
+
+    Args:
+        **ids (np.ndarray)** - The steamid of every node.
+        **indptr (np.ndarray)** - The CSR row pointers of the adjacency.
+        **indices (np.ndarray)** - The CSR neighbours of the adjacency.
+    """
+    def __init__(self, ids: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self._order: Optional[np.ndarray] = None
+
+    def __repr__(self) -> str:
+        return f'FriendGraph({len(self.ids):,} players, {len(self.indices) // 2:,} friendships)'
+
+    @property
+    def adjacency(self) -> sparse.csr_matrix:
+        """
+        **sparse.csr_matrix** - The adjacency matrix over the memory-mapped arrays.
+        """
+        return sparse.csr_matrix((np.ones(len(self.indices), dtype=np.int8), self.indices, self.indptr),
+                                 shape=(len(self.ids), len(self.ids)))
+
+    def nodes(self, steamids: Iterable[Any]) -> np.ndarray:
+        """
+        Looks up the nodes of the given players.
+
+        Args:
+            **steamids (Iterable[Any])** - The steamids, as strings or integers.
+
+        Returns:
+            **np.ndarray** - The node of every steamid; -1 for players not in the graph.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.ids)
+        return _lookup(self.ids, self._order, np.asarray(list(steamids), dtype=np.int64))
+
+    def degrees(self) -> np.ndarray:
+        """
+        **np.ndarray** - The number of friends of every node.
+        """
+        return np.diff(self.indptr)
+
+    def hops(self, steamids: Iterable[Any], k: int) -> np.ndarray:
+        """
+        Computes the distance of every player from the given players, up to k friendships away.
+
+        Args:
+            **steamids (Iterable[Any])** - The starting players, e.g. the seeds of the players crawl.
+            **k (int)** - The maximum distance.
+
+        Returns:
+            **np.ndarray** - The distance of every node; -1 for nodes further than k.
+        """
+        adjacency = self.adjacency
+        distances = np.full(len(self.ids), -1, dtype=np.int16)
+        frontier = self.nodes(steamids)
+        frontier = np.unique(frontier[frontier >= 0])
+        distances[frontier] = 0
+
+        # Breadth-first search a level at a time: the neighbours of the whole frontier at once
+        for hop in range(1, k + 1):
+            if not len(frontier):
+                break
+            neighbours = np.unique(adjacency[frontier].indices)
+            frontier = neighbours[distances[neighbours] < 0]
+            distances[frontier] = hop
+        return distances
+
+    def components(self) -> Tuple[int, np.ndarray]:
+        """
+        Finds the connected components of the graph.
+
+        Returns:
+            **Tuple[int, np.ndarray]** - The number of components and the component of every node.
+        """
+        return csgraph.connected_components(self.adjacency, directed=False)
+
+
+def _lookup(ids: np.ndarray, order: np.ndarray, steamids: np.ndarray) -> np.ndarray:
+    # Binary search in the sorted view of the ids
+    if not len(ids):
+        return np.full(len(steamids), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(ids, steamids, sorter=order), len(ids) - 1)
+    nodes = order[positions]
+    return np.where(ids[nodes] == steamids, nodes, -1)
+
+
+def _upload_crawled(connection: extensions.connection, steamids: np.ndarray):
+    # Players already in the graph are copied into a temporary table,
+    # so only the friend lists of the other players are read
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE crawled (player_id TEXT) ON COMMIT DROP;')
+        stream = io.StringIO('\n'.join(map(str, steamids.tolist())))
+        cursor.copy_expert('COPY crawled (player_id) FROM STDIN', stream)
+        cursor.execute('ANALYZE crawled;')
+
+
+def read_edges(connection: extensions.connection, crawled: Optional[np.ndarray] = None) -> pa.Table:
+    """
+    Reads the friend lists of steam.friends as directed edges.
+
+    Args:
+        **connection (extensions.connection)** - The database connection.
+        **crawled (Optional[np.ndarray])** - The steamids to leave out, i.e. those already in the graph.
+
+    Returns:
+        **pa.Table** - The columns source and target; target is null for players without visible friends.
+    """
+    condition = ''
+    if crawled is not None and len(crawled):
+        _upload_crawled(connection, crawled)
+        condition = 'WHERE NOT EXISTS (SELECT 1 FROM crawled c WHERE c.player_id = f.player_id)'
+
+    # The ids are unpacked by the database, so no Python list is created per player
+    query = f"""
+        SELECT f.player_id::BIGINT AS source, t.friend::BIGINT AS target
+        FROM steam.friends f
+        LEFT JOIN LATERAL UNNEST(f.friends) AS t (friend) ON TRUE
+        {condition}
+    """
+    column_types = {'source': pa.int64(), 'target': pa.int64()}
+    schema = pa.schema(list(column_types.items()))
+    return pa.Table.from_batches(list(_copy_batches(connection, query, column_types)), schema=schema)
+
+
+def _encode(ids: np.ndarray, steamids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Existing players keep their node; new ones are appended after them
+    nodes = _lookup(ids, np.argsort(ids), steamids)
+    missing = nodes < 0
+    unknown = np.unique(steamids[missing])
+    nodes[missing] = len(ids) + np.searchsorted(unknown, steamids[missing])
+    return np.concatenate([ids, unknown]), nodes.astype(np.int32)
+
+
+def _adjacency(nodes: int, sources: np.ndarray, targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Both directions of every friendship, sorted and deduplicated as one int64 key per edge
+    keys = np.concatenate([sources.astype(np.int64) * nodes + targets,
+                           targets.astype(np.int64) * nodes + sources])
+    keys = np.unique(keys[np.tile(sources != targets, 2)])
+    rows = keys // nodes
+    indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=nodes))]
+    return indptr, (keys % nodes).astype(np.int32)
+
+
+def _load_arrays(names: Iterable[str]) -> Dict[str, np.ndarray]:
+    return {name: np.load(_path(name), mmap_mode='r') for name in names}
+
+
+def _save_arrays(arrays: Dict[str, np.ndarray]):
+    # Every array is written next to its file before any of them is replaced
+    os.makedirs(FRIENDS_DIRECTORY, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(_path(name + '.tmp'), array)
+    for name in arrays:
+        os.replace(_path(name + '.tmp'), _path(name))
+
+
+def update_graph(full: bool = False) -> int:
+    """
+    Adds the friend lists exported since the previous run to the graph files.
+    A player's friend list is written once by the crawler, so the players
+    already in the graph serve as the watermark
+
+    Args:
+        **full (bool)** - Whether to build the whole graph again.
+
+    Returns:
+        **int** - The number of friend lists added.
+    """
+    names = ['ids', 'crawled', 'sources', 'targets']
+    if not full and all(os.path.exists(_path(name)) for name in names):
+        existing = {name: np.asarray(array) for name, array in _load_arrays(names).items()}
+    else:
+        existing = {'ids': np.empty(0, dtype=np.int64), 'crawled': np.empty(0, dtype=np.int32),
+                    'sources': np.empty(0, dtype=np.int32), 'targets': np.empty(0, dtype=np.int32)}
+
+    with connect_to_database() as connection:
+        edges = read_edges(connection, existing['ids'][existing['crawled']])
+        connection.rollback()
+
+    sources = edges.column('source').to_numpy()
+    targets = edges.column('target').fill_null(-1).to_numpy()
+    ids, codes = _encode(existing['ids'], np.concatenate([sources, targets[targets >= 0]]))
+    new_sources, new_targets = codes[:len(sources)], codes[len(sources):]
+    crawled = np.unique(new_sources)
+    new_sources = new_sources[targets >= 0]
+
+    sources = np.concatenate([existing['sources'], new_sources])
+    targets = np.concatenate([existing['targets'], new_targets])
+    indptr, indices = _adjacency(len(ids), sources, targets)
+    _save_arrays({
+        'ids': ids, 'crawled': np.concatenate([existing['crawled'], crawled]),
+        'sources': sources, 'targets': targets, 'indptr': indptr, 'indices': indices
+    })
+
+    return len(crawled)
+
+
+def load_graph() -> FriendGraph:
+    """
+    Opens the friend graph files without reading them into memory.
+
+    Returns:
+        **FriendGraph** - The graph over memory-mapped arrays.
+    """
+    if not os.path.exists(_path('indices')):
+        raise FileNotFoundError('No friend graph. Run "python -m analysis.friends" first')
+
+    arrays = _load_arrays(['ids', 'indptr', 'indices'])
+    return FriendGraph(arrays['ids'], arrays['indptr'], arrays['indices'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m analysis.friends',
+                                     description='Updates the friend graph of Steam players')
+    parser.add_argument('--full', action='store_true', help='Build the whole graph again')
+    args = parser.parse_args()
+
+    added = update_graph(args.full)
+    graph = load_graph()
+    print(f'{added:,} friend lists added, {graph}')
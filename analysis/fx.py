@@ -0,0 +1,102 @@
+from typing import Optional, Dict, List
+import pandas as pd
+import numpy as np
+import os
+
+# Euro foreign exchange reference rates of the ECB, in the format of
+# https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist.zip (rates per 1 EUR)
+ECB_FILE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'eurofxref-hist.zip')
+# Currencies of the price columns
+CURRENCIES: List[str] = ['USD', 'EUR', 'GBP', 'JPY', 'RUB']
+# The ECB stopped publishing these rates; later dates use the last published rate
+CUTOFFS: Dict[str, str] = {'RUB': '2022-03-01'}
+# How many days back a missing rate (weekends, holidays) may be taken from
+MAX_RATE_AGE: int = 30
+
+
+def _ecb_file() -> str:
+    if os.path.exists(ECB_FILE):
+        return ECB_FILE
+    # The currency_converter package ships a copy of the same file
+    import currency_converter
+    return os.path.join(os.path.dirname(currency_converter.__file__), 'eurofxref-hist.zip')
+
+
+def load_rates(path: Optional[str] = None) -> pd.DataFrame:
+    """
+    Builds a dense daily table of USD rates from the ECB reference rates.
+
+    Args:
+        **path (Optional[str])** - The ECB CSV (or its zip archive); by default resources/eurofxref-hist.zip,
+                               or the copy shipped with currency_converter.
+
+    Returns:
+        **pd.DataFrame** - USD per one unit of every currency in CURRENCIES, one row per calendar day.
+                       Missing days take the last rate of up to MAX_RATE_AGE days before them.
+    """
+    ecb = pd.read_csv(path or _ecb_file(), index_col='Date', parse_dates=['Date'], na_values=['N/A'])
+    ecb = ecb.loc[:, ~ecb.columns.str.startswith('Unnamed')].sort_index()
+    ecb['EUR'] = 1.
+
+    days = pd.date_range(ecb.index.min(), ecb.index.max() + pd.Timedelta(days=MAX_RATE_AGE), freq='D')
+    ecb = ecb[CURRENCIES].reindex(days).ffill(limit=MAX_RATE_AGE)
+
+    # Rates are quoted per euro, so a unit of a currency is worth USD / currency dollars
+    return ecb.rdiv(ecb['USD'], axis=0)
+
+
+def to_usd(amounts: pd.Series, currencies: pd.Series, dates: pd.Series,
+           rates: Optional[pd.DataFrame] = None) -> pd.Series:
+    """
+    Converts amounts in local currencies to USD at the rates of the given dates.
+
+    Args:
+        **amounts (pd.Series)** - The amounts in local currency.
+        **currencies (pd.Series)** - The currency codes of the amounts, e.g. 'EUR'.
+        **dates (pd.Series)** - The dates of the rates to use.
+        **rates (Optional[pd.DataFrame])** - The table built by load_rates; loaded if not given.
+
+    Returns:
+        **pd.Series** - The amounts in USD; NaN where no rate is known.
+    """
+    if rates is None:
+        rates = load_rates()
+
+    currencies = currencies.astype(str).str.upper()
+    dates = pd.to_datetime(dates).dt.normalize()
+    for currency, cutoff in CUTOFFS.items():
+        cutoff = pd.Timestamp(cutoff)
+        dates = dates.mask((currencies == currency) & (dates > cutoff), cutoff)
+
+    # Rows of the dense table are days since its start, columns are currencies
+    rows = ((dates - rates.index[0]).dt.days).to_numpy(dtype=np.float64, na_value=np.nan)
+    columns = pd.Categorical(currencies, categories=rates.columns).codes
+    valid = (rows >= 0) & (rows < len(rates)) & (columns >= 0)
+
+    factors = np.full(len(amounts), np.nan)
+    factors[valid] = rates.to_numpy()[rows[valid].astype(np.int64), columns[valid]]
+    # USD amounts need no rate, whatever their date
+    factors[(currencies == 'USD').to_numpy()] = 1.
+    return pd.Series(amounts.to_numpy(dtype=np.float64, na_value=np.nan) * factors,
+                     index=amounts.index, name='price_usd')
+
+
+def local_price(prices: pd.DataFrame, currencies: pd.Series) -> pd.Series:
+    """
+    Picks the price column matching the currency of every row.
+
+    Args:
+        **prices (pd.DataFrame)** - A frame with the columns 'usd', 'eur', 'gbp', 'jpy' and 'rub'.
+        **currencies (pd.Series)** - The currency codes, e.g. 'EUR'.
+
+    Returns:
+        **pd.Series** - The price in the currency of each row; NaN for unknown currencies.
+    """
+    columns = [currency.lower() for currency in CURRENCIES]
+    codes = pd.Categorical(currencies.astype(str).str.lower(), categories=columns).codes
+    values = prices[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    selected = np.full(len(prices), np.nan)
+    known = codes >= 0
+    selected[known] = values[np.flatnonzero(known), codes[known]]
+    return pd.Series(selected, index=prices.index, name='price_local')
@@ -1,26 +1,118 @@
-from typing import List
-import pandas as pd
-from analysis.helper import PLATFORMS, postgres_data, define_game
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from psycopg2 import extensions
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import pyarrow as pa
+import argparse
+import io
+import os
+from utils.database.connector import connect_to_database
+from analysis.helper import PLATFORMS, _copy_batches
 
+# First and last achievement per (player, game), one file per platform
+ACTIVITY_FILE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'resources', 'activity_{platform}.parquet')
 
-def get_activity(platform: str, dataframes: List[pd.DataFrame], year: int):
-    activities = postgres_data(platform, 'history', year)
-    activities['gameid'] = activities.achievementid.apply(define_game)
 
-    agg_df = activities.groupby(['playerid', 'gameid'], as_index=False).agg({'date_acquired': ['min', 'max']})
-    agg_df.columns = ['playerid', 'gameid', 'date_min', 'date_max']
+def _history_columns(platform: str) -> Tuple[str, str, pa.DataType]:
+    # Steam tables name the columns differently
+    if platform == 'steam':
+        return 'player_id', 'achievement_id', pa.string()
+    return 'playerid', 'achievementid', pa.int32()
 
-    dataframes.append(agg_df)
 
+def _upload_folded(connection: extensions.connection, platform: str, folded: pa.Array):
+    # Players already in the activity file are copied into a temporary table,
+    # so the database aggregates only the history of the other players
+    player, _, _ = _history_columns(platform)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE folded ON COMMIT DROP AS
+            SELECT {player} AS playerid FROM {platform}.history LIMIT 0;
+        """)
+        stream = io.StringIO('\n'.join(map(str, folded.to_pylist())))
+        cursor.copy_expert('COPY folded (playerid) FROM STDIN', stream)
+        cursor.execute('ANALYZE folded;')
 
-if __name__ == '__main__':
-    for platform in PLATFORMS:
-        all_activity = []
-        for year in range(2008, 2025):
-            get_activity(platform=platform, dataframes=all_activity, year=year)
 
-    activities_df = pd.DataFrame()
-    for activity_df in all_activity:
-        activities_df = pd.concat([activities_df, activity_df])
+def aggregate(connection: extensions.connection, platform: str,
+              folded: Optional[pa.Array] = None) -> pa.Table:
+    """
+    Computes the first and last achievement of every (player, game) in the database.
+
+    Args:
+        **connection (extensions.connection)** - The database connection.
+        **platform (str)** - The platform schema.
+        **folded (Optional[pa.Array])** - Players to leave out, i.e. those already aggregated.
+
+    Returns:
+        **pa.Table** - The columns playerid, gameid, first_activity and last_activity.
+    """
+    player, achievement, player_type = _history_columns(platform)
+    condition = ''
+    if folded is not None and len(folded):
+        _upload_folded(connection, platform, folded)
+        condition = f'WHERE NOT EXISTS (SELECT 1 FROM folded f WHERE f.playerid = h.{player})'
+
+    # The game is the part of the achievement id before the first underscore
+    query = f"""
+        SELECT h.{player} AS playerid, SPLIT_PART(h.{achievement}, '_', 1)::BIGINT AS gameid,
+               MIN(h.date_acquired) AS first_activity, MAX(h.date_acquired) AS last_activity
+        FROM {platform}.history h
+        {condition}
+        GROUP BY 1, 2
+    """
+    column_types = {
+        'playerid': player_type,
+        'gameid': pa.int64(),
+        'first_activity': pa.timestamp('us'),
+        'last_activity': pa.timestamp('us')
+    }
+    schema = pa.schema(list(column_types.items()))
+    return pa.Table.from_batches(list(_copy_batches(connection, query, column_types)), schema=schema)
+
+
+def update_activity(platform: str, full: bool = False) -> int:
+    """
+    Folds the history of players added since the previous run into the activity file.
+    A player's history is written once by the crawlers, so the players already
+    in the file serve as the watermark.
+
+    Args:
+        **platform (str)** - The platform schema.
+        **full (bool)** - Whether to aggregate the whole history again.
 
-    activities_df.to_csv(f'analysis/resources/activity_{platform}.csv', index=False)
+    Returns:
+        **int** - The number of (player, game) rows added.
+    """
+    path = ACTIVITY_FILE.format(platform=platform)
+    existing = None
+    if not full and os.path.exists(path):
+        existing = pq.read_table(path)
+
+    with connect_to_database() as connection:
+        folded = pc.unique(existing['playerid']) if existing is not None else None
+        added = aggregate(connection, platform, folded)
+        connection.rollback()
+
+    # New players do not overlap with the folded ones, so the rows are appended as they are
+    table = pa.concat_tables([existing, added]) if existing is not None else added
+    pq.write_table(table, path + '.tmp', compression='zstd')
+    os.replace(path + '.tmp', path)
+
+    return added.num_rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m analysis.get_activities',
+                                     description='Updates the first and last activity per player and game')
+    parser.add_argument('--full', action='store_true', help='Aggregate the whole history again')
+    args = parser.parse_args()
+
+    # Platforms are aggregated by the database concurrently
+    with ThreadPoolExecutor(max_workers=len(PLATFORMS)) as executor:
+        added = dict(zip(PLATFORMS, executor.map(lambda platform: update_activity(platform, args.full),
+                                                 PLATFORMS)))
+    for platform in PLATFORMS:
+        print(f'{platform:<12}{added[platform]:>12,} rows added')
@@ -1,9 +1,31 @@
-from typing import Optional, Dict, List, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Generator, Callable, Union, Tuple, Mapping, FrozenSet, Dict, List, Set, Any
+from types import MappingProxyType
+from psycopg2 import extensions
+from pyarrow import csv
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import pyarrow.compute as pc
+import pyarrow as pa
 import pandas as pd
+import numpy as np
+import threading
+import hashlib
+import json
+import time
+import os
 from utils.database.connector import connect_to_database
+from utils.constants import PRICE_STORAGE
 
 PLATFORMS: List[str] = ['steam', 'playstation', 'xbox']
 COLORS: List[str] = ['#e2b35c', '#87ceeb', '#73c991']
+# Parquet snapshots of the database written by 'python -m analysis.snapshot'
+SNAPSHOT_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'snapshot')
+# Results of postgres_data kept on disk, and the size the cache is trimmed to (bytes)
+DATA_CACHE_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'cache')
+DATA_CACHE_SIZE: int = 8 << 30
+# Part of every cache key; increased whenever the types of the loaded columns change
+DATA_CACHE_FORMAT: int = 2
 
 GENRES: Set[str] = {
     'Action', 'Indie', 'Adventure', 'Casual',
@@ -12,6 +34,102 @@ GENRES: Set[str] = {
     'Point & Click', 'Fighting', 'Survival', 'RPG', 'Horror'
 }
 
+# Mappings used by the functions below, built once at import
+GENRE_MAPPING: Mapping[str, str] = MappingProxyType({
+    'Бойовики': 'Action', 'Экшены': 'Action', 'Ação': 'Action', '动作': 'Action',
+    'First Person Shooter': 'Action', 'Run & Gun': 'Action', 'Shooter': 'Action',
+    'Third Person Shooter': 'Action', 'FPS': 'Action', "Shoot 'em up": 'Action',
+    'Hack & Slash': 'Action', 'Vehicular Combat': 'Action', 'Naval': 'Action',
+    "Beat 'em up": 'Action',
+
+    'Інді': 'Indie', 'Инди': 'Indie', '独立': 'Indie',
+
+    'Стратегії': 'Strategy', 'Стратегии': 'Strategy', 'Estratégia': 'Strategy', '策略': 'Strategy',
+
+    'Occasionnel': 'Casual', 'Казуальные игры': 'Casual', 'カジュアル': 'Casual', '休闲': 'Casual',
+    'Card & Board': 'Casual', 'Casino': 'Casual', 'Collectable Card Game': 'Casual',
+    'Pinball': 'Casual', 'Board Games': 'Casual', 'Collection': 'Casual',
+
+    '冒險': 'Adventure', 'Приключенческие игры': 'Adventure', '冒险': 'Adventure',
+    'Action-Adventure': 'Adventure', 'ARCADE': 'Adventure',
+
+    '模擬': 'Simulation', 'Simulação': 'Simulation', 'シミュレーション': 'Simulation',
+
+    'Nudity': 'Sexual Content',
+
+    'Corrida': 'Racing', 'Automobile': 'Racing', 'Arcade Racing': 'Racing', 'Simulation Racing': 'Racing',
+    'Motocross': 'Racing',
+    
+    'Equestrian Sports': 'Sports', 'Australian Football': 'Sports', 'Esportes': 'Sports',
+    '体育': 'Sports', 'Volleyball': 'Sports', 'Basketball': 'Sports', 'Boxing': 'Sports', 'Golf': 'Sports',
+    'Football': 'Sports', 'Cue Sports': 'Sports', 'Bowling': 'Sports', 'Skateboarding': 'Sports',
+    'Health & Fitness': 'Sports', 'Skating': 'Sports', 'Snowboarding': 'Sports', 'Tennis': 'Sports',
+    'Fishing': 'Sports', 'Baseball': 'Sports', 'Wrestling': 'Sports', 'American Football': 'Sports',
+    'Dance': 'Sports', 'Table Tennis': 'Sports', 'Cricket': 'Sports', 'Hunting': 'Sports', 'Darts': 'Sports',
+    'Rugby': 'Sports', 'Handball': 'Sports', 'Dodgeball': 'Sports', 'Classics': 'Sports', 'Hockey': 'Sports',
+    'Bullfighting': 'Sports', 'Surfing': 'Sports', 'Lacrosse': 'Sports', 'Flying': 'Sports',
+    'Skydiving': 'Sports', 'Kinect': 'Sports', 'Cycling': 'Sports', 'Bull Sports': 'Sports',
+
+    '角色扮演': 'RPG', 'Ролевые игры': 'RPG', 'Role Playing': 'RPG', 'Action-RPG': 'RPG',
+    'Role-Playing Games (RPG)': 'RPG',
+
+    'Survival Horror': 'Horror', 'Action Horror': 'Horror',
+
+    'Educational & Trivia': 'Education', 'Educational': 'Education',
+
+    'Metroidvania': 'Platformer'
+})
+
+EUR_COUNTRIES: FrozenSet[str] = frozenset({
+    'Austria', 'Belgium', 'Croatia', 'Cyprus', 'Estonia',
+    'Finland', 'France', 'Germany', 'Greece', 'Poland',
+    'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg',
+    'Malta', 'Netherlands', 'Portugal', 'Sweden', 'Slovakia', 
+    'Slovenia', 'Spain'
+})
+
+GBP_COUNTRIES: FrozenSet[str] = frozenset({
+    'United Kingdom', 'Scotland', 'Wales',
+    'Northern Ireland', 'England'
+})
+
+RUB_COUNTRIES: FrozenSet[str] = frozenset({
+    'Russian Federation', 'Kazakhstan', 'Uzbekistan',
+    'Ukraine', 'Kyrgyzstan', 'Armenia', 'Belarus',
+    'Moldova', 'Tajikistan', 'Turkmenistan', 'Azerbaijan'
+})
+
+JPY_COUNTRIES: FrozenSet[str] = frozenset({
+    'Japan'
+})
+
+EU_COUNTRIES: FrozenSet[str] = frozenset({
+    'Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czech Republic',
+    'Denmark', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hungary',
+    'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
+    'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia',
+    'Spain', 'Sweden', 'Georgia', 'Iceland', 'Monaco', 'Norway', 'Serbia',
+    'Switzerland', 'United Kingdom', 'England', 'Northern Ireland', 'Wales',
+    'Scotland'
+})
+
+US_CANADA_COUNTRIES: FrozenSet[str] = frozenset({
+    'United States', 'Canada'
+})
+
+ASIAN_COUNTRIES: FrozenSet[str] = frozenset({
+    'Afghanistan', 'Armenia', 'Azerbaijan', 'Bahrain', 'Bangladesh', 'Bhutan', 
+    'Brunei', 'Cambodia', 'China', 'India', 'Indonesia', 
+    'Iran', 'Iraq', 'Israel', 'Japan', 'Jordan', 'Kazakhstan', 'Korea', 
+    'Kuwait', 'Kyrgyzstan', 'Laos', 'Lebanon', 'Malaysia', 
+    'Maldives', 'Mongolia', 'Myanmar', 'Nepal', 'Oman', 'Pakistan', 'Palestine', 
+    'Philippines', 'Qatar', 'Russia', 'Saudi Arabia', 'Singapore', 'Sri Lanka', 
+    'Syria', 'Tajikistan', 'Thailand', 'Timor-Leste', 'Türkiye', 'Turkmenistan', 
+    'United Arab Emirates', 'Uzbekistan', 'Vietnam', 'Yemen', 'Russian Federation',
+    'Ukraine', 'Belarus', 'Moldova'
+})
+
+
 def format_genre(genre_name: Optional[str]) -> Optional[str]:
     """
     Formats the given genre name into a standardized genre category.
@@ -31,53 +149,8 @@ def format_genre(genre_name: Optional[str]) -> Optional[str]:
         genre_name = genre_name.capitalize()
     except AttributeError:
         return None
-
-    formatted_genre: Dict[str, str] = {
-        'Бойовики': 'Action', 'Экшены': 'Action', 'Ação': 'Action', '动作': 'Action',
-        'First Person Shooter': 'Action', 'Run & Gun': 'Action', 'Shooter': 'Action',
-        'Third Person Shooter': 'Action', 'FPS': 'Action', "Shoot 'em up": 'Action',
-        'Hack & Slash': 'Action', 'Vehicular Combat': 'Action', 'Naval': 'Action',
-        "Beat 'em up": 'Action',
-
-        'Інді': 'Indie', 'Инди': 'Indie', '独立': 'Indie',
-
-        'Стратегії': 'Strategy', 'Стратегии': 'Strategy', 'Estratégia': 'Strategy', '策略': 'Strategy',
-
-        'Occasionnel': 'Casual', 'Казуальные игры': 'Casual', 'カジュアル': 'Casual', '休闲': 'Casual',
-        'Card & Board': 'Casual', 'Casino': 'Casual', 'Collectable Card Game': 'Casual',
-        'Pinball': 'Casual', 'Board Games': 'Casual', 'Collection': 'Casual',
-
-        '冒險': 'Adventure', 'Приключенческие игры': 'Adventure', '冒险': 'Adventure',
-        'Action-Adventure': 'Adventure', 'ARCADE': 'Adventure',
-
-        '模擬': 'Simulation', 'Simulação': 'Simulation', 'シミュレーション': 'Simulation',
-
-        'Nudity': 'Sexual Content',
-
-        'Corrida': 'Racing', 'Automobile': 'Racing', 'Arcade Racing': 'Racing', 'Simulation Racing': 'Racing',
-        'Motocross': 'Racing',
-        
-        'Equestrian Sports': 'Sports', 'Australian Football': 'Sports', 'Esportes': 'Sports',
-        '体育': 'Sports', 'Volleyball': 'Sports', 'Basketball': 'Sports', 'Boxing': 'Sports', 'Golf': 'Sports',
-        'Football': 'Sports', 'Cue Sports': 'Sports', 'Bowling': 'Sports', 'Skateboarding': 'Sports',
-        'Health & Fitness': 'Sports', 'Skating': 'Sports', 'Snowboarding': 'Sports', 'Tennis': 'Sports',
-        'Fishing': 'Sports', 'Baseball': 'Sports', 'Wrestling': 'Sports', 'American Football': 'Sports',
-        'Dance': 'Sports', 'Table Tennis': 'Sports', 'Cricket': 'Sports', 'Hunting': 'Sports', 'Darts': 'Sports',
-        'Rugby': 'Sports', 'Handball': 'Sports', 'Dodgeball': 'Sports', 'Classics': 'Sports', 'Hockey': 'Sports',
-        'Bullfighting': 'Sports', 'Surfing': 'Sports', 'Lacrosse': 'Sports', 'Flying': 'Sports',
-        'Skydiving': 'Sports', 'Kinect': 'Sports', 'Cycling': 'Sports', 'Bull Sports': 'Sports',
-
-        '角色扮演': 'RPG', 'Ролевые игры': 'RPG', 'Role Playing': 'RPG', 'Action-RPG': 'RPG',
-        'Role-Playing Games (RPG)': 'RPG',
-
-        'Survival Horror': 'Horror', 'Action Horror': 'Horror',
-
-        'Educational & Trivia': 'Education', 'Educational': 'Education',
-
-        'Metroidvania': 'Platformer'
-    }
     
-    return formatted_genre.get(genre_name, genre_name)
+    return GENRE_MAPPING.get(genre_name, genre_name)
 
 
 def define_currency(country: str) -> str:
@@ -91,33 +164,13 @@ def define_currency(country: str) -> str:
         **str** - The currency code corresponding to the provided country. 
              Possible values are 'EUR', 'GBP', 'RUB', 'JPY', or 'USD' by default.
     """
-    eur = {
-        'Austria', 'Belgium', 'Croatia', 'Cyprus', 'Estonia',
-        'Finland', 'France', 'Germany', 'Greece', 'Poland',
-        'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg',
-        'Malta', 'Netherlands', 'Portugal', 'Sweden', 'Slovakia', 
-        'Slovenia', 'Spain'
-    }
-    gbp = {
-        'United Kingdom', 'Scotland', 'Wales',
-        'Northern Ireland', 'England'
-    }
-    rub = {
-        'Russian Federation', 'Kazakhstan', 'Uzbekistan',
-        'Ukraine', 'Kyrgyzstan', 'Armenia', 'Belarus',
-        'Moldova', 'Tajikistan', 'Turkmenistan', 'Azerbaijan'
-    }
-    jpy = {
-        'Japan'
-    }
-    
-    if country in eur:
+    if country in EUR_COUNTRIES:
         return 'EUR'
-    elif country in gbp:
+    elif country in GBP_COUNTRIES:
         return 'GBP'
-    elif country in rub:
+    elif country in RUB_COUNTRIES:
         return 'RUB'
-    elif country in jpy:
+    elif country in JPY_COUNTRIES:
         return 'JPY'
     
     return 'USD'
@@ -133,37 +186,11 @@ def assign_region(country: str) -> str:
     Returns:
         **str** - The region the country belongs to. Possible values are 'Europe', 'US & Canada', 'Asia', or 'Rest of the world'.
     """
-    eu_countries = {
-        'Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czech Republic',
-        'Denmark', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hungary',
-        'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
-        'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia',
-        'Spain', 'Sweden', 'Georgia', 'Iceland', 'Monaco', 'Norway', 'Serbia',
-        'Switzerland', 'United Kingdom', 'England', 'Northern Ireland', 'Wales',
-        'Scotland'
-    }
-
-    us_canada_countries = {
-        'United States', 'Canada'
-    }
-
-    asian_countries = {
-        'Afghanistan', 'Armenia', 'Azerbaijan', 'Bahrain', 'Bangladesh', 'Bhutan', 
-        'Brunei', 'Cambodia', 'China', 'India', 'Indonesia', 
-        'Iran', 'Iraq', 'Israel', 'Japan', 'Jordan', 'Kazakhstan', 'Korea', 
-        'Kuwait', 'Kyrgyzstan', 'Laos', 'Lebanon', 'Malaysia', 
-        'Maldives', 'Mongolia', 'Myanmar', 'Nepal', 'Oman', 'Pakistan', 'Palestine', 
-        'Philippines', 'Qatar', 'Russia', 'Saudi Arabia', 'Singapore', 'Sri Lanka', 
-        'Syria', 'Tajikistan', 'Thailand', 'Timor-Leste', 'Türkiye', 'Turkmenistan', 
-        'United Arab Emirates', 'Uzbekistan', 'Vietnam', 'Yemen', 'Russian Federation',
-        'Ukraine', 'Belarus', 'Moldova'
-    }
-
-    if country in eu_countries:
+    if country in EU_COUNTRIES:
         return 'Europe'
-    elif country in us_canada_countries:
+    elif country in US_CANADA_COUNTRIES:
         return 'US & Canada'
-    elif country in asian_countries:
+    elif country in ASIAN_COUNTRIES:
         return 'Asia'
     else:
         return 'Rest of the world'
@@ -188,39 +215,446 @@ def define_game(achievementid: str) -> int:
     return int(achievementid.split('_')[0])
 
 
-def postgres_data(schema_name: str, table_name: str, year: int = 2024) -> pd.DataFrame:
+# Series of strings or Arrow arrays accepted by the vectorized functions below
+Values = Union[pd.Series, pa.Array, pa.ChunkedArray]
+
+
+def _map_distinct(values: Values, function: Callable[[Any], Any]) -> Values:
+    # The function is called once per distinct value (the categories or the Arrow
+    # dictionary) and the results are spread to the rows by their codes
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        encoded = values if pa.types.is_dictionary(values.type) else values.dictionary_encode()
+
+        results = pa.array([function(value) for value in encoded.dictionary.to_pylist()])
+        mapped = results.take(encoded.indices)
+        missing = function(None)
+        if missing is not None:
+            mapped = mapped.fill_null(missing)
+        return mapped.dictionary_encode() if pa.types.is_string(mapped.type) else mapped
+
+    categorical = values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+    # The last result belongs to the missing values, whose code is -1
+    results = pd.Categorical([function(value) for value in categorical.cat.categories] + [function(None)])
+    codes = results.codes[categorical.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=results.categories),
+                     index=values.index, name=values.name)
+
+
+def format_genres(genres: Values) -> Values:
+    """
+    Vectorized format_genre.
+
+    Args:
+        **genres (Union[pd.Series, pa.Array, pa.ChunkedArray])** - The genre names to be formatted.
+
+    Returns:
+        **Union[pd.Series, pa.Array]** - The formatted genre names as a categorical Series or a dictionary array.
+    """
+    return _map_distinct(genres, format_genre)
+
+
+def define_currencies(countries: Values) -> Values:
+    """
+    Vectorized define_currency.
+
+    Args:
+        **countries (Union[pd.Series, pa.Array, pa.ChunkedArray])** - The names of the countries.
+
+    Returns:
+        **Union[pd.Series, pa.Array]** - The currency codes as a categorical Series or a dictionary array.
+    """
+    return _map_distinct(countries, define_currency)
+
+
+def assign_regions(countries: Values) -> Values:
+    """
+    Vectorized assign_region.
+
+    Args:
+        **countries (Union[pd.Series, pa.Array, pa.ChunkedArray])** - The names of the countries.
+
+    Returns:
+        **Union[pd.Series, pa.Array]** - The regions as a categorical Series or a dictionary array.
+    """
+    return _map_distinct(countries, assign_region)
+
+
+def define_games(achievementids: Values) -> Values:
+    """
+    Vectorized define_game.
+
+    Every distinct achievement is parsed once: categories and Arrow dictionaries are
+    already distinct, other strings are factorized first (an achievement repeats in
+    the history once per player who obtained it).
+
+    Args:
+        **achievementids (Union[pd.Series, pa.Array, pa.ChunkedArray])** - The achievementIDs.
+
+    Returns:
+        **Union[pd.Series, pa.Array]** - The UniqueGameIDs as 64-bit integers (nullable 'Int64' if ids are missing).
+    """
+    if isinstance(achievementids, (pa.Array, pa.ChunkedArray)):
+        if pa.types.is_dictionary(achievementids.type):
+            return _map_distinct(achievementids, lambda value: define_game(value) if value else None)
+        prefixes = pc.list_element(pc.split_pattern(achievementids, '_', max_splits=1), 0)
+        return pc.cast(prefixes, pa.int64())
+
+    if isinstance(achievementids.dtype, pd.CategoricalDtype):
+        codes, distinct = achievementids.cat.codes.to_numpy(), achievementids.cat.categories
+    else:
+        codes, distinct = pd.factorize(achievementids)
+    
+    games = np.array([define_game(value) for value in distinct], dtype=np.int64)[codes]
+    missing = codes < 0
+    if missing.any():
+        # The code of a missing id is -1, which would take the last game
+        games = pd.arrays.IntegerArray(games, missing)
+    return pd.Series(games, index=achievementids.index, name=achievementids.name)
+
+
+# Columns renamed to the names shared by all platforms
+RENAMED_COLUMNS: Dict[str, str] = {
+    'game_id': 'gameid',
+    'achievement_id': 'achievementid',
+    'player_id': 'playerid'
+}
+# Low-cardinality or heavily repeated text columns, loaded as categoricals.
+# Only columns stored as text are encoded; integer ids (e.g. PlayStation 'playerid') stay integers
+CATEGORICAL_COLUMNS: Set[str] = {'playerid', 'achievementid', 'country'}
+TEXT_TYPES: Set[str] = {'text', 'character varying', 'character'}
+# Arrow types of the PostgreSQL column types; other types are read as text
+ARROW_TYPES: Dict[str, pa.DataType] = {
+    'smallint': pa.int16(), 'integer': pa.int32(), 'bigint': pa.int64(),
+    'numeric': pa.float64(), 'real': pa.float32(), 'double precision': pa.float64(),
+    'boolean': pa.bool_(), 'date': pa.date32(),
+    'timestamp without time zone': pa.timestamp('us'),
+    'timestamp with time zone': pa.timestamp('us', tz='UTC')
+}
+
+
+def _table_columns(connection: extensions.connection, schema_name: str,
+                   table_name: str) -> List[Tuple[str, str]]:
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s
+            ORDER BY ordinal_position;
+        """, (schema_name, table_name))
+        return cursor.fetchall()
+
+
+def _copy_batches(connection: extensions.connection, query: str,
+                  column_types: Dict[str, pa.DataType]) -> Generator[pa.RecordBatch, None, None]:
+    # COPY writes into a pipe from a separate thread while Arrow parses
+    # the other end, so the raw CSV is never held in memory as a whole
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def copy():
+        try:
+            with os.fdopen(write_fd, 'wb') as stream, connection.cursor() as cursor:
+                cursor.copy_expert(f'COPY ({query}) TO STDOUT (FORMAT csv, HEADER)', stream)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=copy, daemon=True)
+    thread.start()
+    stream = os.fdopen(read_fd, 'rb')
+
+    def stop():
+        # A COPY still writing would block on the full pipe: the query is cancelled
+        # and the read end closed, so the thread ends and can be joined
+        if thread.is_alive():
+            connection.cancel()
+        stream.close()
+        thread.join()
+
+    try:
+        reader = csv.open_csv(stream,
+                              read_options=csv.ReadOptions(block_size=1 << 24),
+                              convert_options=csv.ConvertOptions(column_types=column_types,
+                                                                 strings_can_be_null=True))
+        yield from reader
+        # The whole output was read, the COPY is over
+        thread.join()
+    except pa.ArrowInvalid:
+        stop()
+        # A failed COPY leaves the pipe empty; its own error is more telling
+        failures = [e for e in errors
+                    if not isinstance(e, (extensions.QueryCanceledError, BrokenPipeError))]
+        if failures:
+            raise failures[0] from None
+        raise
+    finally:
+        # Also reached when the consumer stops reading early
+        stop()
+    if errors:
+        raise errors[0]
+
+
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    # Integers are narrowed to the smallest type holding their values. Floats are kept
+    # at double precision, since float32 loses the cents of large prices (e.g. 1999.99 RUB)
+    for column in df.select_dtypes(include='integer').columns:
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def _read_table(connection: extensions.connection, schema_name: str, table_name: str,
+                year: Optional[int], columns: Optional[List[str]], where: Optional[str],
+                params: Optional[Tuple[Any, ...]]) -> pa.Table:
+    table_columns = _table_columns(connection, schema_name, table_name)
+    if columns is not None:
+        table_columns = [(name, data_type) for name, data_type in table_columns
+                         if RENAMED_COLUMNS.get(name, name) in columns]
+
+    selected, column_types = [], {}
+    for name, data_type in table_columns:
+        if data_type == 'ARRAY':
+            # Arrays are read as JSON text and converted to lists below
+            selected.append(f'ARRAY_TO_JSON({name}) AS {name}')
+            column_types[name] = pa.string()
+            continue
+        
+        selected.append(name)
+        if RENAMED_COLUMNS.get(name, name) in CATEGORICAL_COLUMNS and data_type in TEXT_TYPES:
+            column_types[name] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[name] = ARROW_TYPES.get(data_type, pa.string())
+
+    conditions = []
+    if table_name == 'history' and year is not None:
+        # A range over the raw column can use an index, unlike DATE_PART
+        conditions.append(f"date_acquired >= '{year}-01-01' AND date_acquired < '{year + 1}-01-01'")
+    if where is not None:
+        with connection.cursor() as cursor:
+            conditions.append(cursor.mogrify(where, params).decode())
+
+    query = f"SELECT {', '.join(selected)} FROM {schema_name}.{table_name}"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(f'({condition})' for condition in conditions)
+
+    batches = list(_copy_batches(connection, query, column_types))
+
+    schema = pa.schema([(name, column_types[name]) for name, _ in table_columns])
+    # Batches carry their own dictionaries, which are merged into one per column
+    table = pa.Table.from_batches(batches, schema=schema).unify_dictionaries()
+    for name, data_type in table_columns:
+        if data_type == 'ARRAY':
+            index = table.schema.get_field_index(name)
+            values = [json.loads(value) if value is not None else None
+                      for value in table.column(index).to_pylist()]
+            table = table.set_column(index, name, pa.array(values))
+    
+    return table.rename_columns([RENAMED_COLUMNS.get(name, name) for name in table.column_names])
+
+
+def _table_version(connection: extensions.connection, schema_name: str, table_name: str) -> List[int]:
+    # Cumulative modification counters of the table; any insert, update or delete
+    # changes them. The prices view is versioned by the table it is built on
+    if table_name == 'prices_daily':
+        table_name = 'price_intervals'
+
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT n_tup_ins, n_tup_upd, n_tup_del, n_live_tup
+            FROM pg_stat_user_tables
+            WHERE schemaname = %s AND relname = %s;
+        """, (schema_name, table_name))
+        version = cursor.fetchone()
+        return list(version) if version else []
+
+
+def _evict_cache(size: int = DATA_CACHE_SIZE):
+    # Least recently used files are removed until the cache fits into its size.
+    # Concurrent loads (postgres_data_parallel) may evict the same files, so a file
+    # that disappears between listing and removal is skipped
+    files = []
+    for name in os.listdir(DATA_CACHE_DIRECTORY):
+        if name.endswith('.arrow'):
+            try:
+                stat = os.stat(os.path.join(DATA_CACHE_DIRECTORY, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, os.path.join(DATA_CACHE_DIRECTORY, name)))
+    files.sort(reverse=True)
+
+    total = 0
+    for _, file_size, path in files:
+        total += file_size
+        if total > size:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def postgres_data(schema_name: str, table_name: str, year: Optional[int] = 2024,
+                  columns: Optional[List[str]] = None, where: Optional[str] = None,
+                  params: Optional[Tuple[Any, ...]] = None,
+                  arrow: bool = False, refresh: bool = False) -> Union[pd.DataFrame, pa.Table]:
     """
     Retrieves data from a specified table in a PostgreSQL database.
 
+    The rows are streamed with COPY into Arrow record batches, so no Python
+    objects are created per value. Text 'playerid', 'achievementid' and 'country'
+    columns are dictionary-encoded (categoricals in pandas) and integer columns are downcast.
+
+    Results are cached on disk in the Arrow IPC format and reused as long as
+    the modification counters of the table in pg_stat_user_tables are unchanged.
+    The statistics collector updates these counters with a delay of up to a few
+    seconds after a commit, so a read right after a write may return the cached
+    rows; pass refresh=True in that case.
+
     Args:
         **schema_name (str)** - The schema in the database where the table is located.
         **table_name (str)** - The name of the table to query.
+        **year (Optional[int])** - The year of the 'history' rows to load; None loads every year.
+        **columns (Optional[List[str]])** - The columns to load (e.g. ['playerid', 'date_acquired']),
+                                       all columns by default.
+        **where (Optional[str])** - An SQL condition evaluated by the database, with %s placeholders
+                                for params and the original column names (e.g. "player_id = %s" for Steam).
+        **params (Optional[Tuple[Any, ...]])** - The values of the placeholders in where.
+        **arrow (bool)** - Whether to return an Arrow table instead of a DataFrame.
+        **refresh (bool)** - Whether to ignore the cached result and query the database,
+                         e.g. right after a write, before pg_stat_user_tables has caught up.
 
     Returns:
-        **pd.DataFrame** - A DataFrame containing the data from the specified table.
+        **Union[pd.DataFrame, pa.Table]** - The data from the specified table.
     """
+    # The daily price series is reconstructed from validity intervals
+    if table_name == 'prices' and PRICE_STORAGE == 'intervals':
+        table_name = 'prices_daily'
+
+    key = hashlib.sha1(json.dumps([
+        DATA_CACHE_FORMAT, schema_name, table_name, year if table_name == 'history' else None,
+        sorted(columns) if columns is not None else None, where, params
+    ], default=str).encode()).hexdigest()
+    path = os.path.join(DATA_CACHE_DIRECTORY, key + '.arrow')
+
     with connect_to_database() as connection:
-        query = """
-            SELECT *
-            FROM {schema_name}.{table_name};
-        """
+        version = _table_version(connection, schema_name, table_name)
         
-        if table_name == 'history':
-            query = f"""
-                SELECT *
-                FROM {schema_name}.history
-                WHERE DATE_PART('YEAR', date_acquired) = '{year}';
-            """
-
-        df = pd.read_sql_query(
-            query.format(schema_name=schema_name, table_name=table_name),
-            connection,
-            parse_dates=['release_date', 'date_acquired', 'created',
-                         'posted', 'only_date']
-        ).rename(columns={
-            'game_id': 'gameid',
-            'achievement_id': 'achievementid',
-            'player_id': 'playerid'
-        })
-
-        return df
+        table = None
+        if not refresh and version and os.path.exists(path):
+            try:
+                cached = feather.read_table(path, memory_map=True)
+                if json.loads(cached.schema.metadata.get(b'version', b'null')) == version:
+                    table = cached.replace_schema_metadata(None)
+                    # The modification time orders the files for the LRU eviction
+                    os.utime(path)
+            except FileNotFoundError:
+                # Evicted by a concurrent load in the meantime
+                table = None
+        
+        if table is None:
+            table = _read_table(connection, schema_name, table_name, year, columns, where, params)
+            if version:
+                os.makedirs(DATA_CACHE_DIRECTORY, exist_ok=True)
+                metadata = {**(table.schema.metadata or {}), b'version': json.dumps(version).encode()}
+                feather.write_feather(table.replace_schema_metadata(metadata), path + '.tmp',
+                                      compression='lz4')
+                os.replace(path + '.tmp', path)
+                _evict_cache()
+    
+    if arrow:
+        return table
+    
+    return _downcast(table.to_pandas(date_as_object=False))
+
+
+def postgres_data_parallel(slices: List[Tuple[str, Optional[int]]], table_name: str,
+                           columns: Optional[List[str]] = None, where: Optional[str] = None,
+                           params: Optional[Tuple[Any, ...]] = None, max_workers: int = 6,
+                           refresh: bool = False, report: bool = True) -> Dict[str, pd.DataFrame]:
+    """
+    Loads slices of a table concurrently, each over its own database connection.
+
+    The slices of a platform are concatenated as Arrow tables, which only links their
+    chunks, and converted to a DataFrame once, so the total time is close to that
+    of the largest slice.
+
+    Args:
+        **slices (List[Tuple[str, Optional[int]]])** - Pairs of (platform, year), e.g. [('steam', 2023), ('xbox', 2023)];
+                                                   the year only applies to the 'history' table.
+        **table_name (str)** - The name of the table to query.
+        **columns (Optional[List[str]])** - The columns to load, all columns by default.
+        **where (Optional[str])** - An SQL condition applied to every slice (see postgres_data).
+        **params (Optional[Tuple[Any, ...]])** - The values of the placeholders in where.
+        **max_workers (int)** - Maximum number of slices loaded at once.
+        **refresh (bool)** - Whether to ignore the cached results and query the database.
+        **report (bool)** - Whether to print the load time and size of every slice.
+
+    Returns:
+        **Dict[str, pd.DataFrame]** - One DataFrame per platform.
+    """
+    def load_slice(platform: str, year: Optional[int]) -> Tuple[pa.Table, float]:
+        start = time.perf_counter()
+        table = postgres_data(platform, table_name, year=year, columns=columns, where=where,
+                              params=params, arrow=True, refresh=refresh)
+        return table, time.perf_counter() - start
+
+    # COPY parsing and the socket reads release the GIL, so threads are enough
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {(platform, year): executor.submit(load_slice, platform, year)
+                   for platform, year in slices}
+        results = {key: future.result() for key, future in futures.items()}
+
+    tables: Dict[str, List[pa.Table]] = {}
+    for (platform, year), (table, seconds) in results.items():
+        tables.setdefault(platform, []).append(table)
+        if report:
+            print(f'{platform:<12}{str(year or "-"):<6}{table.num_rows:>12,} rows{seconds:>9.1f} s')
+
+    return {
+        platform: _downcast(pa.concat_tables(parts).unify_dictionaries()
+                            .to_pandas(date_as_object=False, self_destruct=True))
+        for platform, parts in tables.items()
+    }
+
+
+def load(platform: str, table_name: str, years: Optional[List[int]] = None,
+         columns: Optional[List[str]] = None,
+         filters: Optional[List[Tuple[str, str, Any]]] = None,
+         arrow: bool = False) -> Union[pd.DataFrame, pa.Table]:
+    """
+    Reads a table from the local Parquet snapshot instead of the database.
+
+    Partitions and row groups that cannot match the years or
+    the filters are skipped using the Hive partitioning and the row group statistics.
+
+    Args:
+        **platform (str)** - The platform, e.g. 'steam'.
+        **table_name (str)** - The name of the table, e.g. 'history'.
+        **years (Optional[List[int]])** - The years of the 'history' table to read; all years by default.
+        **columns (Optional[List[str]])** - The columns to read, all columns by default.
+        **filters (Optional[List[Tuple[str, str, Any]]])** - Conditions such as ('country', '=', 'Japan'),
+                                                         combined with AND.
+        **arrow (bool)** - Whether to return an Arrow table instead of a DataFrame.
+
+    Returns:
+        **Union[pd.DataFrame, pa.Table]** - The data from the snapshot of the table.
+    """
+    # Platforms have different schemas (PlayStation and Xbox games even have their own
+    # 'platform' column), so every platform is read as a dataset of its own
+    path = os.path.join(SNAPSHOT_DIRECTORY, table_name, f'platform={platform}')
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f'No snapshot of "{platform}.{table_name}". '
+                                f'Run "python -m analysis.snapshot" first')
+
+    conditions = list(filters or [])
+    if years is not None and table_name == 'history':
+        conditions.append(('year', 'in', list(years)))
+
+    table = pq.read_table(path, columns=columns, filters=conditions or None, partitioning='hive')
+    # The year partition key is not part of the source table
+    if 'year' in table.column_names and table_name == 'history' and (columns is None or 'year' not in columns):
+        table = table.drop(['year'])
+    
+    if arrow:
+        return table
+    
+    return _downcast(table.to_pandas(date_as_object=False, self_destruct=True))
@@ -0,0 +1,246 @@
+from typing import Optional, Iterable, List, Any
+from scipy import sparse
+import pyarrow.compute as pc
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+import json
+import os
+from utils.database.connector import connect_to_database
+from analysis.helper import DATA_CACHE_FORMAT, postgres_data, load, _table_version
+from analysis.snapshot import MANIFEST
+
+OWNERSHIP_DIRECTORY: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'ownership')
+# Arrays of the cached matrix, each memory-mapped on load
+ARRAYS: List[str] = ['indptr', 'indices', 'players', 'games']
+
+
+class Ownership:
+    """
+    The games purchased by every player as a sparse CSR matrix (players × games).
+
+    Rows follow the players and columns the sorted game ids; a stored 1 means the game is in the library.
+
+    Args:
+        **matrix (sparse.csr_matrix)** - The ownership matrix.
+        **players (np.ndarray)** - The player id of every row.
+        **games (np.ndarray)** - The game id of every column, sorted.
+    """
+    def __init__(self, matrix: sparse.csr_matrix, players: np.ndarray, games: np.ndarray):
+        self.matrix = matrix
+        self.players = players
+        self.games = games
+
+    def __repr__(self) -> str:
+        return (f'Ownership({len(self.players):,} players × {len(self.games):,} games, '
+                f'{self.matrix.nnz:,} purchases)')
+
+    def _columns(self, games: Optional[Iterable[Any]]) -> np.ndarray:
+        # Column indices of the given games; games nobody owns are left out
+        if games is None:
+            return np.arange(len(self.games))
+        games = np.unique(np.fromiter(games, dtype=np.int64))
+        columns = np.searchsorted(self.games, games)
+        inside = columns < len(self.games)
+        columns, games = columns[inside], games[inside]
+        return columns[self.games[columns] == games]
+
+    def _rows(self, players: Optional[Iterable[Any]]) -> np.ndarray:
+        if players is None:
+            return np.arange(len(self.players))
+        return np.flatnonzero(pd.Index(self.players).isin(list(players)))
+
+    def _selected(self, games: Optional[Iterable[Any]]) -> np.ndarray:
+        # 1 for the columns of the given games, 0 for the rest
+        selected = np.zeros(len(self.games), dtype=np.int32)
+        selected[self._columns(games)] = 1
+        return selected
+
+    def restrict(self, players: Optional[Iterable[Any]] = None,
+                 games: Optional[Iterable[Any]] = None) -> 'Ownership':
+        """
+        Keeps only the given players and games.
+
+        Args:
+            **players (Optional[Iterable[Any]])** - The players to keep; all players by default.
+            **games (Optional[Iterable[Any]])** - The games to keep; all games by default.
+
+        Returns:
+            **Ownership** - The submatrix with its axes.
+        """
+        rows, columns = self._rows(players), self._columns(games)
+        matrix = self.matrix[rows] if players is not None else self.matrix
+        if games is not None:
+            matrix = matrix[:, columns]
+        return Ownership(matrix.tocsr(), self.players[rows], self.games[columns])
+
+    def library_sizes(self, games: Optional[Iterable[Any]] = None) -> pd.Series:
+        """
+        Counts the games in the library of every player.
+
+        Args:
+            **games (Optional[Iterable[Any]])** - The games to count; all games by default.
+
+        Returns:
+            **pd.Series** - The number of games, indexed by player.
+        """
+        if games is None:
+            sizes = np.diff(self.matrix.indptr)
+        else:
+            sizes = self.matrix @ self._selected(games)
+        return pd.Series(sizes, index=pd.Index(self.players, name='playerid'), name='library_size')
+
+    def owners(self, games: Optional[Iterable[Any]] = None) -> pd.Series:
+        """
+        Counts the players owning every game.
+
+        Args:
+            **games (Optional[Iterable[Any]])** - The games to count; all games by default.
+
+        Returns:
+            **pd.Series** - The number of owners, indexed by game.
+        """
+        counts = np.bincount(self.matrix.indices, minlength=len(self.games))
+        columns = self._columns(games)
+        return pd.Series(counts[columns], index=pd.Index(self.games[columns], name='gameid'), name='owners')
+
+    def overlap(self, games: Iterable[Any]) -> pd.DataFrame:
+        """
+        Counts the players owning each pair of the given games.
+
+        Args:
+            **games (Iterable[Any])** - The games to compare; the result is dense, so keep them few.
+
+        Returns:
+            **pd.DataFrame** - A game × game table of common owners; the diagonal holds the owners of each game.
+        """
+        columns = self._columns(games)
+        owned = self.matrix[:, columns].astype(np.int32)
+        index = pd.Index(self.games[columns], name='gameid')
+        return pd.DataFrame((owned.T @ owned).toarray(), index=index, columns=index)
+
+    def pairs(self, players: Optional[Iterable[Any]] = None,
+              games: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+        """
+        Lists the purchases as (player, game) rows, the equivalent of exploding the libraries.
+
+        Args:
+            **players (Optional[Iterable[Any]])** - The players to list; all players by default.
+            **games (Optional[Iterable[Any]])** - The games to list; all games by default.
+
+        Returns:
+            **pd.DataFrame** - The columns playerid and gameid.
+        """
+        restricted = self.restrict(players, games)
+        rows = np.repeat(np.arange(len(restricted.players)), np.diff(restricted.matrix.indptr))
+        return pd.DataFrame({
+            'playerid': pd.Categorical.from_codes(rows, pd.Index(restricted.players)),
+            'gameid': restricted.games[restricted.matrix.indices]
+        })
+
+
+def _from_table(table: pa.Table) -> Ownership:
+    # The libraries are flattened by Arrow; the list lengths give the row of every game
+    players = table.column('playerid').combine_chunks()
+    if pa.types.is_dictionary(players.type):
+        players = players.dictionary_decode()
+    library = table.column('library').combine_chunks()
+
+    lengths = pc.list_value_length(library).fill_null(0).to_numpy()
+    values = pc.list_flatten(library)
+    valid = pc.is_valid(values).to_numpy(zero_copy_only=False)
+    rows = np.repeat(np.arange(len(library), dtype=np.int64), lengths)[valid]
+    games, indices = np.unique(values.fill_null(0).to_numpy()[valid], return_inverse=True)
+
+    indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(library)))]
+    index_type = np.int64 if len(indices) > np.iinfo(np.int32).max else np.int32
+    matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices.astype(np.int32),
+                                indptr.astype(index_type)), shape=(len(library), len(games)))
+    # A game listed twice in a library is owned once
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+
+    # Text ids are stored as fixed-width strings, which np.load can memory-map
+    players = players.to_numpy(zero_copy_only=False)
+    if players.dtype == object:
+        players = players.astype(str)
+    return Ownership(matrix, players, games.astype(np.int64))
+
+
+def _source_version(platform: str, snapshot: bool) -> Optional[List[Any]]:
+    # The cache is valid for one version of the source: the fingerprint of the snapshot
+    # partition, or the modification counters of the table in the database,
+    # read with the current column types
+    if snapshot:
+        try:
+            with open(MANIFEST) as file:
+                version = json.load(file).get(os.path.join('purchased_games', f'platform={platform}'))
+        except FileNotFoundError:
+            return None
+    else:
+        with connect_to_database() as connection:
+            version = _table_version(connection, platform, 'purchased_games') or None
+
+    return [DATA_CACHE_FORMAT, version] if version is not None else None
+
+
+def _read_cache(directory: str, version: List[Any]) -> Optional[Ownership]:
+    try:
+        with open(os.path.join(directory, 'version.json')) as file:
+            if json.load(file) != version:
+                return None
+    except FileNotFoundError:
+        return None
+
+    indptr, indices, players, games = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+                                       for name in ARRAYS]
+    matrix = sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr),
+                               shape=(len(players), len(games)))
+    return Ownership(matrix, players, games)
+
+
+def _write_cache(directory: str, version: List[Any], ownership: Ownership):
+    # The version is written last, so an interrupted write is never read back
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, 'version.json')):
+        os.remove(os.path.join(directory, 'version.json'))
+
+    arrays = [ownership.matrix.indptr, ownership.matrix.indices, ownership.players, ownership.games]
+    for name, array in zip(ARRAYS, arrays):
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+    with open(os.path.join(directory, 'version.json'), 'w') as file:
+        json.dump(version, file)
+
+
+def build_ownership(platform: str, snapshot: bool = False, refresh: bool = False) -> Ownership:
+    """
+    Builds the sparse players × games ownership matrix from the 'purchased_games' table.
+
+    The matrix is cached on disk as .npy arrays in resources/ownership and memory-mapped
+    on load, for as long as the source table (or its snapshot partition) is unchanged.
+
+    Args:
+        **platform (str)** - The platform schema.
+        **snapshot (bool)** - Whether to read the Parquet snapshot instead of the database.
+        **refresh (bool)** - Whether to ignore the cached matrix and build it again.
+
+    Returns:
+        **Ownership** - The ownership matrix with its player and game axes.
+    """
+    directory = os.path.join(OWNERSHIP_DIRECTORY, 'snapshot' if snapshot else 'database', platform)
+    version = _source_version(platform, snapshot)
+    if not refresh and version is not None:
+        cached = _read_cache(directory, version)
+        if cached is not None:
+            return cached
+
+    if snapshot:
+        table = load(platform, 'purchased_games', columns=['playerid', 'library'], arrow=True)
+    else:
+        table = postgres_data(platform, 'purchased_games', columns=['playerid', 'library'],
+                              arrow=True, refresh=refresh)
+    ownership = _from_table(table)
+
+    if version is not None:
+        _write_cache(directory, version, ownership)
+    return ownership
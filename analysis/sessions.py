@@ -0,0 +1,153 @@
+from typing import Optional, Generator, Tuple
+import pandas as pd
+import numpy as np
+from analysis.helper import postgres_data, define_games
+
+# Steam tables name the player column differently
+PLAYER_COLUMNS = {'steam': 'player_id', 'playstation': 'playerid', 'xbox': 'playerid'}
+
+
+def _codes(values: pd.Series) -> np.ndarray:
+    # Integer codes of a column; categoricals already carry them
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64)
+    return pd.factorize(values)[0].astype(np.int64)
+
+
+def _sorted_groups(df: pd.DataFrame, player: str, game: str,
+                   time: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # One integer per (player, game), and the rows ordered by group and time
+    players, games = _codes(df[player]), _codes(df[game])
+    groups = players * (games.max(initial=0) + 1) + games
+    nanoseconds = df[time].to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+    order = np.lexsort((nanoseconds, groups))
+    return groups, order, nanoseconds[order]
+
+
+def _deltas(groups: np.ndarray, times: np.ndarray) -> np.ndarray:
+    # Nanoseconds since the previous unlock of the same group; -1 for the first unlock.
+    # Unlocks without a time (NaT sorts first) have no delta, nor does the unlock after them
+    deltas = np.empty(len(times), dtype=np.int64)
+    if len(times):
+        missing = times == np.iinfo(np.int64).min
+        deltas[0] = -1
+        deltas[1:] = times[1:] - times[:-1]
+        deltas[1:][(groups[1:] != groups[:-1]) | missing[1:] | missing[:-1]] = -1
+    return deltas
+
+
+def sessionize(df: pd.DataFrame, player: str = 'playerid', game: str = 'gameid',
+               time: str = 'date_acquired', gap: pd.Timedelta = pd.Timedelta(hours=1)) -> pd.DataFrame:
+    """
+    Computes the time between consecutive unlocks of a game and splits them into sessions.
+
+    Args:
+        **df (pd.DataFrame)** - The history with player, game and time columns.
+        **player (str)** - The player column.
+        **game (str)** - The game column.
+        **time (str)** - The unlock time column.
+        **gap (pd.Timedelta)** - A pause longer than this starts a new session.
+
+    Returns:
+        **pd.DataFrame** - The input with 'delta' (minutes since the previous unlock of the game, NaN for the first)
+                       and 'session' (the number of the session within the player's game, from 0) columns.
+    """
+    groups, order, times = _sorted_groups(df, player, game, time)
+    sorted_groups = groups[order]
+    deltas = _deltas(sorted_groups, times)
+
+    first = deltas < 0
+    starts = first | (deltas > gap.value)
+    # Sessions are counted from every first unlock of a group
+    sessions = np.cumsum(starts)
+    sessions -= np.maximum.accumulate(np.where(first, sessions, 0))
+
+    result = df.copy()
+    delta_column = np.empty(len(df))
+    delta_column[order] = np.where(first, np.nan, deltas / 6e10)
+    session_column = np.empty(len(df), dtype=np.int32)
+    session_column[order] = sessions
+    result['delta'] = delta_column
+    result['session'] = session_column
+    return result
+
+
+def farming_mask(df: pd.DataFrame, totals: pd.Series, player: str = 'playerid', game: str = 'gameid',
+                 time: str = 'date_acquired', min_total: int = 5, threshold: float = 65.) -> np.ndarray:
+    """
+    Flags the unlocks of games whose achievements were obtained by manipulation.
+
+    The delta between consecutive unlocks of a game is calculated, and a player's game is flagged
+    if one delta value repeats for at least threshold percent of the game's achievements.
+    Only games with more than min_total achievements are checked, since with fewer of them
+    identical deltas are common (e.g. a game with a single achievement always gives 100%).
+
+    Args:
+        **df (pd.DataFrame)** - The history with player, game and time columns.
+        **totals (pd.Series)** - The total number of achievements, indexed by game.
+        **player (str)** - The player column.
+        **game (str)** - The game column.
+        **time (str)** - The unlock time column.
+        **min_total (int)** - Games with at most this many achievements are never flagged.
+        **threshold (float)** - The share (in percent) of identical deltas that marks manipulation.
+
+    Returns:
+        **np.ndarray** - A boolean mask of the flagged rows, aligned with df.
+    """
+    groups, order, times = _sorted_groups(df, player, game, time)
+    sorted_groups = groups[order]
+    deltas = _deltas(sorted_groups, times)
+    game_totals = df[game].map(totals).to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+    # Runs of identical deltas within a group, the first unlocks left out
+    valid = deltas >= 0
+    run_order = np.lexsort((deltas[valid], sorted_groups[valid]))
+    run_groups = sorted_groups[valid][run_order]
+    run_deltas = deltas[valid][run_order]
+    run_totals = game_totals[valid][run_order]
+    if not len(run_groups):
+        return np.zeros(len(df), dtype=bool)
+
+    run_starts = np.flatnonzero(np.r_[True, (run_groups[1:] != run_groups[:-1]) |
+                                            (run_deltas[1:] != run_deltas[:-1])])
+    counts = np.diff(np.r_[run_starts, len(run_groups)])
+
+    # The longest run of every group
+    group_runs = run_groups[run_starts]
+    group_starts = np.flatnonzero(np.r_[True, group_runs[1:] != group_runs[:-1]])
+    longest = np.maximum.reduceat(counts, group_starts)
+    group_totals = run_totals[run_starts][group_starts]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        flagged = (group_totals > min_total) & (longest / group_totals * 100 >= threshold)
+    return np.isin(groups, group_runs[group_starts][flagged])
+
+
+def clean_history(platform: str, totals: pd.Series, chunks: int = 16, year: Optional[int] = None,
+                  gap: pd.Timedelta = pd.Timedelta(hours=1)) -> Generator[pd.DataFrame, None, None]:
+    """
+    Streams the history of a platform in chunks of players, with sessions and without manipulated games.
+
+    Players are assigned to chunks by the hash of their id in the database,
+    so every player's history is complete within one chunk and the memory
+    needed is that of a single chunk.
+
+    Args:
+        **platform (str)** - The platform schema.
+        **totals (pd.Series)** - The total number of achievements, indexed by game.
+        **chunks (int)** - The number of chunks.
+        **year (Optional[int])** - The year of the history to read; all years by default.
+        **gap (pd.Timedelta)** - A pause longer than this starts a new session.
+
+    Yields:
+        **pd.DataFrame** - The cleaned history of one chunk of players.
+    """
+    player = PLAYER_COLUMNS[platform]
+    for chunk in range(chunks):
+        history = postgres_data(platform, 'history', year=year,
+                                where=f'MOD(ABS(HASHTEXT({player}::TEXT)), %s) = %s', params=(chunks, chunk))
+        history['gameid'] = define_games(history.achievementid)
+
+        history = history[~farming_mask(history, totals)]
+        yield sessionize(history, gap=gap).reset_index(drop=True)
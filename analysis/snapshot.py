@@ -0,0 +1,133 @@
+from typing import Optional, Dict, List, Tuple
+import pyarrow.parquet as pq
+import argparse
+import json
+import os
+from utils.database.connector import connect_to_database
+from utils.constants import PRICE_STORAGE
+from analysis.helper import PLATFORMS, SNAPSHOT_DIRECTORY, DATA_CACHE_FORMAT, _read_table
+
+TABLES: List[str] = ['games', 'achievements', 'players', 'purchased_games', 'prices', 'history']
+MANIFEST: str = os.path.join(SNAPSHOT_DIRECTORY, 'manifest.json')
+
+
+def _source_table(table_name: str) -> str:
+    # The daily price series is reconstructed from validity intervals
+    if table_name == 'prices' and PRICE_STORAGE == 'intervals':
+        return 'prices_daily'
+    return table_name
+
+
+def _history_years(platform: str) -> List[int]:
+    with connect_to_database() as connection, connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT DISTINCT EXTRACT(YEAR FROM date_acquired)::INTEGER
+            FROM {platform}.history
+            WHERE date_acquired IS NOT NULL
+            ORDER BY 1;
+        """)
+        return [year[0] for year in cursor.fetchall()]
+
+
+def _fingerprint(platform: str, table_name: str, year: Optional[int]) -> List[int]:
+    # Row count and an order-independent checksum of the rows, computed by the database,
+    # and the format of the loaded columns. A partition is exported again if any of them has changed
+    condition = ''
+    if year is not None:
+        condition = f"WHERE date_acquired >= '{year}-01-01' AND date_acquired < '{year + 1}-01-01'"
+
+    with connect_to_database() as connection, connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM(HASHTEXT(t::TEXT)::BIGINT), 0)
+            FROM {platform}.{_source_table(table_name)} t
+            {condition};
+        """)
+        # The sum is NUMERIC, which psycopg2 returns as a Decimal
+        return [int(value) for value in cursor.fetchone()] + [DATA_CACHE_FORMAT]
+
+
+def _partition(platform: str, table_name: str, year: Optional[int]) -> Tuple[str, str]:
+    # Hive layout: <table>/platform=<platform>[/year=<year>]/part-0.parquet
+    directory = os.path.join(table_name, f'platform={platform}')
+    if year is not None:
+        directory = os.path.join(directory, f'year={year}')
+    return directory, os.path.join(SNAPSHOT_DIRECTORY, directory, 'part-0.parquet')
+
+
+def export_partition(platform: str, table_name: str, year: Optional[int],
+                     manifest: Dict[str, List[int]], force: bool = False) -> bool:
+    """
+    Writes one partition of the snapshot if its source rows have changed.
+
+    Args:
+        **platform (str)** - The platform schema.
+        **table_name (str)** - The table name.
+        **year (Optional[int])** - The year of a 'history' partition.
+        **manifest (Dict[str, List[int]])** - The fingerprints of the exported partitions, updated in place.
+        **force (bool)** - Whether to export the partition regardless of its fingerprint.
+
+    Returns:
+        **bool** - Whether the partition was written.
+    """
+    key, path = _partition(platform, table_name, year)
+    fingerprint = _fingerprint(platform, table_name, year)
+    if not force and manifest.get(key) == fingerprint and os.path.exists(path):
+        return False
+
+    # The partition is read past the Arrow cache of postgres_data, which it would only fill
+    with connect_to_database() as connection:
+        table = _read_table(connection, platform, _source_table(table_name), year, None, None, None)
+    # Dated rows are sorted by date, so the min/max statistics of the row groups
+    # of a million rows let filters on the date skip most of them
+    if 'date_acquired' in table.column_names:
+        table = table.sort_by('date_acquired')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + '.tmp', compression='zstd',
+                   row_group_size=1 << 20, write_statistics=True)
+    os.replace(path + '.tmp', path)
+
+    manifest[key] = fingerprint
+    return True
+
+
+def snapshot(platforms: List[str] = PLATFORMS, tables: List[str] = TABLES, force: bool = False):
+    """
+    Exports the tables of the given platforms into the Parquet snapshot.
+
+    Args:
+        **platforms (List[str])** - The platforms to export.
+        **tables (List[str])** - The tables to export.
+        **force (bool)** - Whether to export every partition regardless of its fingerprint.
+    """
+    try:
+        with open(MANIFEST) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {}
+
+    for platform in platforms:
+        for table_name in tables:
+            years = _history_years(platform) if table_name == 'history' else [None]
+            for year in years:
+                written = export_partition(platform, table_name, year, manifest, force)
+                partition = f'{platform}.{table_name}' + (f' ({year})' if year is not None else '')
+                print(f'{partition:<36}{"exported" if written else "unchanged"}')
+
+                # The manifest is saved after every partition, so an interrupted run resumes
+                os.makedirs(SNAPSHOT_DIRECTORY, exist_ok=True)
+                with open(MANIFEST + '.tmp', 'w') as file:
+                    json.dump(manifest, file, indent=2, sort_keys=True)
+                os.replace(MANIFEST + '.tmp', MANIFEST)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m analysis.snapshot',
+                                     description='Exports the database into Parquet files for the notebooks. '
+                                                 'Only partitions whose rows changed are exported again')
+    parser.add_argument('--platforms', nargs='+', default=PLATFORMS, choices=PLATFORMS)
+    parser.add_argument('--tables', nargs='+', default=TABLES, choices=TABLES)
+    parser.add_argument('--force', action='store_true',
+                        help='Export every partition regardless of its fingerprint')
+    args = parser.parse_args()
+
+    snapshot(args.platforms, args.tables, args.force)
@@ -0,0 +1,43 @@
+import argparse
+import sys
+from runner.jobs import select
+from runner.pipeline import run, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m runner',
+                                     description='Runs the data collection jobs in dependency order. '
+                                                 'Platforms run concurrently in separate processes')
+    parser.add_argument('--only', nargs='+', default=[], metavar='NAME',
+                        help='Run only these jobs or platforms, e.g. "steam" or "xbox.prices"')
+    parser.add_argument('--since', nargs='+', default=[], metavar='NAME',
+                        help='Run these jobs or platforms together with every job that depends on them')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip jobs that finished successfully during the previous run')
+    parser.add_argument('--full-refresh', action='store_true',
+                        help='Ignore the incremental state of the catalog jobs')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Maximum number of jobs of one platform running at once')
+    parser.add_argument('--list', action='store_true',
+                        help='Print the selected jobs with their dependencies and exit')
+    args = parser.parse_args()
+
+    try:
+        jobs = select(args.only, args.since)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.list:
+        for job in jobs:
+            print(f'{job.name:<26}<- {", ".join(job.requires) or "-"}')
+        return
+
+    results = run(jobs, workers=args.workers, resume=args.resume, full_refresh=args.full_refresh)
+    print(summary(results))
+
+    if any(result['status'] != 'done' for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
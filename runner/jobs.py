@@ -0,0 +1,121 @@
+from typing import Any, Dict, List, Set, Tuple
+
+
+class Job:
+    def __init__(self, name: str, module: str, args: Tuple[Any, ...] = (),
+                 requires: Tuple[str, ...] = (), group: str = '', refreshable: bool = False):
+        # Name in the form '<platform>.<job>', e.g. 'steam.history'
+        self.name = name
+        self.platform = name.split('.')[0]
+        # Module exposing main(), e.g. 'scripts.steam.history'
+        self.module = module
+        self.args = args
+        # Jobs that must finish successfully before this one starts
+        self.requires = requires
+        # Jobs sharing a group share a concurrency limit (see LIMITS)
+        self.group = group
+        # Whether main() accepts the 'full_refresh' keyword
+        self.refreshable = refreshable
+
+    def __repr__(self) -> str:
+        return f'Job({self.name})'
+
+
+# Maximum number of jobs of the same group running at once across all platforms.
+# Jobs of a group share a source and its rate limits (or a Steam Web API key)
+LIMITS: Dict[str, int] = {
+    'steam-webapi': 1,
+    'steam-store': 1,
+    'exophase': 2,
+    'psprices': 1,
+    'trueachievements': 1
+}
+
+# games -> achievements -> players -> history/reviews -> prices -> missing_data
+JOBS: List[Job] = [
+    Job('steam.games', 'scripts.steam.games', ('games',),
+        group='steam-store', refreshable=True),
+    Job('steam.achievements', 'scripts.steam.games', ('achievements',),
+        requires=('steam.games',), group='steam-webapi'),
+    Job('steam.players', 'scripts.steam.players', ('players',),
+        group='steam-webapi'),
+    Job('steam.history', 'scripts.steam.history',
+        requires=('steam.achievements', 'steam.players'), group='steam-webapi'),
+    Job('steam.reviews', 'scripts.steam.players', ('reviews',),
+        requires=('steam.games', 'steam.players'), group='steam-webapi'),
+    Job('steam.prices', 'scripts.steam.prices',
+        requires=('steam.games',), group='steam-store'),
+
+    # The history crawl adds games found in player profiles,
+    # so prices and missing data are collected after it
+    Job('playstation.games', 'scripts.playstation.games',
+        group='exophase', refreshable=True),
+    Job('playstation.players', 'scripts.playstation.players',
+        group='exophase'),
+    Job('playstation.history', 'scripts.playstation.history',
+        requires=('playstation.games', 'playstation.players'), group='exophase'),
+    Job('playstation.prices', 'scripts.playstation.prices',
+        requires=('playstation.history',), group='psprices'),
+    Job('playstation.missing_data', 'scripts.playstation.missing_data',
+        requires=('playstation.history',), group='trueachievements'),
+
+    Job('xbox.games', 'scripts.xbox.games',
+        group='exophase', refreshable=True),
+    Job('xbox.players', 'scripts.xbox.players',
+        group='exophase'),
+    Job('xbox.history', 'scripts.xbox.history',
+        requires=('xbox.games', 'xbox.players'), group='exophase'),
+    Job('xbox.prices', 'scripts.xbox.prices',
+        requires=('xbox.history',), group='psprices'),
+    Job('xbox.missing_data', 'scripts.xbox.missing_data',
+        requires=('xbox.history',), group='trueachievements')
+]
+
+
+def descendants(names: Set[str], jobs: List[Job] = JOBS) -> Set[str]:
+    """
+    Collects the given jobs together with every job that depends on them
+
+    Args:
+        names (Set[str]): Names of the starting jobs
+        jobs (List[Job]): The declared DAG
+
+    Returns:
+        Set[str]: Names of the starting jobs and all of their dependents
+    """
+    selected = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for job in jobs:
+            if job.name not in selected and selected.intersection(job.requires):
+                selected.add(job.name)
+                changed = True
+    return selected
+
+
+def select(only: List[str] = (), since: List[str] = (), jobs: List[Job] = JOBS) -> List[Job]:
+    """
+    Filters the DAG by the '--only' and '--since' options
+
+    Args:
+        only (List[str]): Job names ('steam.history') or platform names ('xbox')
+        since (List[str]): Job names to start from; their dependents are included
+        jobs (List[Job]): The declared DAG
+
+    Returns:
+        List[Job]: Selected jobs in declaration order
+    """
+    names = {job.name for job in jobs}
+    unknown = [name for name in [*only, *since]
+               if name not in names and name not in {job.platform for job in jobs}]
+    if unknown:
+        raise ValueError(f'Unknown jobs or platforms: {", ".join(unknown)}')
+
+    selected = names
+    if only:
+        selected = {job.name for job in jobs if job.name in only or job.platform in only}
+    if since:
+        selected &= descendants({job.name for job in jobs
+                                 if job.name in since or job.platform in since}, jobs)
+    return [job for job in jobs if job.name in selected]
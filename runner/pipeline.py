@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import Process, Queue, BoundedSemaphore
+from typing import Optional, Any, Dict, List
+from collections import defaultdict
+from pathlib import Path
+import importlib
+import pickle
+import queue
+import time
+from utils.constants import PIPELINE_LOGS, CACHE_PIPELINE
+from utils.limiter import metrics as limiter_metrics
+from utils.logger import configure_logger
+from runner.jobs import Job, LIMITS
+
+LOGGER = configure_logger(Path(__file__).name, PIPELINE_LOGS)
+
+
+def _load_state() -> Dict[str, str]:
+    # Status of every job of the previous run: 'done', 'failed' or 'skipped'
+    try:
+        with open('./resources/' + CACHE_PIPELINE, 'rb') as file:
+            state = pickle.load(file)
+
+        if not isinstance(state, dict):
+            raise FileNotFoundError
+    except FileNotFoundError:
+        state = {}
+    return state
+
+def _save_state(state: Dict[str, str]):
+    with open('./resources/' + CACHE_PIPELINE, 'wb') as file:
+        pickle.dump(state, file)
+
+def _rows(instance: Optional[Any]) -> int:
+    # Every job counts written rows in attributes named 'added*' or 'updated*'
+    if instance is None:
+        return 0
+    return sum(value for name, value in vars(instance).items()
+               if name.startswith(('added', 'updated')) and isinstance(value, int))
+
+def run_job(job: Job, semaphores: Dict[str, Any], full_refresh: bool) -> Dict[str, Any]:
+    semaphore = semaphores.get(job.group)
+    if semaphore is not None:
+        semaphore.acquire()
+
+    LOGGER.info(f'Job "{job.name}" started')
+    started, instance, error = time.perf_counter(), None, ''
+    try:
+        module = importlib.import_module(job.module)
+        kwargs = {'full_refresh': True} if full_refresh and job.refreshable else {}
+        instance = module.main(*job.args, **kwargs)
+        status = 'done'
+    except (Exception, KeyboardInterrupt) as e:
+        status, error = 'failed', str(e).strip()
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+
+    seconds = time.perf_counter() - started
+    LOGGER.info(f'Job "{job.name}" finished with status "{status}" in {seconds:.1f}s')
+    # Limits are per process, so they accumulate over the jobs of the platform
+    for host, values in limiter_metrics().items():
+        LOGGER.info(f'Concurrency limit of "{host}": {values}')
+    return {'job': job.name, 'status': status, 'seconds': seconds,
+            'rows': _rows(instance), 'error': error}
+
+def run_platform(jobs: List[Job], semaphores: Dict[str, Any],
+                 results: Queue, workers: int, full_refresh: bool):
+    """
+    Runs the jobs of a single platform in dependency order inside its own process
+
+    Args:
+        jobs (List[Job]): Selected jobs of one platform
+        semaphores (Dict[str, Any]): Shared semaphores limiting each job group
+        results (Queue): Queue receiving a summary of every finished job
+        workers (int): Maximum number of jobs of this platform running at once
+        full_refresh (bool): Whether catalog jobs should ignore their incremental state
+    """
+    pending = {job.name: job for job in jobs}
+    selected = set(pending)
+    finished: Dict[str, str] = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            for name, job in list(pending.items()):
+                # Dependencies outside the selection are treated as already satisfied
+                requires = [required for required in job.requires if required in selected]
+                if any(finished.get(required) in {'failed', 'skipped'} for required in requires):
+                    pending.pop(name)
+                    finished[name] = 'skipped'
+                    results.put({'job': name, 'status': 'skipped', 'seconds': .0,
+                                 'rows': 0, 'error': 'A required job did not succeed'})
+                elif all(finished.get(required) == 'done' for required in requires):
+                    pending.pop(name)
+                    running[executor.submit(run_job, job, semaphores, full_refresh)] = name
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                finished[running.pop(future)] = result['status']
+                results.put(result)
+
+def summary(results: List[Dict[str, Any]]) -> str:
+    lines = [f'{"job":<26}{"status":<10}{"time":>10}{"rows":>12}{"rows/s":>10}']
+    for result in results:
+        throughput = result['rows'] / result['seconds'] if result['seconds'] else .0
+        lines.append(f'{result["job"]:<26}{result["status"]:<10}{result["seconds"]:>9.1f}s'
+                     f'{result["rows"]:>12}{throughput:>10.1f}')
+    return '\n'.join(lines)
+
+def run(jobs: List[Job], workers: int = 2, resume: bool = False,
+        full_refresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Runs the selected jobs, one process per platform
+
+    Args:
+        jobs (List[Job]): Selected jobs of any platforms
+        workers (int): Maximum number of jobs of one platform running at once
+        resume (bool): Skip jobs that finished successfully during the previous run
+        full_refresh (bool): Whether catalog jobs should ignore their incremental state
+
+    Returns:
+        List[Dict[str, Any]]: Status, wall time and number of written rows of every job
+    """
+    state = _load_state() if resume else {}
+    jobs = [job for job in jobs if state.get(job.name) != 'done']
+
+    by_platform = defaultdict(list)
+    for job in jobs:
+        by_platform[job.platform].append(job)
+
+    # Semaphores are created before the processes start so that all platforms share them
+    semaphores = {group: BoundedSemaphore(limit) for group, limit in LIMITS.items()}
+    results = Queue()
+    processes = [
+        Process(target=run_platform, name=platform,
+                args=(platform_jobs, semaphores, results, workers, full_refresh))
+        for platform, platform_jobs in by_platform.items()
+    ]
+
+    LOGGER.info(f'Pipeline started with jobs: {", ".join(job.name for job in jobs)}')
+    for process in processes:
+        process.start()
+
+    finished = []
+    def _collect(timeout: Optional[float]):
+        try:
+            result = results.get(timeout=timeout) if timeout else results.get_nowait()
+        except queue.Empty:
+            return False
+        finished.append(result)
+        state[result['job']] = result['status']
+        _save_state(state)
+        if result['error']:
+            LOGGER.error(f'Job "{result["job"]}" returned an error: {result["error"]}')
+        return True
+
+    while any(process.is_alive() for process in processes):
+        _collect(timeout=1)
+    for process in processes:
+        process.join()
+    while _collect(timeout=None):
+        pass
+
+    LOGGER.info('Pipeline finished\n' + summary(finished))
+    return finished
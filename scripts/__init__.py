@@ -1,10 +1,12 @@
-from typing import Optional, List, Any
+from typing import Optional, Tuple, List, Any
 from fuzzywuzzy import process
 from bs4 import BeautifulSoup
 from datetime import datetime
 import urllib.request
+import urllib.error
 import csv
 from utils.fetcher import Fetcher
+from utils.limiter import get_limiter
 
 
 class ExophaseAPI(Fetcher):
@@ -102,7 +104,13 @@ class ExophaseAPI(Fetcher):
             'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8')
         request.add_header('Accept-Language',
             'en-US,en;q=0.5')
-        return urllib.request.urlopen(request).read().decode('utf-8')
+        # The number of concurrent requests to a host is capped by its adaptive limit
+        with get_limiter(url).slot() as slot:
+            try:
+                return urllib.request.urlopen(request).read().decode('utf-8')
+            except urllib.error.HTTPError as e:
+                slot.status = e.code
+                raise
 
     def get_achievements(self, soup: BeautifulSoup, gameid: int) -> List[Optional[List[Any]]]:
         """
@@ -201,3 +209,67 @@ class ExophaseAPI(Fetcher):
             return int(pagination.find_all('li')[-2].text.strip())
         except Exception as e:
             raise Exception(f'Failed to retrieve the last page number. Error: {str(e).strip()}')
+
+
+def parse_game(html_content: str, gameid: int) -> Tuple[List[Any], List[Optional[List[Any]]]]:
+    """
+    Extracts game details and achievements from a game's details page.
+    Defined at module level so that it can run in a worker process
+
+    Args:
+        html_content (str): The HTML content of the game details page
+        gameid (int): The unique identifier of the game for generating achievement IDs
+
+    Returns:
+        Tuple[List[Any], List[Optional[List[Any]]]]: Details (developers, publishers, genres,
+                                                     supported languages, release date) and achievements
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    parser = ExophaseAPI()
+    return parser.get_details(soup), parser.get_achievements(soup, gameid)
+
+
+def parse_price(html_content: str, currency: str, title: str) -> Optional[float]:
+    """
+    Extracts the price of the best matching game from a PSPrices search results page.
+    Defined at module level so that it can run in a worker process
+
+    Args:
+        html_content (str): The HTML content of the search results page
+        currency (str): The PSPrices region, e.g. 'region-us'
+        title (str): The title of the game being priced
+
+    Returns:
+        Optional[float]: The price of the best matching candidate, or None if no candidate matches
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    games = soup.find('div', class_='grid grid-cols-12 gap-3').find_all('div',
+        class_='col-span-6 sm:col-span-4 md:col-span-3 lg:col-span-2')
+    
+    candidates = {}
+    for candidate in games:
+        candidate_title = candidate.find('span',
+            class_='line-clamp-2 h-10 underline-offset-2 group-hover:underline text-gray-900 ' + \
+                'dark:text-gray-50 group-hover:text-primary-600 ' + \
+                'dark:group-hover:text-primary-400 transition-colors').text.strip()
+        
+        try:
+            candidate_price = candidate.find('span',
+                class_='inline-flex items-center space-x-0.5').text.strip().replace(',', '.')
+            
+            for element in {'$', '£', '€', '₽', '￥', '\xa0'}:
+                candidate_price = candidate_price.replace(element, '')
+                
+            if currency == 'region-jp':
+                candidate_price = candidate_price.replace('.', '')
+
+            # Free games are not recorded as candidates
+            if candidate_price != 'Free':
+                candidates[candidate_title] = float(candidate_price)
+        except AttributeError:
+            # Price not found for one of the candidates
+            pass
+    
+    best_match = ExophaseAPI._find_best_match(title, candidates.keys())
+    return candidates[best_match] if best_match else None
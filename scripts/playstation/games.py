@@ -1,73 +1,132 @@
-from typing import Optional, Tuple, Any, Dict, List
+from typing import Optional, Iterable, AbstractSet, Any, Dict, List, Set, Tuple
 from concurrent.futures import ThreadPoolExecutor
 from psycopg2 import extensions, Error
-from bs4 import BeautifulSoup
 from pathlib import Path
 import pickle
 import json
-from utils.constants import (PLAYSTATION_SCHEMA, DATABASE_TABLES,
-                             PLAYSTATION_LOGS, CASHE_PLAYSTATIONURLS)
+from utils.constants import (PLAYSTATION_SCHEMA, DATABASE_TABLES, PLAYSTATION_LOGS,
+                             CASHE_PLAYSTATIONURLS, CACHE_PLAYSTATION_FINGERPRINTS, MAX_WORKERS)
 from utils.database.connector import connect_to_database, insert_data
+from utils.fingerprints import FingerprintStore
+from utils.workers import FetchParsePool
 from utils.logger import configure_logger
-from scripts import ExophaseAPI
+from scripts import ExophaseAPI, parse_game
 
 LOGGER = configure_logger(Path(__file__).name, PLAYSTATION_LOGS)
 
 
 class PlayStationGames(ExophaseAPI):
-    def __init__(self, process_games: str, process_achievements: str):
+    def __init__(self, process_games: str, process_achievements: str,
+                 full_refresh: bool = False):
         super().__init__()
         self.process_games = process_games
         self.process_achievements = process_achievements
+        # A full refresh re-reads every archive page instead of stopping at known games
+        self.full_refresh = full_refresh
 
         self.games = self.api + '/public/archive/platform/psn/page/{page}?q=&sort=added'
 
+        # Hashes of the game pages that have already been parsed
+        self.fingerprints = FingerprintStore(CACHE_PLAYSTATION_FINGERPRINTS)
+
+        # Digests of downloaded pages that are waiting to be written to the database
+        self._digests: Dict[str, str] = {}
+
         # Number of records added to the 'games' table
         self.added_games = 0
         # Number of records added to the 'achievements' table
         self.added_achievements = 0
 
-    def _get_details(self, gameid: int, gametitle: str,
-                     platform: str, gameurl: str) -> Tuple[List[Any], List[Any]]:
-        # Called from ExophaseAPI
+    @staticmethod
+    def _get_gameids(connection: extensions.connection) -> Set[int]:
+        try:
+            with connection.cursor() as cursor:
+                query = """
+                    SELECT gameid
+                    FROM playstation.games;
+                """
+                cursor.execute(query)
+                return {gameid[0] for gameid in cursor.fetchall()}
+        except Exception as e:
+            LOGGER.error(f'Failed to retrieve the game list. Error: {e}')
+            return set()
+
+    def _fetch_game(self, gameurl: str) -> Optional[str]:
         html_content = self._request(gameurl)
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Called from ExophaseAPI
-        details = [gameid, gametitle, platform] + self.get_details(soup)
-        achievements = self.get_achievements(soup, gameid)
-        
-        return details, achievements
+        # The page is not parsed again if nothing has changed since the last crawl
+        digest = self.fingerprints.changed(gameurl, html_content)
+        if digest is None:
+            return None
+        self._digests[gameurl] = digest
+        return html_content
 
-    def get_games(self, connection: extensions.connection, page: int,
-                  dump_playstationurls: Dict[int, Optional[str]]):
-        json_content = json.loads(self._request(self.games.format(page=page)))
+    def get_page(self, page: int,
+                 known_gameids: AbstractSet[int] = frozenset()) -> Optional[List[Dict[str, Any]]]:
+        # None tells a failed request apart from a page without new games
+        try:
+            json_content = json.loads(self._request(self.games.format(page=page)))
+        except Exception as e:
+            LOGGER.error(f'Failed to retrieve the archive page "{page}". Error: {e}')
+            return None
         
-        batch_games, batch_achievements = [], []
-        games = json_content.get('games', {}).get('list', [])
-        for game in games:
-            gameid = game['master_id']
-            gametitle = game['title']
-            gameurl = game['endpoint_awards']
-            platform = game['platforms'][0]['name']
-            
-            details, achievements = self._get_details(gameid, gametitle, platform, gameurl)
-            
-            batch_games.append(details)
-            batch_achievements.extend(achievements)
-            
-            dump_playstationurls[gameid] = gameurl
+        # Detail pages are fetched only for games that are not in our database yet
+        return [game for game in json_content.get('games', {}).get('list', [])
+                if game['master_id'] not in known_gameids]
+
+    def _insert_games(self, connection: extensions.connection, batch_games: List[List[Any]],
+                      batch_achievements: List[List[Any]], batch_urls: List[Tuple[int, str]],
+                      dump_playstationurls: Dict[int, Optional[str]]):
+        if not batch_games:
+            return
         
         try:
             # DATABASE_TABLES[0] = 'games'
             # DATABASE_TABLES[1] = 'achievements'
             insert_data(connection, PLAYSTATION_SCHEMA, DATABASE_TABLES[0], batch_games)
             self.added_games += len(batch_games)
-            insert_data(connection, PLAYSTATION_SCHEMA, DATABASE_TABLES[1], batch_achievements)
-            self.added_achievements += len(batch_achievements)
+            if batch_achievements:
+                insert_data(connection, PLAYSTATION_SCHEMA, DATABASE_TABLES[1], batch_achievements)
+                self.added_achievements += len(batch_achievements)
+            
+            for gameid, gameurl in batch_urls:
+                # A game counts as known only once its rows are stored,
+                # so a failed game is crawled again by the next run
+                dump_playstationurls[gameid] = gameurl
+                # A page listed twice in the batch (pages shift under sort=added) has one digest
+                digest = self._digests.pop(gameurl, None)
+                if digest is not None:
+                    self.fingerprints.commit(gameurl, digest)
         except (Error, IndexError) as e:
             LOGGER.warning(e)
 
+    def get_games(self, connection: extensions.connection, games: Iterable[Dict[str, Any]],
+                  dump_playstationurls: Dict[int, Optional[str]], batch_size: int = 50):
+        # Game pages are downloaded by threads and parsed by worker processes,
+        # so BeautifulSoup is not serialized by the GIL
+        pool = FetchParsePool(self._fetch_game, parse_game)
+        tasks = ((game, game['endpoint_awards'], (game['master_id'],)) for game in games)
+        
+        batch_games, batch_achievements, batch_urls = [], [], []
+        for game, parsed in pool.map(tasks):
+            if parsed is None:
+                # The game page is unchanged since the last crawl, so its data is already stored
+                dump_playstationurls[game['master_id']] = game['endpoint_awards']
+                continue
+            if isinstance(parsed, Exception):
+                LOGGER.warning(f'Failed to process the game "{game["master_id"]}". Error: {parsed}')
+                continue
+            
+            details, achievements = parsed
+            batch_games.append([game['master_id'], game['title'], game['platforms'][0]['name']] + details)
+            batch_achievements.extend(achievements)
+            batch_urls.append((game['master_id'], game['endpoint_awards']))
+            
+            if len(batch_games) >= batch_size:
+                self._insert_games(connection, batch_games, batch_achievements, batch_urls, dump_playstationurls)
+                batch_games, batch_achievements, batch_urls = [], [], []
+        
+        self._insert_games(connection, batch_games, batch_achievements, batch_urls, dump_playstationurls)
+
     def start(self):
         # Retrieve a cache of data pairs in the form of (appid, href)
         try:
@@ -79,16 +138,40 @@ class PlayStationGames(ExophaseAPI):
         except FileNotFoundError:
             dump_playstationurls = {}
         
+        failed_page = None
         previous_len = len(dump_playstationurls)
         with connect_to_database() as connection:
+            last_page = 0
             try:
                 json_content = json.loads(self._request(self.games.format(page=1)))
                 last_page = json_content.get('games', {}).get('pages', 0)
             except Exception as e:
                 LOGGER.error(e)
-            with ThreadPoolExecutor() as executor:
-                executor.map(lambda page: self.get_games(connection, page, dump_playstationurls),
-                             range(1, last_page + 1))
+                failed_page = 1
+            
+            if self.full_refresh:
+                with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                    pages = executor.map(self.get_page, range(1, last_page + 1))
+                    self.get_games(connection, (game for games in pages if games for game in games), dump_playstationurls)
+            else:
+                known_gameids = set(dump_playstationurls) | self._get_gameids(connection)
+                
+                # The archive is sorted by the date a game was added (newest first),
+                # so the crawl stops at the first page that contains only known games
+                new_games, page = [], 1
+                while page <= last_page:
+                    games = self.get_page(page, known_gameids)
+                    if games is None:
+                        # A failed page says nothing about the pages after it
+                        failed_page = page
+                        break
+                    if not games:
+                        break
+                    new_games.extend(games)
+                    page += 1
+                LOGGER.info(f'Incremental crawl stopped at page "{page}" of "{last_page}"')
+                
+                self.get_games(connection, new_games, dump_playstationurls)
         
         LOGGER.info(f'Added "{self.added_games}" new data to the table "playstation.{self.process_games}"')
         LOGGER.info(f'Added "{self.added_achievements}" new data to the table "playstation.{self.process_achievements}"')
@@ -97,16 +180,22 @@ class PlayStationGames(ExophaseAPI):
         current_len = len(dump_playstationurls)
         with open('./resources/' + CASHE_PLAYSTATIONURLS, 'wb') as file:
             pickle.dump(dump_playstationurls, file)
+        self.fingerprints.save()
         
         LOGGER.info(f'The cache containing gameid-url pairs has been updated. ' \
                     f'It previously had "{previous_len}" values, ' \
                     f'and now it contains "{current_len}" values')
+        
+        if failed_page is not None:
+            # The games found so far are stored; the runner still sees the crawl as failed
+            raise ConnectionError(f'The incremental crawl stopped at the archive page "{failed_page}", ' \
+                                  f'which could not be retrieved')
 
-def main():
+def main(full_refresh: bool = False):
     process_games, process_achievements = 'games', 'achievements'
-    LOGGER.info(f'Process started')
+    LOGGER.info(f'Process started with parameter full_refresh="{full_refresh}"')
 
-    playstation_games = PlayStationGames(process_games, process_achievements)
+    playstation_games = PlayStationGames(process_games, process_achievements, full_refresh)
 
     try:
         playstation_games.start()
@@ -119,3 +208,5 @@ def main():
         LOGGER.info(f'Added "{playstation_games.added_achievements}" new data to the table "playstation.{process_achievements}"')
         
         raise Exception(e)
+    
+    return playstation_games
@@ -3,8 +3,10 @@ from typing import Optional, List, Any
 from psycopg2 import extensions
 from bs4 import BeautifulSoup
 from pathlib import Path
-from utils.constants import MATCH_MISSING_DATA, PLAYSTATION_LOGS
+from utils.constants import (MATCH_MISSING_DATA, PLAYSTATION_LOGS,
+                             CACHE_PLAYSTATION_FINGERPRINTS, MAX_WORKERS)
 from utils.database.connector import connect_to_database
+from utils.fingerprints import FingerprintStore
 from utils.logger import configure_logger
 from scripts import ExophaseAPI
 
@@ -19,6 +21,9 @@ class PlayStationUpdateData(ExophaseAPI):
         self.truetrophies = 'https://www.truetrophies.com'
         self.search = '/searchresults.aspx?search={encoded_title}'
 
+        # Hashes of the game pages that have already been parsed
+        self.fingerprints = FingerprintStore(CACHE_PLAYSTATION_FINGERPRINTS)
+
         # Number of records updated to the 'games' table
         self.updated = 0
     
@@ -44,7 +49,7 @@ class PlayStationUpdateData(ExophaseAPI):
             return []
 
     @staticmethod
-    def _update_data(connection: extensions.connection, app: List[Any]):
+    def _update_data(connection: extensions.connection, app: List[Any]) -> bool:
         try:
             with connection.cursor() as cursor:
                 query = """
@@ -61,8 +66,11 @@ class PlayStationUpdateData(ExophaseAPI):
                     app[0]   # gameid
                 ))
                 connection.commit()
+            return True
         except Exception as e:
+            connection.rollback()
             LOGGER.warning('Failed to update the missing data. Error: %s', str(e).strip())
+            return False
 
     def get_data(self, connection: extensions.connection, app: List[Any]):
         # Encode the game title for the URL query,
@@ -73,6 +81,7 @@ class PlayStationUpdateData(ExophaseAPI):
             self.truetrophies + self.search.format(encoded_title=encoded_title))
         soup = BeautifulSoup(html_content, 'html.parser')
         
+        best_match, digest = None, None
         try:
             games = soup.find('table', class_='maintable leaderboard').find_all('tr')[1:]
             
@@ -88,6 +97,13 @@ class PlayStationUpdateData(ExophaseAPI):
             best_match = self._find_best_match(app[1], candidates.keys(), MATCH_MISSING_DATA)
             if best_match:
                 html_content = self.fetch_data(candidates[best_match])
+                # The candidate page was already parsed for this game and still has the same content,
+                # so it cannot fill in any of the missing fields. The game is part of the key, since
+                # several games (PS4/PS5 versions, editions) may match the same page
+                fingerprint_key = f'{app[0]} {candidates[best_match]}'
+                digest = self.fingerprints.changed(fingerprint_key, html_content)
+                if digest is None:
+                    return
                 soup_2 = BeautifulSoup(html_content, 'html.parser')
                 data = self.get_details(soup_2)
             else:
@@ -114,14 +130,20 @@ class PlayStationUpdateData(ExophaseAPI):
         if app[7] is None:
             app[7] = data[4]
         
-        self._update_data(connection, app)
+        # A failed update leaves the page unrecorded, so it is parsed again on the next run
+        if not self._update_data(connection, app):
+            return
         self.updated += 1
+        
+        if digest:
+            self.fingerprints.commit(fingerprint_key, digest)
             
     def start(self):
         with connect_to_database() as connection:
-            with ThreadPoolExecutor() as executor:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
                 executor.map(lambda app: self.get_data(connection, app),
                     self._get_missing(connection))
+        self.fingerprints.save()
         
         LOGGER.info(f'Updated "{self.updated}" data to the table "playstation.{self.process}"')
 
@@ -140,3 +162,5 @@ def main():
         LOGGER.info(f'Updated "{playstation_update_data.updated}" data to the table "playstation.{process}"')
         
         raise Exception(e)
+    
+    return playstation_update_data
@@ -4,7 +4,7 @@ from bs4 import BeautifulSoup
 from typing import Optional
 from pathlib import Path
 import pycountry
-from utils.constants import PLAYSTATION_SCHEMA, DATABASE_TABLES, PLAYSTATION_LOGS
+from utils.constants import PLAYSTATION_SCHEMA, DATABASE_TABLES, PLAYSTATION_LOGS, MAX_WORKERS
 from utils.database.connector import connect_to_database, insert_data
 from utils.logger import configure_logger
 from scripts import ExophaseAPI
@@ -62,7 +62,7 @@ class PlayStationPlayers(ExophaseAPI):
 
     def start(self):
         with connect_to_database() as connection:
-            with ThreadPoolExecutor() as executor:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
                 executor.map(lambda page: self.get_players(connection, page),
                              range(1, self.last_page(self.leaderboard.format(page=1)) + 1))
             
@@ -83,3 +83,5 @@ def main():
         LOGGER.info(f'Added "{playstation_players.added}" new data to the table "playstation.{process}"')
         
         raise Exception(e)
+    
+    return playstation_players
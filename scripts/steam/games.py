@@ -1,15 +1,17 @@
 from requests.exceptions import JSONDecodeError
 from psycopg2 import extensions, Error
-from typing import Optional, List, Set
+from typing import Optional, Generator, AbstractSet, Any, Dict, List, Set
 from datetime import datetime
 from decouple import config
 from pathlib import Path
 from time import sleep
 import pickle
-from utils.constants import (STEAM_SCHEMA, DATABASE_TABLES, STEAM_LOGS,
-                             CACHE_APPIDS, CACHE_ACHIEVEMENTS)
+from utils.constants import (STEAM_SCHEMA, DATABASE_TABLES, STEAM_LOGS, CACHE_APPIDS,
+                             CACHE_ACHIEVEMENTS, CACHE_APPLIST, CACHE_APPLIST_RETRIES,
+                             MAX_APPLIST_RETRIES)
 from utils.database.connector import connect_to_database, insert_data, delete_data
 from utils.fetcher import Fetcher, TooManyRequestsError, ForbiddenError
+from utils.quota import QuotaPlanner
 from utils.logger import configure_logger
 
 LOGGER = configure_logger(Path(__file__).name, STEAM_LOGS)
@@ -22,6 +24,8 @@ class SteamAchievements(Fetcher):
 
         self.achievements = 'https://api.steampowered.com/ISteamUserStats/' + \
             'GetSchemaForGame/v2/?appid={appid}&key={api_key}&cc=us'
+        # Calls to the Steam Web API are counted against the daily quota of the job
+        self.quota = QuotaPlanner(config('API_KEY')).job('steam.achievements')
 
         # Number of records added to the 'achievements' table
         self.added = 0
@@ -99,21 +103,38 @@ class SteamAchievements(Fetcher):
            
             # Retrieving all appids whose achievements are not present in our database
             appids = self._get_appids(connection, dump_achievements)
+            self.quota.demand(len(appids))
             for appid in appids:
+                if self.quota.available() == 0:
+                    LOGGER.info('The daily Steam quota of the achievements is spent')
+                    break
                 self.get_achievements(connection, appid, dump_achievements)
+            self.quota.done()
             
         LOGGER.info(f'Added "{self.added}" new data to the table "steam.{self.process}"')
 
 class SteamGames(Fetcher):
-    def __init__(self, process: str):
+    def __init__(self, process: str, full_refresh: bool = False):
         super().__init__()
         self.process = process
+        # A full refresh ignores the last-sync watermark and walks the whole catalog
+        self.full_refresh = full_refresh
 
-        self.applist = 'https://api.steampowered.com/ISteamApps/GetAppList/v0002/?format=json'
+        # IStoreService returns only apps modified after `if_modified_since`
+        # and pages the catalog, unlike ISteamApps/GetAppList which always
+        # sends every app in a single payload
+        self.applist = 'https://api.steampowered.com/IStoreService/GetAppList/v1/?key={api_key}' + \
+            '&include_games=true&include_dlc=false&include_software=false&include_videos=false' + \
+            '&include_hardware=false&max_results=50000&last_appid={last_appid}' + \
+            '&if_modified_since={modified_since}'
         self.appdetails = 'https://store.steampowered.com/api/appdetails?appids={appids}&cc=us'
         
         # Number of records added to the 'games' table
         self.added = 0
+        # Number of records updated in the 'games' table
+        self.updated = 0
+        # Appids whose data could not be stored; they are retried by the next syncs
+        self.failed: Set[int] = set()
     
     @staticmethod
     def _format_date(date: str) -> Optional[str]:
@@ -142,8 +163,86 @@ class SteamGames(Fetcher):
                 formatted_languages.append(language)
         return formatted_languages if formatted_languages else None
 
+    @staticmethod
+    def _load_watermark() -> int:
+        # UNIX-timestamp of the most recent 'last_modified' value seen during the previous sync
+        try:
+            with open('./resources/' + CACHE_APPLIST, 'rb') as file:
+                watermark = pickle.load(file)
+            
+            if not isinstance(watermark, int):
+                raise FileNotFoundError
+        except FileNotFoundError:
+            watermark = 0
+        return watermark
+
+    @staticmethod
+    def _save_watermark(watermark: int):
+        with open('./resources/' + CACHE_APPLIST, 'wb') as file:
+            pickle.dump(watermark, file)
+
+    @staticmethod
+    def _load_retries() -> Dict[int, int]:
+        # Appids that failed during previous syncs, with the number of failed attempts
+        try:
+            with open('./resources/' + CACHE_APPLIST_RETRIES, 'rb') as file:
+                retries = pickle.load(file)
+            
+            if not isinstance(retries, dict):
+                raise FileNotFoundError
+        except FileNotFoundError:
+            retries = {}
+        return retries
+
+    @staticmethod
+    def _save_retries(retries: Dict[int, int]):
+        with open('./resources/' + CACHE_APPLIST_RETRIES, 'wb') as file:
+            pickle.dump(retries, file)
+
+    @staticmethod
+    def _update_game(connection: extensions.connection, game: List[Any]) -> bool:
+        # Deleting a game that is already filled would cascade to its achievements,
+        # prices and history, so changed games are updated in place
+        with connection.cursor() as cursor:
+            query = """
+                UPDATE steam.games
+                SET title = %s, developers = %s, publishers = %s,
+                    genres = %s, supported_languages = %s, release_date = %s
+                WHERE game_id = %s;
+            """
+            try:
+                cursor.execute(query, (*game[1:], game[0]))
+                connection.commit()
+                return cursor.rowcount > 0
+            except Error:
+                connection.rollback()
+                raise
+
+    def get_applist(self, modified_since: int) -> Generator[List[Dict[str, Any]], None, None]:
+        # The catalog is consumed page by page, so at most 50,000 apps
+        # are held in memory at any moment, even during a full refresh
+        last_appid = 0
+        while True:
+            url = self.applist.format(api_key=config('API_KEY'), last_appid=last_appid,
+                                      modified_since=modified_since)
+            try:
+                json_content = self.fetch_data(url, 'json')
+            except TooManyRequestsError:
+                # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
+                sleep(301)
+                json_content = self.fetch_data(url, 'json')
+            
+            response = json_content.get('response', {})
+            apps = response.get('apps', [])
+            if apps:
+                yield apps
+            
+            if not response.get('have_more_results', False):
+                break
+            last_appid = response.get('last_appid', apps[-1]['appid'] if apps else last_appid)
+
     def get_games(self, connection: extensions.connection, appids: List[int],
-                  dump_appids: Set[Optional[int]]):
+                  dump_appids: Set[Optional[int]], changed: AbstractSet[int] = frozenset()):
         for appid in appids:
             url = self.appdetails.format(appids=appid)
             
@@ -154,6 +253,12 @@ class SteamGames(Fetcher):
                 sleep(301)
                 json_content = self.fetch_data(url, 'json')
             except JSONDecodeError:
+                if appid in changed:
+                    # A known game is never deleted, since that would cascade to its achievements,
+                    # prices and history; it is queued again by the next sync
+                    LOGGER.warning(f'No details returned for the changed appid "{appid}"')
+                    self.failed.add(appid)
+                    continue
                 # Remove fields from the database that are not present in the Steam Web API data
                 try:
                     delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], 'game_id', [[appid]])
@@ -203,27 +308,32 @@ class SteamGames(Fetcher):
                     ]]
                     
                     try:
-                        # DATABASE_TABLES[0] = 'games'
-                        # First, remove the placeholder from the database, and then insert the updated data
-                        delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], 'game_id', [[appid]])
-                        insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], game)
-                        
-                        dump_appids.add(appid)
-                        self.added += 1
+                        if appid in changed and self._update_game(connection, game[0]):
+                            dump_appids.add(appid)
+                            self.updated += 1
+                        else:
+                            # DATABASE_TABLES[0] = 'games'
+                            # First, remove the placeholder from the database, and then insert the updated data
+                            delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], 'game_id', [[appid]])
+                            insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], game)
+                            
+                            dump_appids.add(appid)
+                            self.added += 1
                     except (Error, IndexError) as e:
                         LOGGER.error(e)
                         LOGGER.warning(f'The given appid "{appid}"' \
                                        f'was not successfully inserted/deleted into the database')
-                else:
+                        self.failed.add(appid)
+                elif appid not in changed:
                     try:
                         delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], 'game_id', [[appid]])
-                    except Error:
+                    except Error as e:
                         LOGGER.warning(e)
-            else:
+            elif appid not in changed:
                 try:
                     delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], 'game_id', [[appid]])
                     dump_appids.add(appid)
-                except Error:
+                except Error as e:
                     LOGGER.warning(e)
             
             # Recording the processed game data into the dump
@@ -232,50 +342,90 @@ class SteamGames(Fetcher):
                 pickle.dump(dump_appids, file)
 
     def start(self):
-        with connect_to_database() as connection:
-            json_content = self.fetch_data(self.applist, 'json').get('applist', {}).get('apps', [])
+        # Retrieving the cache of the most recent appids data available in postgres
+        try:
+            with open('./resources/' + CACHE_APPIDS, 'rb') as file:
+                dump_appids = pickle.load(file)
             
-            # Retrieving the cache of the most recent appids data available in postgres
-            try:
-                with open('./resources/' + CACHE_APPIDS, 'rb') as file:
-                    dump_appids = pickle.load(file)
+            if not isinstance(dump_appids, set) or len(dump_appids) == 0:
+                raise FileNotFoundError
+        except FileNotFoundError:
+            dump_appids = set()
+        
+        # Without a watermark (first run) or on a full refresh the whole catalog is walked
+        watermark = 0 if self.full_refresh else self._load_watermark()
+        latest_modified = watermark
+        retries = self._load_retries()
+        
+        with connect_to_database() as connection:
+            new_appids, changed_appids = [], []
+            for apps in self.get_applist(watermark):
+                placeholders = []
+                # Retrieving a list of new games not present in our database
+                for app in apps:
+                    latest_modified = max(latest_modified, app.get('last_modified', 0))
+                    if app['appid'] not in dump_appids:
+                        if app.get('name', None):
+                            placeholders.append([app['appid'], app['name'], None, None, None, None, None])
+                            new_appids.append(app['appid'])
+                    elif watermark:
+                        # The game is already known, but its store page was modified after the last sync
+                        changed_appids.append(app['appid'])
                 
-                if not isinstance(dump_appids, set) or len(dump_appids) == 0:
-                    raise FileNotFoundError
-            except FileNotFoundError:
-                dump_appids = set()
+                try:
+                    insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], placeholders)
+                except (Error, IndexError) as e:
+                    LOGGER.error(e)
             
-            appids = []
-            # Retrieving a list of new games not present in our database
-            for app in json_content:
-                if app.get('name', None) and app['appid'] not in dump_appids:
-                    appids.append([app['appid'], app['name'], None, None, None, None, None])
+            if not watermark:
+                # This is done through the initial initialization followed by data updates,
+                # because the original JSON received from the Steam Web API
+                # lacks a clear data order structure.
+                # Placeholders left by previous runs (e.g. 'coming soon') are picked up here
+                query = """
+                    SELECT game_id
+                    FROM steam.games
+                    WHERE developers IS NULL AND
+                          publishers IS NULL AND
+                          genres IS NULL AND
+                          supported_languages IS NULL AND
+                          release_date IS NULL;
+                    """
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    new_appids = [appid[0] for appid in cursor.fetchall()]
             
-            try:
-                insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[0], appids)
-            except (Error, IndexError) as e:
-                LOGGER.error(e)
+            # Appids that failed during previous syncs are queued again,
+            # whether or not they were modified since
+            queued = set(new_appids) | set(changed_appids)
+            for appid in retries:
+                if appid in queued:
+                    continue
+                if appid in dump_appids:
+                    changed_appids.append(appid)
+                else:
+                    new_appids.append(appid)
             
-            # This is done through the initial initialization followed by data updates,
-            # because the original JSON received from the Steam Web API
-            # lacks a clear data order structure
-            query = """
-                SELECT game_id
-                FROM steam.games
-                WHERE developers IS NULL AND
-                      publishers IS NULL AND
-                      genres IS NULL AND
-                      supported_languages IS NULL AND
-                      release_date IS NULL;
-                """
-            with connection.cursor() as cursor:
-                cursor.execute(query)
-                appids = [appid[0] for appid in cursor.fetchall()]
-            self.get_games(connection, appids, dump_appids)
+            LOGGER.info(f'Catalog sync since "{watermark}": "{len(new_appids)}" new and ' \
+                        f'"{len(changed_appids)}" changed appids are queued')
+            self.get_games(connection, new_appids + changed_appids, dump_appids, set(changed_appids))
+        
+        # Failed appids are kept in the retry set instead of holding the watermark back,
+        # and are given up after MAX_APPLIST_RETRIES syncs
+        retries = {appid: retries.get(appid, 0) + 1 for appid in self.failed}
+        exhausted = [appid for appid, attempts in retries.items() if attempts >= MAX_APPLIST_RETRIES]
+        for appid in exhausted:
+            del retries[appid]
+        if self.failed:
+            LOGGER.warning(f'"{len(self.failed)}" appids failed, "{len(exhausted)}" of them ' \
+                           f'for the last time: {exhausted}')
+        self._save_retries(retries)
+        self._save_watermark(latest_modified)
         
         LOGGER.info(f'Added "{self.added}" new data to the table "steam.{self.process}"')
+        LOGGER.info(f'Updated "{self.updated}" data in the table "steam.{self.process}"')
 
-def main(process):
+def main(process, full_refresh: bool = False):
     processes = {
         'games': SteamGames,
         'achievements': SteamAchievements
@@ -284,7 +434,10 @@ def main(process):
     if process in processes:
         LOGGER.info(f'Process started with parameter process="{process}"')
         try:
-            process_class = processes[process](process)
+            if process == 'games':
+                process_class = SteamGames(process, full_refresh)
+            else:
+                process_class = processes[process](process)
             process_class.start()
         except (Exception, KeyboardInterrupt) as e:
             if str(e) == '':
@@ -293,6 +446,8 @@ def main(process):
             LOGGER.info(f'Added "{process_class.added}" new data to the table "steam.{process}"')
             
             raise Exception(e)
+        
+        return process_class
     else:
         message = f'The specified process "{process}" is not included in the available options'
         LOGGER.error(f'Process returned an error: {message}')
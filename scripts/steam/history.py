@@ -1,13 +1,17 @@
 from typing import Generator, Optional, Union, List, Set
-from concurrent.futures import ThreadPoolExecutor
 from psycopg2 import Error, extensions
 from datetime import datetime
 from decouple import config
 from pathlib import Path
+import threading
 from utils.database.connector import connect_to_database, insert_data, delete_data
-from utils.constants import STEAM_SCHEMA, DATABASE_TABLES, STEAM_LOGS
-from utils.fetcher import Fetcher, ForbiddenError
+from utils.constants import STEAM_SCHEMA, DATABASE_TABLES, STEAM_LOGS, VISIBILITY_TTL
+from utils.fetcher import Fetcher, ForbiddenError, QuotaExceededError
+from utils.quota import QuotaPlanner
+from utils.workers import TaskGraph, TaskGroup
+from utils.catalog import CatalogCache
 from utils.logger import configure_logger
+from scripts.steam.visibility import ProfileVisibility
 
 LOGGER = configure_logger(Path(__file__).name, STEAM_LOGS)
 
@@ -23,20 +27,38 @@ class SteamHistory(Fetcher):
         self.achievements = self.steam + 'ISteamUserStats/GetPlayerAchievements/v0001/?appid={appid}&key={api_key}&steamid={steamid}'
         self.new_achievements = self.steam + 'ISteamUserStats/GetSchemaForGame/v2/?appid={appid}&key={api_key}&cc=us'
 
+        # Calls to the Steam Web API are counted against the daily quota of the job
+        self.quota = QuotaPlanner(config('API_KEY')).job('steam.history')
+
+        # Guards the counters updated by the worker threads
+        self._lock = threading.Lock()
+        # Serializes the database writes of the worker threads: they share one connection,
+        # so a rollback of one insert would otherwise discard the rows of another
+        self._write_lock = threading.Lock()
+
         # Number of records added to the 'history' table
         self.added_history = 0
          # Number of records added to the 'library' table
         self.added_library = 0
+        # Number of GetPlayerAchievements calls made and skipped for never played games
+        self.fetched_calls = 0
+        self.skipped_calls = 0
+        # Number of players skipped because their profile is private
+        self.skipped_private = 0
     
     @staticmethod
     def _get_steamids(connection: extensions.connection) -> List[str]:
         # Retrieve data for players with no game history
         with connection.cursor() as cursor:
             # ORDER BY RANDOM() - for a representative sample
-            query = """
-                SELECT player_id
-                FROM steam.players
-                WHERE player_id NOT IN (SELECT player_id FROM steam.purchased_games)
+            # Profiles known to be private are left out until their visibility expires
+            query = f"""
+                SELECT p.player_id
+                FROM steam.players p
+                WHERE p.player_id NOT IN (SELECT player_id FROM steam.purchased_games) AND
+                      NOT EXISTS (SELECT 1 FROM steam.profile_visibility v
+                                  WHERE v.player_id = p.player_id AND NOT v.visible AND
+                                        v.checked > NOW() - INTERVAL '{VISIBILITY_TTL} days')
                 ORDER BY RANDOM();
             """
             cursor.execute(query)
@@ -69,19 +91,61 @@ class SteamHistory(Fetcher):
         for i in range(0, len(appids), batch_size):
             yield appids[i:i + batch_size]
 
+    def _refresh_game(self, connection: extensions.connection, appid: int) -> Optional[List[str]]:
+        # Re-reads the achievement schema of a game that has new achievements
+        new_achievements_url = self.new_achievements.format(appid=appid, api_key=config('API_KEY'))
+        try:
+            json_content = self.fetch_data(new_achievements_url, 'json')
+        except Exception as e:
+            LOGGER.warning(f'Failed to retrieve the achievements of the game "{appid}". Error: {e}')
+            return None
+        
+        new_achievements = []
+        stats = json_content.get('game', {}).get('availableGameStats', {})
+        for new_achievement in stats.get('achievements', []):
+            new_achievements.append([
+                f"{appid}_{new_achievement['name']}",
+                appid,
+                new_achievement['displayName'],
+                new_achievement.get('description', None)
+            ])
+        if not new_achievements:
+            # The schema lists no achievements, there is nothing to store
+            return []
+        
+        try:
+            # DATABASE_TABLES[1] = 'achievements'
+            with self._write_lock:
+                insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[1], new_achievements)
+        except Error as e:
+            LOGGER.error(f'Failed to add new achievement data. Error: {e}')
+            return None
+        return [achievement[0] for achievement in new_achievements]
+
     def get_data_from_steam(self,
+                            group: TaskGroup,
                             connection: extensions.connection,
                             steamid: str,
                             owned_games: List[Optional[int]],
                             library: List[Optional[int]],
                             game_achievements: List[Optional[int]],
                             appids: Set[int],
-                            db_achievements: Set[str]):
+                            catalog: CatalogCache):
         for game in owned_games:
             appid = game['appid']
             # If the purchased game by the user exists in our database,
             # retrieve their game statistics
             if appid in appids:
+                # A game that has never been launched has no earned achievements,
+                # so the GetPlayerAchievements call is skipped
+                if not game.get('playtime_forever', 0):
+                    with self._lock:
+                        self.skipped_calls += 1
+                    library.append(appid)
+                    continue
+                
+                with self._lock:
+                    self.fetched_calls += 1
                 try:
                     achievements_steamid = self.achievements.format(appid=appid,
                                                                     api_key=config('API_KEY'),
@@ -89,80 +153,81 @@ class SteamHistory(Fetcher):
                     json_content = self.fetch_data(achievements_steamid, 'json')
                 except ForbiddenError:
                     # The player's profile is not private, but the game statistics are hidden
-                    library.clear()
+                    group.state['hidden'] = True
                     return
                 
                 achievements = json_content.get('playerstats', {}).get('achievements', [])
                 for achievement in achievements:
-                    check = True
                     achievement_id = f"{appid}_{achievement['apiname']}"
                     
-                    # Select only the data where the player has earned an achievement
-                    if achievement['achieved']:
-                        # If the user has earned an achievement that is not in the database, 
-                        # update the game's achievement data (related to newly added achievements)
-                        if achievement_id not in db_achievements:
-                            new_achievements_url = self.new_achievements(appid=appid, api_key=config('API_KEY'))
-                            json_content = self.fetch_data(new_achievements_url, 'json')
-                            
-                            new_achievements = []
-                            for new_achievement in json_content.get('game', {}).get('achievements', []):
-                                new_achievements.append([
-                                    f"{appid}_{new_achievement['name']}",
-                                    appid,
-                                    new_achievement['displayName'],
-                                    new_achievement.get('description', None)
-                                ])
-                            
-                            try:
-                                # DATABASE_TABLES[1] = 'achievements'
-                                insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[1], new_achievements)
-                            except Error as e:
-                                LOGGER.error(f'Failed to add new achievement data. Error: {e}')
-                                check = False
-                        
-                        # If the data aligns with the rest of the table data, 
-                        # update the achievement list
-                        if check:    
-                            game_achievements.append([
-                                steamid,
-                                achievement_id,
-                                self._format_timestamp(achievement['unlocktime'])
-                            ])
+                    # Select only the data where the player has earned an achievement.
+                    # If it is not in the database, the catalog updates the game's
+                    # achievement data once per run (related to newly added achievements)
+                    if achievement['achieved'] and catalog.ensure(appid, achievement_id):
+                        game_achievements.append([
+                            steamid,
+                            achievement_id,
+                            self._format_timestamp(achievement['unlocktime'])
+                        ])
             library.append(appid)
 
-    def get_achievement_history(self, connection: extensions.connection,
-                                steamid: str, appids: Set[int],
-                                achievementids: Set[str]):
+    def get_achievement_history(self, group: TaskGroup, connection: extensions.connection,
+                                steamid: str, appids: Set[int], catalog: CatalogCache,
+                                library: List[Optional[int]], game_achievements: List[Optional[List[str]]]):
         try:
             owned_games_url = self.owned_games.format(api_key=config('API_KEY'), steamid=steamid)
             json_content = self.fetch_data(owned_games_url, 'json')
         except ForbiddenError:
             # Private profiles
-            # DATABASE_TABLE[4] = 'purchased_games'
-            insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[4], [[steamid, None]])
+            group.state['private'] = True
             return
         
         owned_games = json_content.get('response', {}).get('games', [])
-        library, game_achievements = [], []
+        # Batches of the player's games are processed on the shared pool
+        for batch in self._create_batches(owned_games):
+            group.spawn(self.get_data_from_steam, connection, steamid, batch, library,
+                        game_achievements, appids, catalog)
+
+    def _flush(self, group: TaskGroup, connection: extensions.connection,
+               library: List[Optional[int]], game_achievements: List[Optional[List[str]]]):
+        steamid = group.key
+        if group.errors:
+            # The player is not marked as processed and is retried on the next run
+            LOGGER.warning(f'Failed to process the player "{steamid}". Error: {group.errors[0]}')
+            return
+        
+        # The inserts of a player are written together
+        with self._write_lock:
+            self._write_player(connection, steamid, group, library, game_achievements)
 
-        with ThreadPoolExecutor() as executor:
-            executor.map(lambda batches: self.get_data_from_steam(
-                connection, steamid, batches, library,
-                game_achievements, appids, achievementids
-            ), self._create_batches(owned_games))
+    def _write_player(self, connection: extensions.connection, steamid: str, group: TaskGroup,
+                      library: List[Optional[int]], game_achievements: List[Optional[List[str]]]):
+        if group.state.get('private', False):
+            try:
+                # Private profiles are marked as processed without a library
+                # DATABASE_TABLE[4] = 'purchased_games'
+                insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[4], [[steamid, None]])
+            except Error as e:
+                LOGGER.error(e)
+            return
         
-        if not library:
+        if not library or group.state.get('hidden', False):
             library = None
         
-        # DATABASE_TABLE[4] = 'purchased_games'
-        insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[4], [[steamid, library]])
-        self.added_library += 1
+        try:
+            # DATABASE_TABLE[4] = 'purchased_games'
+            insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[4], [[steamid, library]])
+            with self._lock:
+                self.added_library += 1
+        except Error as e:
+            LOGGER.error(e)
+            return
         
         try:
             # DATABASE_TABLES[3] = 'history'
             insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[3], game_achievements)
-            self.added_history += len(game_achievements)
+            with self._lock:
+                self.added_history += len(game_achievements)
         except IndexError:
             # We reach this point if the player has games,
             # but achievements in all of them are either not earned or missing
@@ -171,7 +236,8 @@ class SteamHistory(Fetcher):
             # If the data was not inserted due to an error,
             # remove the player_id from the processed list
             delete_data(connection, STEAM_SCHEMA, DATABASE_TABLES[4], 'player_id', [[steamid]])
-            self.added_library -= 1
+            with self._lock:
+                self.added_library -= 1
             LOGGER.error(e)
 
     def start(self):
@@ -180,11 +246,52 @@ class SteamHistory(Fetcher):
             appids = self._get_appids_achievements(connection, 'games')
             achievementids = self._get_appids_achievements(connection, 'achievements')
             
-            for steamid in steamids:
-                self.get_achievement_history(connection, steamid, appids, achievementids)
+            catalog = CatalogCache(achievementids, lambda appid: self._refresh_game(connection, appid))
+            
+            # One GetPlayerSummaries call per 100 players replaces
+            # a failing GetOwnedGames call for every private profile
+            visibility = ProfileVisibility()
+            visibility.quota = self.quota
+            visibility.lock = self._write_lock
+            
+            # Players are crawled concurrently on a single pool, and every batch
+            # of a player's games is a separate task followed by the player's insert
+            try:
+                with TaskGraph() as graph:
+                    for chunk in self._create_batches(steamids, 1000):
+                        # The crawl yields once its share of the daily quota is spent,
+                        # the remaining players are processed on the next run
+                        if self.quota.available() == 0:
+                            LOGGER.info('The daily Steam quota of the history crawl is spent')
+                            break
+                        
+                        try:
+                            visibility.refresh(connection, chunk)
+                        except QuotaExceededError:
+                            LOGGER.info('The daily Steam quota of the history crawl is spent')
+                            break
+                        
+                        for steamid in chunk:
+                            if visibility.is_private(steamid):
+                                # The player stays unprocessed and is checked again after the TTL
+                                self.skipped_private += 1
+                                continue
+                            
+                            library, game_achievements = [], []
+                            graph.submit(steamid, self.get_achievement_history, connection, steamid,
+                                         appids, catalog, library, game_achievements,
+                                         on_done=lambda group, library=library, game_achievements=game_achievements:
+                                             self._flush(group, connection, library, game_achievements))
+            finally:
+                # The calls made so far are reported even if the crawl stopped on an error
+                self.quota.done()
         
         LOGGER.info(f'Added "{self.added_history}" new data to the table "steam.{self.process_history}"')
         LOGGER.info(f'Added "{self.added_library}" new data to the table "steam.{self.process_library}"')
+        LOGGER.info(f'Requested achievements for "{self.fetched_calls}" games, ' \
+                    f'skipped "{self.skipped_calls}" never played games')
+        LOGGER.info(f'Skipped "{self.skipped_private}" private profiles')
+        LOGGER.info(f'Refreshed the achievements of "{catalog.refreshes}" games')
 
 def main():
     process_history, process_library = 'history', 'purchased_games'
@@ -202,3 +309,5 @@ def main():
         LOGGER.info(f'Added "{steam_history.added_library}" new data to the table "steam.{process_library}"')
         
         raise Exception(e)
+    
+    return steam_history
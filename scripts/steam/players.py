@@ -9,11 +9,15 @@ from time import sleep
 import pycountry
 import pickle
 import re
-from utils.constants import (STEAM_SCHEMA, DATABASE_TABLES,
-                             STEAM_LOGS, CASHE_PLAYERS)
+from utils.constants import (STEAM_SCHEMA, DATABASE_TABLES, STEAM_LOGS,
+                             CASHE_PLAYERS, CACHE_FRONTIER, MAX_WORKERS, VISIBILITY_TTL)
 from utils.fetcher import Fetcher, TooManyRequestsError, ForbiddenError
+from utils.quota import QuotaPlanner
 from utils.database.connector import connect_to_database, insert_data
+from utils.workers import TaskGraph, TaskGroup
+from utils.frontier import Frontier
 from utils.logger import configure_logger
+from scripts.steam.visibility import ProfileVisibility
 
 LOGGER = configure_logger(Path(__file__).name, STEAM_LOGS)
 
@@ -31,6 +35,9 @@ class SteamReviews(Fetcher):
         self.steam = 'https://api.steampowered.com/ISteamUser/'
         self.user_data = self.steam + 'GetPlayerSummaries/v0002/?key={api_key}&steamids={steamids}'
         self.reviews = '{player_url}recommended/?p={page}'
+        self.visibility = ProfileVisibility()
+        # GetPlayerSummaries calls are counted against the daily quota of the job
+        self.quota = QuotaPlanner(config('API_KEY')).job('steam.reviews')
 
         # Number of records added to the 'reviews' table
         self.added = 0
@@ -43,11 +50,15 @@ class SteamReviews(Fetcher):
             # they later add a new review, we will no longer be able to
             # insert the new information into the database
             with connection.cursor() as cursor:
-                query = """
+                # Profiles known to be private are left out until their visibility expires
+                query = f"""
                     SELECT p.player_id
                     FROM steam.players p
                     WHERE NOT EXISTS (SELECT 1 FROM steam.reviews r WHERE r.player_id = p.player_id) AND
-                          NOT EXISTS (SELECT 1 FROM steam.private_steamids ps WHERE ps.player_id = p.player_id);
+                          NOT EXISTS (SELECT 1 FROM steam.private_steamids ps WHERE ps.player_id = p.player_id) AND
+                          NOT EXISTS (SELECT 1 FROM steam.profile_visibility v
+                                      WHERE v.player_id = p.player_id AND NOT v.visible AND
+                                            v.checked > NOW() - INTERVAL '{VISIBILITY_TTL} days');
                 """
                 cursor.execute(query)
                 return [steamid[0] for steamid in cursor.fetchall()]
@@ -84,6 +95,12 @@ class SteamReviews(Fetcher):
             construct_date = f'{date[-2]} {date[-1]} {datetime.now().year}'
             return datetime.strptime(construct_date, "%d %B %Y")
 
+    @staticmethod
+    def _log_errors(group: TaskGroup):
+        if group.errors:
+            LOGGER.warning(f'Failed to retrieve the reviews of the player "{group.key}". ' \
+                           f'Error: {group.errors[0]}')
+
     def get_reviews(self, connection: extensions.connection, steamid: str,
                           player_url: str, gameids: Set[int]):
         page, user_reviews = 1, []
@@ -144,7 +161,8 @@ class SteamReviews(Fetcher):
         except Error as e:
             LOGGER.warning(e)
         except IndexError as e:
-            # The player's data is either hidden, or the player has not written any reviews
+            # The player has not written any reviews. Private profiles are
+            # filtered out beforehand and are tracked in 'profile_visibility'
             # DATABASE_TABLES[8] = 'private_steamids'
             insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[8], [[steamid]])
 
@@ -153,25 +171,37 @@ class SteamReviews(Fetcher):
             gameids = self.get_gameids(connection)
             steamids = self.get_steamids(connection)
 
-            for batch in _create_batches(steamids):
-                steamids = self.user_data.format(api_key=config('API_KEY'), steamids=','.join(batch))
-                try:
-                    json_content = self.fetch_data(steamids, 'json')
-                except TooManyRequestsError:
-                    # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
-                    sleep(301)
-                    # Sometimes throws TooManyRequestsError,
-                    # which is handled in an external try-except block
-                    json_content = self.fetch_data(steamids, 'json')
+            with TaskGraph() as graph:
+                for batch in _create_batches(steamids):
+                    if self.quota.available() == 0:
+                        LOGGER.info('The daily Steam quota of the reviews crawl is spent')
+                        break
+                    
+                    steamids = self.user_data.format(api_key=config('API_KEY'), steamids=','.join(batch))
+                    try:
+                        json_content = self.fetch_data(steamids, 'json')
+                    except TooManyRequestsError:
+                        # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
+                        sleep(301)
+                        # Sometimes throws TooManyRequestsError,
+                        # which is handled in an external try-except block
+                        json_content = self.fetch_data(steamids, 'json')
 
-                profiles = [(players['profileurl'], players['steamid'])
-                            for players in json_content.get('response', {}).get('players', [])]
+                    # The summaries also refresh the visibility cache; private profiles
+                    # are skipped instead of paging an empty recommendations page
+                    players = json_content.get('response', {}).get('players', [])
+                    self.visibility.record(connection, players)
+                    profiles = [(player['profileurl'], player['steamid']) for player in players
+                                if not self.visibility.is_private(player['steamid'])]
 
-                with ThreadPoolExecutor() as executor:
-                    # profile[0] - steamurl, profile[1] - steamid
-                    executor.map(lambda profile: 
-                                 self.get_reviews(connection, profile[1], profile[0], gameids), profiles)
+                    # Review pages of a player are crawled on a pool shared by all batches,
+                    # so the next batch is requested while the previous one is still running
+                    for steamurl, steamid in profiles:
+                        graph.submit(steamid, lambda group, steamid=steamid, steamurl=steamurl:
+                                     self.get_reviews(connection, steamid, steamurl, gameids),
+                                     on_done=self._log_errors)
             
+            self.quota.done()
             LOGGER.info(f'Added "{self.added}" new data to the table "steam.{self.process}"')
 
 class SteamPlayers(Fetcher):
@@ -183,6 +213,9 @@ class SteamPlayers(Fetcher):
         self.steam = 'https://api.steampowered.com/ISteamUser/'
         self.user_data = self.steam + 'GetPlayerSummaries/v0002/?key={api_key}&steamids={steamids}'
         self.friends = self.steam + 'GetFriendList/v0001/?key={api_key}&steamid={steamid}&relationship=friend'
+        self.visibility = ProfileVisibility()
+        # Calls to the Steam Web API are counted against the daily quota of the job
+        self.quota = QuotaPlanner(config('API_KEY')).job('steam.players')
         
         # Number of records added to the 'players' table
         self.added = 0
@@ -204,109 +237,130 @@ class SteamPlayers(Fetcher):
             return datetime.fromtimestamp(timestamp)
         return None
 
-    def start(self):
-        with connect_to_database() as connection:
-            # Initial steamids collected from different sections of Steam
-            # and various game categories
-            try:
-                with open('./resources/' + CASHE_PLAYERS, 'rb') as file:
-                    steamids = pickle.load(file)
-                if not isinstance(steamids, list) or len(steamids) == 0:
-                    raise FileNotFoundError
-            except FileNotFoundError:
-                steamids = [
-                    '76561198039237628', '76561198029302470', '76561198025633383',
-                    '76561198196298282', '76561198117967228', '76561198080218537',
-                    '76561198146253210', '76561197970417960', '76561198083134207', 
-                    '76561197972971221', '76561197990056992', '76561198043902016'
-                ]
-            
-            # The snowball method is used
-            # Tracking processed steamids
-            visited_steamids = set()
-            while steamids and self.added != 4e6:
-                for batch in _create_batches(steamids):
-                    steamids_url = self.user_data.format(api_key=config('API_KEY'), steamids=','.join(batch))
-                    
-                    try:
-                        json_content = self.fetch_data(steamids_url, 'json')
-                    except TooManyRequestsError:
-                        # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
-                        sleep(301)
-                        json_content = self.fetch_data(steamids_url, 'json')
-                    
-                    players = []
-                    for player in json_content.get('response', {}).get('players', []):
-                        players.append([
-                            player['steamid'],
-                            self._format_country(player.get('loccountrycode', None)),
-                            self._format_timestamp(player.get('timecreated', None))
-                        ])
-
-                    try:
-                        # DATABASE_TABLES[2] = 'players'
-                        insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[2], players)
-                        self.added += len(players)
-                    except Error as e:
-                        LOGGER.error(e)
-                    except IndexError as e:
-                        LOGGER.warning(e)
-                    
-                    visited_steamids.update(batch)
+    @staticmethod
+    def _get_crawled(connection: extensions.connection) -> List[str]:
+        # Players whose friend lists are already stored
+        try:
+            with connection.cursor() as cursor:
+                query = """
+                    SELECT player_id
+                    FROM steam.friends;
+                """
+                cursor.execute(query)
+                return [steamid[0] for steamid in cursor.fetchall()]
+        except Exception as e:
+            LOGGER.error(f'Failed to retrieve the list of crawled players. Error: {e}')
+            return []
 
-                # Initially, steamids contains the complete list of users
-                # Rewriting steamids with successfully processed ones
-                steamids = [player[0] for player in players]
-                batches = _create_batches(steamids)
+    def _seed(self, connection: extensions.connection, frontier: Frontier):
+        # Initial steamids collected from different sections of Steam
+        # and various game categories, or the frontier pickled by earlier versions
+        try:
+            with open('./resources/' + CASHE_PLAYERS, 'rb') as file:
+                steamids = pickle.load(file)
+            if not isinstance(steamids, list) or len(steamids) == 0:
+                raise FileNotFoundError
+        except FileNotFoundError:
+            steamids = [
+                '76561198039237628', '76561198029302470', '76561198025633383',
+                '76561198196298282', '76561198117967228', '76561198080218537',
+                '76561198146253210', '76561197970417960', '76561198083134207', 
+                '76561197972971221', '76561197990056992', '76561198043902016'
+            ]
+        
+        frontier.done(self._get_crawled(connection))
+        frontier.push(steamids)
 
-                # Clearing the list because it will store data only
-                # about the friends from the first batch (to avoid overloading the process)
-                steamids = []
-                for batch in batches:
-                    total_friends = []
-                    # Iterating through each user
-                    for steamid in batch:
-                        friends_url = self.friends.format(api_key=config('API_KEY'), steamid=steamid)
-                        try:
-                            json_content = self.fetch_data(friends_url, 'json')
-                        except TooManyRequestsError:
-                            # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
-                            sleep(301)
-                            json_content = self.fetch_data(friends_url, 'json')
-                        except ForbiddenError:
-                            # The player's profile or data is hidden
-                            total_friends.append([steamid, None])
-                            continue
-                        
-                        friends = []
-                        for friend in json_content.get('friendslist', {}).get('friends', []):
-                            friendid = friend['steamid']
-                            # Eliminating potential loops
-                            if friendid not in visited_steamids:
-                                steamids.append(friendid)
-                            friends.append(friendid)
-                        
-                        if not friends:
-                            total_friends.append([steamid, None])
-                        else:
-                            total_friends.append([steamid, friends])
-                        
-                    try:
-                        # DATABASE_TABLES[7] = 'friends'
-                        insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[7], total_friends)
-                        # Updating the counter for successful user processing
-                        self.added_friends += len(total_friends)
-                    except Error as e:
-                        LOGGER.error(e)
-                    except IndexError as e:
-                        LOGGER.warning(e)
+    def _get_friends(self, steamid: str) -> Optional[List[str]]:
+        if self.visibility.is_private(steamid):
+            return None
+        
+        friends_url = self.friends.format(api_key=config('API_KEY'), steamid=steamid)
+        try:
+            json_content = self.fetch_data(friends_url, 'json')
+        except TooManyRequestsError:
+            # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
+            sleep(301)
+            json_content = self.fetch_data(friends_url, 'json')
+        except ForbiddenError:
+            # The player's profile or data is hidden
+            return None
+        
+        friends = [friend['steamid'] for friend in json_content.get('friendslist', {}).get('friends', [])]
+        return friends or None
 
-                    with open('./resources/' + CASHE_PLAYERS, 'wb') as file:
-                        pickle.dump(steamids, file)
+    def start(self):
+        frontier = Frontier(CACHE_FRONTIER)
+        with connect_to_database() as connection, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            if frontier.is_empty():
+                self._seed(connection, frontier)
+            
+            # The snowball method is used. The frontier and the visited set are kept
+            # on disk, so a restart continues from the players with the most known friends
+            while self.added < 4e6:
+                batch = frontier.peek(100)
+                if not batch:
+                    break
+                # A batch takes one summaries call and up to a hundred friend lists
+                if self.quota.available() <= len(batch):
+                    LOGGER.info('The daily Steam quota of the players crawl is spent')
                     break
+                
+                steamids_url = self.user_data.format(api_key=config('API_KEY'), steamids=','.join(batch))
+                try:
+                    json_content = self.fetch_data(steamids_url, 'json')
+                except TooManyRequestsError:
+                    # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
+                    sleep(301)
+                    json_content = self.fetch_data(steamids_url, 'json')
+                
+                summaries = json_content.get('response', {}).get('players', [])
+                players = []
+                for player in summaries:
+                    players.append([
+                        player['steamid'],
+                        self._format_country(player.get('loccountrycode', None)),
+                        self._format_timestamp(player.get('timecreated', None))
+                    ])
+
+                try:
+                    # DATABASE_TABLES[2] = 'players'
+                    insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[2], players)
+                    self.added += len(players)
+                except Error as e:
+                    LOGGER.error(e)
+                except IndexError as e:
+                    LOGGER.warning(e)
+                
+                self.visibility.record(connection, summaries)
+                
+                # Friend lists of the whole batch are requested concurrently;
+                # the adaptive limiter keeps the calls within the Steam rate limit.
+                # Private profiles have no visible friend list, so no call is made
+                steamids = [player[0] for player in players]
+                total_friends = [[steamid, friends] for steamid, friends
+                                 in zip(steamids, executor.map(self._get_friends, steamids))]
+                
+                try:
+                    # DATABASE_TABLES[7] = 'friends'
+                    insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[7], total_friends)
+                    # Updating the counter for successful user processing
+                    self.added_friends += len(total_friends)
+                except Error as e:
+                    LOGGER.error(e)
+                except IndexError as e:
+                    LOGGER.warning(e)
+                
+                for _, friends in total_friends:
+                    if friends:
+                        frontier.push(friends)
+                frontier.done(batch)
             
+            self.quota.done()
             LOGGER.info(f'Added "{self.added}" new data to the table "steam.{self.process}"')
             LOGGER.info(f'Added "{self.added_friends}" new data to the table "steam.{self.process_friends}"')
+            LOGGER.info(f'The frontier contains "{len(frontier)}" players')
+        frontier.close()
 
 def main(process):
     processes = {
@@ -329,6 +383,8 @@ def main(process):
                 LOGGER.info(f'Added "{process_class.added_friends}" new data to the table "steam.friends"')
             
             raise Exception(e)
+        
+        return process_class
     else:
         message = f'The specified process "{process}" is not included in the available options'
         LOGGER.error(f'Process returned an error: {message}')
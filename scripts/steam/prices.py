@@ -1,13 +1,13 @@
-from typing import Optional, Generator, List
+from typing import Optional, Generator, Any, Dict, List
 from psycopg2 import extensions, Error
-from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
 from time import sleep
-from utils.constants import (STEAM_SCHEMA, DATABASE_TABLES,
-                             STEAM_LOGS, CURRENCY)
-from utils.database.connector import connect_to_database, insert_data
+from utils.constants import STEAM_SCHEMA, STEAM_LOGS, CURRENCY, PRICE_BUDGET
+from utils.database.connector import connect_to_database
+from utils.database.prices import insert_prices, due_games
 from utils.fetcher import Fetcher, TooManyRequestsError
+from utils.regions import RegionRows, fetch_regions
 from utils.logger import configure_logger
 
 LOGGER = configure_logger(Path(__file__).name, STEAM_LOGS)
@@ -31,16 +31,9 @@ class SteamPrices(Fetcher):
 
     def _get_appids(self, connection: extensions.connection) -> List[Optional[int]]:
         try:
-            with connection.cursor() as cursor:
-                query = f"""
-                    SELECT game_id
-                    FROM steam.games
-                    WHERE game_id NOT IN (SELECT game_id
-                                          FROM steam.prices
-                                          WHERE date_acquired = '{self._current_data()}');
-                """
-                cursor.execute(query)
-                return [appid[0] for appid in cursor.fetchall()]
+            # One request prices 100 games in a single currency
+            cost = len(CURRENCY['steam']) / 100
+            return due_games(connection, STEAM_SCHEMA, self._current_data(), PRICE_BUDGET['steam'], cost)
         except Exception as e:
             LOGGER.error('Failed to retrieve the list of appids from the database. ' \
                          'Error: %s', str(e).strip())
@@ -51,49 +44,75 @@ class SteamPrices(Fetcher):
         current_date = datetime.now()
         return current_date.strftime('%Y-%m-%d')
 
-    def get_prices(self, connection: extensions.connection, appids: List[int]):
-        prices = defaultdict(list)
-        # Constructing a string of 100 appids in a single request
-        query = ','.join(map(str, appids))
+    def _fetch_prices(self, prices_url: str) -> Dict[str, Any]:
+        try:
+            return self.fetch_data(prices_url, 'json')
+        except TooManyRequestsError:
+            # 429 is returned by SteamWebAPI due 
+            # to the rate limit of requests within a 5-minute window
+            sleep(301)
+            return self.fetch_data(prices_url, 'json')
 
-        for currency in CURRENCY['steam']:
-            prices_url = self.prices.format(appids=query, currency=currency)
-            try:
-                json_content = self.fetch_data(prices_url, 'json')
-            except TooManyRequestsError:
-                # 429 is returned by SteamWebAPI due 
-                # to the rate limit of requests within a 5-minute window
-                sleep(301)
-                json_content = self.fetch_data(prices_url, 'json')
+    def get_prices(self, connection: extensions.connection, appids: List[int],
+                   batch_size: int = 100):
+        # Every (batch, currency) request is fired concurrently. A row is written
+        # once all currencies of the game have been resolved; a failed currency is left empty
+        # (or keeps its last known price in the 'intervals' storage)
+        rows = RegionRows('steam')
+        requests = []
+        for batch in self._create_batches(appids):
+            # Constructing a string of 100 appids in a single request
+            query = ','.join(map(str, batch))
+            # Every game of the batch expects the same currencies
+            for appid in batch:
+                regions = rows.expect(appid)
+            for index, currency in regions:
+                requests.append(((tuple(batch), index),
+                                 self.prices.format(appids=query, currency=currency)))
+        
+        prices = []
+        for (batch, index), json_content in fetch_regions(self._fetch_prices, requests):
+            if isinstance(json_content, Exception):
+                LOGGER.warning(f'Failed to retrieve the prices in "{rows.regions[index]}". ' \
+                               f'Error: {json_content}')
             
-            for appid in appids:
-                try:
-                    # The value in JSON is without symbols. For example, 1400 = 14 USD
-                    price = json_content.get(str(appid), {}).get(
-                        'data', {}).get('price_overview', {}).get('final', None) / 100
-                except (TypeError, AttributeError):
-                    price = None
+            for appid in batch:
+                price = json_content
+                if not isinstance(price, Exception):
+                    try:
+                        # The value in JSON is without symbols. For example, 1400 = 14 USD
+                        price = json_content.get(str(appid), {}).get(
+                            'data', {}).get('price_overview', {}).get('final', None) / 100
+                    except (TypeError, AttributeError):
+                        price = None
                 
-                prices[appid].append(price)
+                resolved = rows.resolve(appid, index, price)
+                if resolved is not None:
+                    # Collecting the retrieved data in the required format for the table
+                    row, failed = resolved
+                    prices.append([appid] + row + [self._current_data(), failed])
+            
+            if len(prices) >= batch_size:
+                self._insert_prices(connection, prices)
+                prices = []
         
-        # Collecting the retrieved data in the required format for the table
-        prices = [
-            [appid] + currency + [self._current_data()]
-            for appid, currency in prices.items()
-        ]
+        self._insert_prices(connection, prices)
+
+    def _insert_prices(self, connection: extensions.connection, prices: List[List[Any]]):
+        if not prices:
+            return
         
         try:
-            # DATABASE_TABLES[5] = 'prices'
-            insert_data(connection, STEAM_SCHEMA, DATABASE_TABLES[5], prices)
-            self.added += len(prices)
+            # Only changed prices produce new rows
+            self.added += len(insert_prices(connection, STEAM_SCHEMA, prices))
         except (Error, IndexError) as e:
             LOGGER.error(f'Data for "{self._current_data()}" was not successfully inserted. ')
             LOGGER.error(e)
 
     def start(self):
         with connect_to_database() as connection:
-            for appids in self._create_batches(self._get_appids(connection)):
-                self.get_prices(connection, appids)
+            # Store calls do not take the Web API key, so they are not part of the daily quota
+            self.get_prices(connection, self._get_appids(connection))
 
             LOGGER.info(f'Added "{self.added}" new data to the table "steam.{self.process}"')
 
@@ -111,3 +130,5 @@ def main():
         LOGGER.info(f'Added "{steam_prices.added}" new data to the table "steam.{process}"')
         
         raise Exception(e)
+    
+    return steam_prices
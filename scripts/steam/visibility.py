@@ -0,0 +1,108 @@
+from typing import Generator, Any, Dict, List
+from psycopg2 import extensions
+from decouple import config
+from pathlib import Path
+from time import sleep
+import threading
+from utils.fetcher import Fetcher, TooManyRequestsError
+from utils.constants import STEAM_LOGS, VISIBILITY_TTL
+from utils.logger import configure_logger
+
+LOGGER = configure_logger(Path(__file__).name, STEAM_LOGS)
+
+
+def _create_batches(steamids: List[str], batch_size: int = 100) -> Generator[List[str], None, None]:
+    for i in range(0, len(steamids), batch_size):
+        yield steamids[i:i + batch_size]
+
+
+class ProfileVisibility(Fetcher):
+    def __init__(self):
+        """
+        Cache of Steam profile visibility kept in 'steam.profile_visibility'.
+        Entries older than VISIBILITY_TTL days are checked again, so profiles
+        that become public are crawled on a later run
+        """
+        super().__init__()
+        self.user_data = 'https://api.steampowered.com/ISteamUser/' + \
+            'GetPlayerSummaries/v0002/?key={api_key}&steamids={steamids}'
+
+        # Fresh visibility of the players looked up during this run
+        self._visible: Dict[str, bool] = {}
+        # Number of GetPlayerSummaries calls made by refresh()
+        self.requests = 0
+        # Held around the queries, so a caller sharing the connection
+        # with its worker threads can hand over its own write lock
+        self.lock = threading.Lock()
+
+    def load(self, connection: extensions.connection, steamids: List[str]):
+        # Reads the fresh entries of the given players
+        try:
+            with self.lock, connection.cursor() as cursor:
+                query = f"""
+                    SELECT player_id, visible
+                    FROM steam.profile_visibility
+                    WHERE player_id = ANY(%s) AND
+                          checked > NOW() - INTERVAL '{VISIBILITY_TTL} days';
+                """
+                cursor.execute(query, (steamids,))
+                self._visible.update(dict(cursor.fetchall()))
+        except Exception as e:
+            LOGGER.error(f'Failed to retrieve the profile visibility. Error: {e}')
+
+    def record(self, connection: extensions.connection, players: List[Dict[str, Any]]):
+        """
+        Stores the visibility reported by a GetPlayerSummaries response
+
+        Args:
+            connection (extensions.connection): The database connection
+            players (List[Dict[str, Any]]): The 'response.players' list of GetPlayerSummaries
+        """
+        # communityvisibilitystate: 1 - private, 2 - friends only, 3 - public
+        rows = [(player['steamid'], player.get('communityvisibilitystate') == 3) for player in players]
+        if not rows:
+            return
+
+        with self.lock:
+            try:
+                with connection.cursor() as cursor:
+                    query = """
+                        INSERT INTO steam.profile_visibility (player_id, visible, checked)
+                        VALUES (%s, %s, NOW())
+                        ON CONFLICT (player_id) DO UPDATE
+                        SET visible = EXCLUDED.visible, checked = EXCLUDED.checked;
+                    """
+                    cursor.executemany(query, rows)
+                    connection.commit()
+            except Exception as e:
+                connection.rollback()
+                LOGGER.warning(f'Failed to update the profile visibility. Error: {e}')
+                return
+        self._visible.update(rows)
+
+    def refresh(self, connection: extensions.connection, steamids: List[str]):
+        """
+        Loads the cached visibility and requests it for players whose entry is missing or expired
+
+        Args:
+            connection (extensions.connection): The database connection
+            steamids (List[str]): Players that are about to be crawled
+        """
+        self.load(connection, steamids)
+        stale = [steamid for steamid in steamids if steamid not in self._visible]
+
+        for batch in _create_batches(stale):
+            url = self.user_data.format(api_key=config('API_KEY'), steamids=','.join(batch))
+            try:
+                json_content = self.fetch_data(url, 'json')
+            except TooManyRequestsError:
+                # The Steam Web API restricts data retrieval to 200 requests every 5 minutes
+                sleep(301)
+                json_content = self.fetch_data(url, 'json')
+
+            self.requests += 1
+            self.record(connection, json_content.get('response', {}).get('players', []))
+
+    def is_private(self, steamid: str) -> bool:
+        # Players without a known visibility are not skipped
+        return self._visible.get(steamid) is False
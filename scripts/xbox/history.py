@@ -1,14 +1,17 @@
 from typing import Optional, Union, Dict, List, Set
-from concurrent.futures import ThreadPoolExecutor
 from psycopg2 import extensions, Error
 from bs4 import BeautifulSoup
 from datetime import datetime
 from pathlib import Path
+import threading
 import pickle
 import json
-from utils.constants import (XBOX_SCHEMA, DATABASE_TABLES,
-                             XBOX_LOGS, CASHE_XBOXURLS)
+from utils.constants import (XBOX_SCHEMA, DATABASE_TABLES, XBOX_LOGS,
+                             CASHE_XBOXURLS, CACHE_XBOX_FINGERPRINTS)
 from utils.database.connector import connect_to_database, insert_data
+from utils.fingerprints import FingerprintStore
+from utils.workers import TaskGraph, TaskGroup
+from utils.catalog import CatalogCache
 from utils.logger import configure_logger
 from scripts import ExophaseAPI
 
@@ -25,6 +28,15 @@ class XboxHistory(ExophaseAPI):
             + 'page={page}&environment=xbox&sort=1'
         self.history = self.api + '/public/player/{playerid}/game/{gameid}/earned'
 
+        # Hashes of the game pages that have already been parsed
+        self.fingerprints = FingerprintStore(CACHE_XBOX_FINGERPRINTS)
+
+        # Guards the shared game list and the counters updated by the worker threads
+        self._lock = threading.Lock()
+        # Serializes the database writes of the worker threads: they share one connection,
+        # so a rollback of one insert would otherwise discard the rows of another
+        self._write_lock = threading.Lock()
+
         # Number of records added to the 'purchased_games' table
         self.added_purchased = 0
         # Number of records added to the 'history' table
@@ -73,63 +85,100 @@ class XboxHistory(ExophaseAPI):
         # UNIX-timestamp
         return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
 
-    def get_history(self, connection: extensions.connection,
-                    playerid: int, gameid: int,
-                    history: List[Optional[Union[int, str]]],
-                    achievementids: Set[Union[int, str]],
-                    dump_xboxurls: Dict[int, str]):
+    def _refresh_game(self, connection: extensions.connection, gameid: int,
+                      dump_xboxurls: Dict[int, str]) -> Optional[List[str]]:
+        # Re-reads the achievements of a game whose page has changed since it was last parsed
+        gameurl = dump_xboxurls.get(gameid)
+        if gameurl is None:
+            # The game was not found by the games crawl, there is no page to refresh
+            return []
+        
+        try:
+            html_content = self._request(gameurl)
+        except Exception as e:
+            LOGGER.warning(f'Failed to retrieve the page of the game "{gameid}". Error: {e}')
+            return None
+        
+        digest = self.fingerprints.changed(gameurl, html_content)
+        if digest is None:
+            # The game page is unchanged since it was last parsed,
+            # so the achievement is not published there yet
+            return []
+        
+        soup = BeautifulSoup(html_content, 'html.parser')
+        new_achievements = self.get_achievements(soup, gameid)
+        if not new_achievements:
+            self.fingerprints.commit(gameurl, digest)
+            return []
+        
+        try:
+            # DATABASE_TABLES[1] = 'achievements'
+            with self._write_lock:
+                insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[1], new_achievements)
+            self.fingerprints.commit(gameurl, digest)
+        except Error as e:
+            LOGGER.error(f'The achievement data update for the game "{gameid}" was not successful. ' \
+                         f'Error: {e}')
+            return None
+        return [achievement[0] for achievement in new_achievements]
+
+    def get_history(self, group: TaskGroup, playerid: int, gameid: int,
+                    history: List[Optional[Union[int, str]]], catalog: CatalogCache):
         json_content = json.loads(
             self._request(self.history.format(playerid=playerid, gameid=gameid)))
         
         for achievement in json_content.get('list', []):
-            check = True
             achievementid = f'{gameid}_{achievement["awardid"]}'
             
             # At a certain point, the data in the database may not contain
-            # any newly added achievements. This check helps to update our data
-            if achievementid not in achievementids:
-                gameurl = dump_xboxurls[gameid]
-                
-                html_content = self._request(gameurl)
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                new_achievements = self.get_achievements(soup, gameid)
-                
-                try:
-                    # DATABASE_TABLES[1] = 'achievements'
-                    insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[1], new_achievements)
-                except Error as e:
-                    LOGGER.error(f'The achievement data update for the game "{gameid}" was not successful. ' \
-                                 f'Error: {e}')
-                    check = False
-            
-            if check:
+            # any newly added achievements. The catalog refreshes the game
+            # once per run, however many players meet its new achievements
+            if catalog.ensure(gameid, achievementid):
                 history.append([playerid,
                                 achievementid,
                                 self._format_timestamp(achievement['timestamp'])])
     
-    def get_purchased(self, connection: extensions.connection,
-                      playerid: int, gameids: Set[Optional[int]]) -> List[Optional[int]]:
-        purchased, page = [], 1
-        
+    def get_purchased(self, group: TaskGroup, connection: extensions.connection,
+                      playerid: int, page: int, gameids: Set[Optional[int]],
+                      purchased: Dict[int, List[int]], history: List[Optional[Union[int, str]]],
+                      catalog: CatalogCache):
         json_content = json.loads(
             self._request(self.purchased.format(playerid=playerid, page=page)))
+        if not json_content.get('success', False):
+            return
         
-        while json_content.get('success', False):
-            for game in json_content.get('games', []):
-                gameid = game['master_id']
-                title = game['meta']['title']
-                
+        # The next page is requested while the games of this one are being processed
+        group.spawn(self.get_purchased, connection, playerid, page + 1, gameids,
+                    purchased, history, catalog)
+        
+        purchased[page] = []
+        
+        for game in json_content.get('games', []):
+            gameid = game['master_id']
+            title = game['meta']['title']
+            
+            try:
+                url = game['meta']['endpoint_awards'].replace(f'/achievements/#{playerid}', '')
+            except AttributeError:
+                # Data for the game is not available on the source website
+                continue
+            
+            # Overwriting gameids with updated new games
+            # If the next player encounters it again, we no longer consider it as new
+            with self._lock:
+                new_game = gameid not in gameids
+                gameids.add(gameid)
+                if new_game:
+                    # Players meeting the game before its rows are stored wait for them
+                    catalog.claim(gameid)
+            
+            if new_game:
+                # Adding information about a game that is not in our database
+                # but was found in the player's profile JSON data
+                stored = None
                 try:
-                    url = game['meta']['endpoint_awards'].replace(f'/achievements/#{playerid}', '')
-                except AttributeError:
-                    # Data for the game is not available on the source website
-                    continue
-                
-                if gameid not in gameids:
-                    # Adding information about a game that is not in our database
-                    # but was found in the player's profile JSON data
                     html_content = self._request(url)
+                    digest = self.fingerprints.digest(html_content)
                     soup = BeautifulSoup(html_content, 'html.parser')
                     
                     details = [gameid, title] + self.get_details(soup)
@@ -138,21 +187,50 @@ class XboxHistory(ExophaseAPI):
                     try:
                         # DATABASE_TABLES[0] = 'games'
                         # DATABASE_TABLES[1] = 'achievements'
-                        insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[0], [details])
-                        insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[1], achievements)
-                    except (Error, IndexError) as e:
+                        with self._write_lock:
+                            insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[0], [details])
+                            if achievements:
+                                insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[1], achievements)
+                        self.fingerprints.commit(url, digest)
+                        stored = [achievement[0] for achievement in achievements]
+                    except Error as e:
                         LOGGER.warning(e)
-                
-                purchased.append(gameid)
-                # Overwriting gameids with updated new games
-                # If the next player encounters it again, we no longer consider it as new
-                gameids.add(gameid)
+                finally:
+                    with self._lock:
+                        if stored is None:
+                            # The game is added again by the next player who owns it
+                            gameids.discard(gameid)
+                        catalog.add(gameid, stored)
             
-            # Iterating to the next page
-            page += 1
-            json_content = json.loads(
-                self._request(self.purchased.format(playerid=playerid, page=page)))
-        return purchased
+            purchased[page].append(gameid)
+            group.spawn(self.get_history, playerid, gameid, history, catalog)
+
+    def _flush(self, group: TaskGroup, connection: extensions.connection,
+               purchased: Dict[int, List[int]], history: List[Optional[Union[int, str]]]):
+        playerid = group.key
+        if group.errors:
+            # The player is not marked as processed and is retried on the next run
+            LOGGER.warning(f'Failed to process the player "{playerid}". Error: {group.errors[0]}')
+            return
+        
+        library = [gameid for page in sorted(purchased) for gameid in purchased[page]]
+        if not library:
+            library = None
+        
+        try:
+            with self._write_lock:
+                # A player without earned achievements is still marked as processed
+                if history:
+                    # DATABASE_TABLES[3] = 'history'
+                    insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[3], history)
+                # DATABASE_TABLES[4] = 'purchased_games'
+                insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[4], [[playerid, library]])
+            
+            with self._lock:
+                self.added_history += len(history)
+                self.added_purchased += 1
+        except (IndexError, Error) as e:
+            LOGGER.warning(e)
 
     def start(self):
         with connect_to_database() as connection:
@@ -168,27 +246,23 @@ class XboxHistory(ExophaseAPI):
             except FileNotFoundError:
                 dump_xboxurls = {}
             
-            for playerid in self._get_playerid(connection):
-                history = []
-
-                purchased = self.get_purchased(connection, playerid, gameids)
-                with ThreadPoolExecutor() as executor:
-                    executor.map(lambda gameid: self.get_history(
-                        connection, playerid, gameid, history, achievementids, dump_xboxurls), purchased)
-                
-                if not purchased:
-                    purchased = None
-                
-                try:
-                    # DATABASE_TABLES[3] = 'history'
-                    insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[3], history)
-                    self.added_history += len(history)
-                    # DATABASE_TABLES[4] = 'purchased_games'
-                    insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[4], [[playerid, purchased]])
-                    self.added_purchased += 1
-                except (IndexError, Error) as e:
-                    LOGGER.warning(e)
+            catalog = CatalogCache(achievementids, lambda gameid:
+                                   self._refresh_game(connection, gameid, dump_xboxurls))
+            
+            # Players are crawled concurrently on a single pool: the purchased pages,
+            # the earned lists of every game and the final insert of a player
+            # are separate tasks, so no player waits for the slowest game of another
+            with TaskGraph() as graph:
+                for playerid in self._get_playerid(connection):
+                    purchased, history = {}, []
+                    graph.submit(playerid, self.get_purchased, connection, playerid, 1, gameids,
+                                 purchased, history, catalog,
+                                 on_done=lambda group, purchased=purchased, history=history:
+                                     self._flush(group, connection, purchased, history))
         
+        self.fingerprints.save()
+        
+        LOGGER.info(f'Refreshed the achievements of "{catalog.refreshes}" games')
         LOGGER.info(f'Added "{self.added_purchased}" new data to the table "xbox.{self.process_purchased}"')
         LOGGER.info(f'Added "{self.added_history}" new data to the table "xbox.{self.process_history}"')
 
@@ -209,3 +283,5 @@ def main():
         LOGGER.info(f'Added "{xbox_hisotry.added_history}" new data to the table "xbox.{process_history}"')
         
         raise Exception(e)
+    
+    return xbox_hisotry
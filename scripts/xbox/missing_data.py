@@ -3,8 +3,10 @@ from typing import Optional, List, Any
 from psycopg2 import extensions
 from bs4 import BeautifulSoup
 from pathlib import Path
-from utils.constants import MATCH_MISSING_DATA, XBOX_LOGS
+from utils.constants import (MATCH_MISSING_DATA, XBOX_LOGS,
+                             CACHE_XBOX_FINGERPRINTS, MAX_WORKERS)
 from utils.database.connector import connect_to_database
+from utils.fingerprints import FingerprintStore
 from utils.logger import configure_logger
 from scripts import ExophaseAPI
 
@@ -19,6 +21,9 @@ class XboxUpdateData(ExophaseAPI):
         self.trueachievements = 'https://www.trueachievements.com'
         self.search = '/searchresults.aspx?search={encoded_title}'
 
+        # Hashes of the game pages that have already been parsed
+        self.fingerprints = FingerprintStore(CACHE_XBOX_FINGERPRINTS)
+
         # Number of records updated to the 'games' table
         self.updated = 0
     
@@ -44,7 +49,7 @@ class XboxUpdateData(ExophaseAPI):
             return []
 
     @staticmethod
-    def _update_data(connection: extensions.connection, app: List[Any]):
+    def _update_data(connection: extensions.connection, app: List[Any]) -> bool:
         try:
             with connection.cursor() as cursor:
                 query = """
@@ -61,8 +66,11 @@ class XboxUpdateData(ExophaseAPI):
                     app[0]   # gameid
                 ))
                 connection.commit()
+            return True
         except Exception as e:
+            connection.rollback()
             LOGGER.error('Failed to update the missing data. Error: %s', str(e).strip())
+            return False
 
     def get_data(self, connection: extensions.connection, app: List[Any]):
         # Remove invalid characters
@@ -82,6 +90,7 @@ class XboxUpdateData(ExophaseAPI):
             self.trueachievements + self.search.format(encoded_title=encoded_title))
         soup = BeautifulSoup(html_content, 'html.parser')
         
+        best_match, digest = None, None
         try:
             games = soup.find('table', class_='maintable leaderboard').find_all('tr')[1:]
             
@@ -97,6 +106,13 @@ class XboxUpdateData(ExophaseAPI):
             best_match = self._find_best_match(app[1], candidates.keys(), MATCH_MISSING_DATA)
             if best_match:
                 html_content = self.fetch_data(candidates[best_match])
+                # The candidate page was already parsed for this game and still has the same content,
+                # so it cannot fill in any of the missing fields. The game is part of the key, since
+                # several games (PS4/PS5 versions, editions) may match the same page
+                fingerprint_key = f'{app[0]} {candidates[best_match]}'
+                digest = self.fingerprints.changed(fingerprint_key, html_content)
+                if digest is None:
+                    return
                 soup_2 = BeautifulSoup(html_content, 'html.parser')
                 data = self.get_details(soup_2)
             else:
@@ -123,14 +139,20 @@ class XboxUpdateData(ExophaseAPI):
         if app[6] is None:
             app[6] = data[4]
 
-        self._update_data(connection, app)
+        # A failed update leaves the page unrecorded, so it is parsed again on the next run
+        if not self._update_data(connection, app):
+            return
         self.updated += 1
+        
+        if digest:
+            self.fingerprints.commit(fingerprint_key, digest)
             
     def start(self):
         with connect_to_database() as connection:
-            with ThreadPoolExecutor() as executor:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
                 executor.map(lambda app: self.get_data(connection, app),
                     self._get_missing(connection))
+        self.fingerprints.save()
         
         LOGGER.info(f'Updated "{self.updated}" data to the table "xbox.{self.process}"')
 
@@ -149,3 +171,5 @@ def main():
         LOGGER.info(f'Updated "{xbox_update_data.updated}" data to the table "xbox.{process}"')
         
         raise Exception(e)
+    
+    return xbox_update_data
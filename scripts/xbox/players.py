@@ -3,7 +3,7 @@ from psycopg2 import extensions, Error
 from bs4 import BeautifulSoup
 from pathlib import Path
 from utils.database.connector import connect_to_database, insert_data
-from utils.constants import XBOX_SCHEMA, DATABASE_TABLES, XBOX_LOGS
+from utils.constants import XBOX_SCHEMA, DATABASE_TABLES, XBOX_LOGS, MAX_WORKERS
 from utils.logger import configure_logger
 from scripts import ExophaseAPI
 
@@ -51,7 +51,7 @@ class XboxPlayers(ExophaseAPI):
 
     def start(self):
         with connect_to_database() as connection:
-            with ThreadPoolExecutor() as executor:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
                 executor.map(lambda page: self.get_players(connection, page),
                              range(1, self.last_page(self.leaderboard.format(page=1)) + 1))
             
@@ -61,7 +61,7 @@ def main():
     process = 'players'
     LOGGER.info(f'Process started')
 
-    xbox_players = XboxPlayers()
+    xbox_players = XboxPlayers(process)
 
     try:
         xbox_players.start()
@@ -72,3 +72,5 @@ def main():
         LOGGER.info(f'Added "{xbox_players.added}" new data to the table "xbox.{process}"')
         
         raise Exception(e)
+    
+    return xbox_players
@@ -1,14 +1,14 @@
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, List, Tuple
+from typing import Optional, Any, List, Tuple
 from psycopg2 import extensions, Error
 from datetime import datetime
-from bs4 import BeautifulSoup
 from pathlib import Path
-from utils.constants import (XBOX_SCHEMA, DATABASE_TABLES,
-                             XBOX_LOGS, CURRENCY)
-from utils.database.connector import connect_to_database, insert_data
+from utils.constants import XBOX_SCHEMA, XBOX_LOGS, CURRENCY, PRICE_BUDGET
+from utils.database.connector import connect_to_database
+from utils.database.prices import insert_prices, due_games
+from utils.workers import FetchParsePool
+from utils.regions import RegionRows
 from utils.logger import configure_logger
-from scripts import ExophaseAPI
+from scripts import ExophaseAPI, parse_price
 
 LOGGER = configure_logger(Path(__file__).name, XBOX_LOGS)
 
@@ -30,75 +30,74 @@ class XboxPrices(ExophaseAPI):
 
     def _get_appids(self, connection: extensions.connection) -> List[Optional[Tuple[int, str]]]:
         try:
+            # Every region except JP is a separate search request
+            gameids = due_games(connection, XBOX_SCHEMA, self._current_data(),
+                                PRICE_BUDGET['xbox'], len(CURRENCY['xbox']) - 1)
             with connection.cursor() as cursor:
-                query = f"""
+                query = """
                     SELECT gameid, title
                     FROM xbox.games
-                    WHERE gameid NOT IN (SELECT gameid
-                                         FROM xbox.prices
-                                         WHERE date_acquired = '{self._current_data()}');
+                    WHERE gameid = ANY(%s);
                 """
-                cursor.execute(query)
+                cursor.execute(query, (gameids,))
                 # app[0] - appid; app[1] - title
-                return [(app[0], app[1]) for app in cursor.fetchall()]
+                apps = {app[0]: (app[0], app[1]) for app in cursor.fetchall()}
+                # Keep the order of priority set by the scheduler
+                return [apps[gameid] for gameid in gameids if gameid in apps]
         except Exception as e:
             LOGGER.error('Failed to retrieve the list of appids from the database. ' \
                          'Error: %s', str(e).strip())
             return []
 
-    def get_prices(self, connection: extensions.connection, appid: int, title: str):
-        prices = []
-        for currency in CURRENCY['xbox']:
-            # The price data for the JP region is unavailable on the website
-            if currency == 'region-jp':
-                prices.append(None)
-                continue
-
-            html_content = self._request(self.prices.format(
-                currency=currency, query=self._construct_query(title)))
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            games = soup.find('div', class_='grid grid-cols-12 gap-3').find_all('div',
-                class_='col-span-6 sm:col-span-4 md:col-span-3 lg:col-span-2')
-            
-            candidates = {}
-            for candidate in games:
-                candidate_title = candidate.find('span',
-                    class_='line-clamp-2 h-10 underline-offset-2 group-hover:underline text-gray-900 ' + \
-                        'dark:text-gray-50 group-hover:text-primary-600 ' + \
-                        'dark:group-hover:text-primary-400 transition-colors').text.strip()
-                
-                try:
-                    candidate_price = candidate.find('span',
-                        class_='inline-flex items-center space-x-0.5').text.strip().replace(',', '.')
-                    for element in {'$', '£', '€', '₽', '\xa0'}:
-                        candidate_price = candidate_price.replace(element, '')
-                    
-                    candidates[candidate_title] = float(candidate_price)
-                except AttributeError:
-                    # Price not found for one of the candidates
-                    pass
-            
-            best_match = self._find_best_match(title, candidates.keys())
-            if best_match:
-                prices.append(candidates[best_match])
-            else:
-                prices.append(None)
-
+    def _insert_prices(self, connection: extensions.connection, batch: List[List[Any]]):
+        if not batch:
+            return
+        
         try:
-            # DATABASE_TABLES[5] = 'prices'
-            insert_data(connection, XBOX_SCHEMA, DATABASE_TABLES[5],
-                        [[appid] + prices + [self._current_data()]])
-            self.added += 1
+            # Only changed prices produce new rows
+            self.added += len(insert_prices(connection, XBOX_SCHEMA, batch))
         except (IndexError, Error) as e:
             LOGGER.warning('Failed to insert data into the database. Error: %s', e)
 
+    def get_prices(self, connection: extensions.connection, apps: List[Tuple[Any, ...]],
+                   batch_size: int = 100):
+        # Every (game, region) search page is a separate task. A row is written
+        # once all regions of the game have been resolved; a failed region is left empty
+        # (or keeps its last known price in the 'intervals' storage),
+        # and a game without any parsed region is retried on the next run.
+        # The price data for the JP region is unavailable on the website
+        rows = RegionRows('xbox', skip=['region-jp'])
+        tasks = []
+        for appid, title in apps:
+            for index, currency in rows.expect(appid):
+                tasks.append(((appid, index), self.prices.format(
+                    currency=currency, query=self._construct_query(title)),
+                    (currency, title)))
+
+        # Search pages are downloaded by threads and parsed by worker processes,
+        # so BeautifulSoup is not serialized by the GIL
+        pool = FetchParsePool(self._request, parse_price)
+        
+        batch = []
+        for (appid, index), price in pool.map(tasks):
+            if isinstance(price, Exception):
+                LOGGER.warning(f'Failed to retrieve the price of the game "{appid}". Error: {price}')
+            
+            resolved = rows.resolve(appid, index, price)
+            if resolved is None:
+                continue
+            
+            prices, failed = resolved
+            batch.append([appid] + prices + [self._current_data(), failed])
+            if len(batch) >= batch_size:
+                self._insert_prices(connection, batch)
+                batch = []
+        
+        self._insert_prices(connection, batch)
+
     def start(self):
         with connect_to_database() as connection:
-            with ThreadPoolExecutor() as executor:
-                executor.map(lambda appid, title:
-                             self.get_prices(connection, appid, title),
-                             *zip(*self._get_appids(connection)))
+            self.get_prices(connection, self._get_appids(connection))
         
             LOGGER.info(f'Added "{self.added}" new data to the table "xbox.{self.process}"')
 
@@ -116,3 +115,5 @@ def main():
         LOGGER.info(f'Added "{xbox_prices.added}" new data to the table "xbox.{process}"')
         
         raise Exception(e)
+    
+    return xbox_prices
@@ -0,0 +1,100 @@
+from typing import Optional, Callable, Iterable, Any, Dict, Set
+import threading
+
+
+class CatalogCache:
+    def __init__(self, ids: Iterable[Any], refresh: Callable[[Any], Optional[Iterable[Any]]]):
+        """
+        Thread-safe set of known achievement ids that refreshes a game when
+        an unknown achievement of it is met. Concurrent refreshes of the same
+        game share a single request, and every game is refreshed at most once per run.
+        A refresh that fails is tried again by the next player meeting the game
+
+        Args:
+            ids (Iterable[Any]): Achievement ids stored in the database at startup
+            refresh (Callable[[Any], Optional[Iterable[Any]]]): Fetches and stores the achievements
+                                                                of a game, returning their ids,
+                                                                or None if the refresh failed
+        """
+        self._ids: Set[Any] = set(ids)
+        self._refresh = refresh
+        self._lock = threading.Lock()
+        # Games being refreshed or added, with an event set once their rows are stored
+        self._flights: Dict[Any, threading.Event] = {}
+        # Games already refreshed during this run
+        self._refreshed: Set[Any] = set()
+
+        # Number of refreshed games
+        self.refreshes = 0
+
+    def __contains__(self, achievementid: Any) -> bool:
+        return achievementid in self._ids
+
+    def claim(self, gameid: Any):
+        """
+        Marks a newly found game as being added, so players meeting its achievements
+        wait for its rows instead of refreshing it. Every claim is followed by add()
+
+        Args:
+            gameid (Any): The game that is not in the database yet
+        """
+        with self._lock:
+            self._flights.setdefault(gameid, threading.Event())
+
+    def add(self, gameid: Any, ids: Optional[Iterable[Any]]):
+        """
+        Registers the achievements of a claimed game and releases the players waiting for it
+
+        Args:
+            gameid (Any): The claimed game
+            ids (Optional[Iterable[Any]]): The stored achievement ids, or None if the game was not stored
+        """
+        with self._lock:
+            if ids is not None:
+                self._ids.update(ids)
+                # The page of the game has just been parsed, a refresh would find nothing new
+                self._refreshed.add(gameid)
+            event = self._flights.pop(gameid, None)
+        if event is not None:
+            event.set()
+
+    def ensure(self, gameid: Any, achievementid: Any) -> bool:
+        """
+        Checks that an achievement is known, refreshing its game if it is not
+
+        Args:
+            gameid (Any): The game the achievement belongs to
+            achievementid (Any): The achievement id
+
+        Returns:
+            bool: Whether the achievement is in the catalog after the refresh
+        """
+        if achievementid in self._ids:
+            return True
+
+        with self._lock:
+            if achievementid in self._ids or gameid in self._refreshed:
+                return achievementid in self._ids
+
+            event = self._flights.get(gameid)
+            leader = event is None
+            if leader:
+                event = self._flights[gameid] = threading.Event()
+
+        if not leader:
+            event.wait()
+            return achievementid in self._ids
+
+        ids = None
+        try:
+            ids = self._refresh(gameid)
+        finally:
+            with self._lock:
+                # A failed refresh leaves the game to the next player meeting it
+                if ids is not None:
+                    self._ids.update(ids)
+                    self._refreshed.add(gameid)
+                    self.refreshes += 1
+                self._flights.pop(gameid)
+            event.set()
+        return achievementid in self._ids
@@ -1,10 +1,11 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import os
 
 DATABASE_TABLES: List[str] = [
     'games', 'achievements', 'players',
     'history', 'purchased_games', 'prices',
-    'reviews', 'friends', 'private_steamids'
+    'reviews', 'friends', 'private_steamids',
+    'profile_visibility', 'price_intervals', 'prices_daily'
 ]
 
 PLAYSTATION_SCHEMA: str = 'playstation'
@@ -18,6 +19,48 @@ CURRENCY: Dict[str, List[str]] = {
     'xbox': ['region-us', 'region-de', 'region-gb', 'region-jp', 'region-ru']
 }
 
+# Width of the thread pools of the scraping jobs. The number of requests
+# actually in flight is set per host by the adaptive limiter (utils/limiter.py)
+MAX_WORKERS: int = 64
+
+# 'intervals' stores a price row only when a value changes ('price_intervals'),
+# 'daily' stores a full row per game per day ('prices')
+PRICE_STORAGE: str = 'intervals'
+
+# Daily request budget of the price jobs. PlayStation and Xbox
+# share PSPrices, so their budgets add up to the source's allowance
+PRICE_BUDGET: Dict[str, int] = {
+    'steam': 2500,
+    'playstation': 15000,
+    'xbox': 10000
+}
+
+# Seasonal store sales (MM-DD, inclusive), during which prices are refreshed daily
+SALE_WINDOWS: List[Tuple[str, str]] = [
+    ('03-14', '03-24'),
+    ('06-20', '07-11'),
+    ('11-20', '12-03'),
+    ('12-18', '01-06')
+]
+
+# Daily number of calls allowed per Steam Web API key
+STEAM_DAILY_QUOTA: int = 100000
+# Shares of the daily quota of the jobs calling the Web API. A job's share stays
+# reserved for it until the job reports that it is done for the day, so a long
+# history crawl cannot spend the calls of the other jobs. Store calls (prices) are not counted
+QUOTA_PRIORITIES: Dict[str, int] = {
+    'steam.achievements': 3,
+    'steam.players': 2,
+    'steam.reviews': 1,
+    'steam.history': 2
+}
+
+# Number of catalog syncs that retry a Steam appid whose data could not be stored
+MAX_APPLIST_RETRIES: int = 5
+
+# Number of days after which the visibility of a Steam profile is checked again
+VISIBILITY_TTL: int = 30
+
 # We obtain the current directory and its parent directory.
 # An absolute path is constructed based on the parent path
 PROJECT_DIRECTORY: str = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
@@ -27,11 +70,19 @@ DATABASE_INFO_FILE_LOG: str = 'database_info.log'
 STEAM_LOGS: str = 'steam.log'
 PLAYSTATION_LOGS: str = 'playstation.log'
 XBOX_LOGS: str = 'xbox.log'
+PIPELINE_LOGS: str = 'pipeline.log'
 
 CACHE_APPIDS: str = 'appids.pkl'
 CACHE_ACHIEVEMENTS: str = 'achievements.pkl'
+CACHE_APPLIST: str = 'applist.pkl'
+CACHE_APPLIST_RETRIES: str = 'applist_retries.pkl'
 CASHE_PLAYERS: str = 'players.pkl'
 CASHE_PLAYSTATIONURLS: str = 'playstationurls.pkl'
 CASHE_XBOXURLS: str = 'xboxurls.pkl'
+CACHE_PLAYSTATION_FINGERPRINTS: str = 'playstation_fingerprints.pkl'
+CACHE_XBOX_FINGERPRINTS: str = 'xbox_fingerprints.pkl'
+CACHE_PIPELINE: str = 'pipeline.pkl'
+CACHE_FRONTIER: str = 'frontier.sqlite'
+CACHE_QUOTA: str = 'quota.sqlite'
 
 MATCH_MISSING_DATA: str = 'missing_data.csv'
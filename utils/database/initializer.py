@@ -65,6 +65,27 @@ def queries(schema_name: str, table_name: str) -> Optional[str]:
                     date_acquired DATE NOT NULL,
                     PRIMARY KEY (gameid, date_acquired)
                 );
+            """,
+            'price_intervals': """
+                CREATE TABLE playstation.price_intervals (
+                    gameid INT NOT NULL REFERENCES playstation.games (gameid) ON DELETE CASCADE,
+                    usd NUMERIC,
+                    eur NUMERIC,
+                    gbp NUMERIC,
+                    jpy NUMERIC,
+                    rub NUMERIC,
+                    valid_from DATE NOT NULL,
+                    valid_to DATE NOT NULL,
+                    PRIMARY KEY (gameid, valid_from)
+                );
+            """,
+            'prices_daily': """
+                CREATE VIEW playstation.prices_daily AS
+                SELECT i.gameid, i.usd, i.eur, i.gbp, i.jpy, i.rub, day::DATE AS date_acquired
+                FROM (SELECT *, COALESCE(LEAD(valid_from) OVER (PARTITION BY gameid ORDER BY valid_from) - 1,
+                                         valid_to) AS valid_until
+                      FROM playstation.price_intervals) i,
+                     GENERATE_SERIES(i.valid_from, i.valid_until, INTERVAL '1 day') AS day;
             """
         },
         'steam': {
@@ -142,6 +163,34 @@ def queries(schema_name: str, table_name: str) -> Optional[str]:
                 CREATE TABLE steam.private_steamids (
                     player_id TEXT PRIMARY KEY
                 );
+            """,
+            'profile_visibility': """
+                CREATE TABLE steam.profile_visibility (
+                    player_id TEXT PRIMARY KEY REFERENCES steam.players (player_id) ON DELETE CASCADE,
+                    visible BOOLEAN NOT NULL,
+                    checked TIMESTAMP NOT NULL
+                );
+            """,
+            'price_intervals': """
+                CREATE TABLE steam.price_intervals (
+                    game_id INT NOT NULL REFERENCES steam.games (game_id) ON DELETE CASCADE,
+                    usd NUMERIC,
+                    eur NUMERIC,
+                    gbp NUMERIC,
+                    jpy NUMERIC,
+                    rub NUMERIC,
+                    valid_from DATE NOT NULL,
+                    valid_to DATE NOT NULL,
+                    PRIMARY KEY (game_id, valid_from)
+                );
+            """,
+            'prices_daily': """
+                CREATE VIEW steam.prices_daily AS
+                SELECT i.game_id, i.usd, i.eur, i.gbp, i.jpy, i.rub, day::DATE AS date_acquired
+                FROM (SELECT *, COALESCE(LEAD(valid_from) OVER (PARTITION BY game_id ORDER BY valid_from) - 1,
+                                         valid_to) AS valid_until
+                      FROM steam.price_intervals) i,
+                     GENERATE_SERIES(i.valid_from, i.valid_until, INTERVAL '1 day') AS day;
             """
         },
         'xbox': {
@@ -196,6 +245,27 @@ def queries(schema_name: str, table_name: str) -> Optional[str]:
                     date_acquired DATE NOT NULL,
                     PRIMARY KEY (gameid, date_acquired)
                 );
+            """,
+            'price_intervals': """
+                CREATE TABLE xbox.price_intervals (
+                    gameid INT NOT NULL REFERENCES xbox.games (gameid) ON DELETE CASCADE,
+                    usd NUMERIC,
+                    eur NUMERIC,
+                    gbp NUMERIC,
+                    jpy NUMERIC,
+                    rub NUMERIC,
+                    valid_from DATE NOT NULL,
+                    valid_to DATE NOT NULL,
+                    PRIMARY KEY (gameid, valid_from)
+                );
+            """,
+            'prices_daily': """
+                CREATE VIEW xbox.prices_daily AS
+                SELECT i.gameid, i.usd, i.eur, i.gbp, i.jpy, i.rub, day::DATE AS date_acquired
+                FROM (SELECT *, COALESCE(LEAD(valid_from) OVER (PARTITION BY gameid ORDER BY valid_from) - 1,
+                                         valid_to) AS valid_until
+                      FROM xbox.price_intervals) i,
+                     GENERATE_SERIES(i.valid_from, i.valid_until, INTERVAL '1 day') AS day;
             """
         }
     }
@@ -0,0 +1,277 @@
+from typing import Optional, Any, List
+from datetime import datetime, date as Date
+from psycopg2 import extensions, Error
+from psycopg2.extras import execute_values
+from pathlib import Path
+import sys
+from utils.constants import (PLAYSTATION_SCHEMA, STEAM_SCHEMA, XBOX_SCHEMA, DATABASE_TABLES,
+                             DATABASE_INFO_FILE_LOG, PRICE_STORAGE, SALE_WINDOWS)
+from utils.database.connector import connect_to_database, insert_data
+from utils.logger import configure_logger
+
+LOGGER = configure_logger(Path(__file__).name, DATABASE_INFO_FILE_LOG)
+
+# Steam tables name the game column differently
+ID_COLUMNS = {
+    PLAYSTATION_SCHEMA: 'gameid',
+    STEAM_SCHEMA: 'game_id',
+    XBOX_SCHEMA: 'gameid'
+}
+PRICE_COLUMNS = 'usd, eur, gbp, jpy, rub'
+# Longest time a game goes without a price check
+MAX_REFRESH_INTERVAL = 30
+
+
+def priced_query(schema_name: str, date: str) -> str:
+    """
+    Builds a query selecting the games whose prices were already recorded on the given date
+
+    Args:
+        schema_name (str): The platform schema
+        date (str): The date in the format 'YYYY-MM-DD'
+
+    Returns:
+        str: A SELECT statement returning a single column of game ids
+    """
+    id_column = ID_COLUMNS[schema_name]
+    if PRICE_STORAGE == 'intervals':
+        return f"""
+            SELECT {id_column}
+            FROM {schema_name}.price_intervals
+            WHERE valid_to = '{date}'
+        """
+    return f"""
+        SELECT {id_column}
+        FROM {schema_name}.prices
+        WHERE date_acquired = '{date}'
+    """
+
+
+def in_sale_window(day: Date) -> bool:
+    # Windows given as MM-DD may wrap around the new year
+    current = day.strftime('%m-%d')
+    return any(start <= current <= end if start <= end else (current >= start or current <= end)
+               for start, end in SALE_WINDOWS)
+
+
+def refresh_interval(since_change: int, changes: int, observed: int,
+                     release_age: Optional[int], sale: bool) -> float:
+    """
+    Number of days between two price checks of a game
+
+    Args:
+        since_change (int): Days since the price last changed
+        changes (int): Number of price changes observed
+        observed (int): Days since the price was first recorded
+        release_age (Optional[int]): Days since the release of the game
+        sale (bool): Whether a seasonal sale is running
+
+    Returns:
+        float: The refresh interval in days
+    """
+    if sale:
+        return 1
+    # A stable price is checked less often the longer it stays the same
+    interval = min(MAX_REFRESH_INTERVAL, max(1, since_change / 4))
+    # Volatile titles are checked twice per average time between changes
+    if changes:
+        interval = min(interval, max(1, observed / changes / 2))
+    # Prices of new releases are adjusted frequently
+    if release_age is not None and release_age < 90:
+        interval = min(interval, 2)
+    return interval
+
+
+def due_games(connection: extensions.connection, schema_name: str,
+              date: str, budget: int, cost: float) -> List[int]:
+    """
+    Selects the games whose price refresh is due, most overdue first,
+    within what is left of the daily request budget
+
+    Args:
+        connection (extensions.connection): The database connection
+        schema_name (str): The platform schema
+        date (str): The current date in the format 'YYYY-MM-DD'
+        budget (int): Number of requests the source allows per day
+        cost (float): Number of requests needed to price a single game
+
+    Returns:
+        List[int]: Ids of the games to price during this run
+    """
+    id_column = ID_COLUMNS[schema_name]
+    today = datetime.strptime(date, '%Y-%m-%d').date()
+
+    with connection.cursor() as cursor:
+        if PRICE_STORAGE != 'intervals':
+            # Without change statistics every game is priced once a day
+            cursor.execute(f"""
+                SELECT {id_column}
+                FROM {schema_name}.games
+                WHERE {id_column} NOT IN ({priced_query(schema_name, date)});
+            """)
+            return [game[0] for game in cursor.fetchall()]
+
+        cursor.execute(f"""
+            SELECT g.{id_column}, g.release_date, MIN(i.valid_from),
+                   MAX(i.valid_from), MAX(i.valid_to), COUNT(i.{id_column}) - 1
+            FROM {schema_name}.games g
+            LEFT JOIN {schema_name}.price_intervals i ON i.{id_column} = g.{id_column}
+            GROUP BY g.{id_column}, g.release_date;
+        """)
+        games = cursor.fetchall()
+
+    sale = in_sale_window(today)
+    spent, due = 0, []
+    for gameid, release_date, first_seen, last_change, last_checked, changes in games:
+        if last_checked is None:
+            # Games that have never been priced go first
+            due.append((float('inf'), gameid))
+            continue
+        if last_checked >= today:
+            spent += 1
+            continue
+
+        release_age = (today - release_date).days if release_date else None
+        interval = refresh_interval((today - last_change).days, changes,
+                                    (today - first_seen).days, release_age, sale)
+        overdue = (today - last_checked).days / interval
+        if overdue >= 1:
+            due.append((overdue, gameid))
+
+    due.sort(reverse=True)
+    # Games priced earlier today are already paid for
+    remaining = max(0, int((budget - spent * cost) / cost))
+    LOGGER.info(f'Price refresh of "{schema_name}": "{len(due)}" games due, "{remaining}" within the budget')
+    return [gameid for _, gameid in due[:remaining]]
+
+
+def insert_prices(connection: extensions.connection,
+                  schema_name: str, data: List[List[Any]]) -> List[int]:
+    """
+    Stores one observation per game in the storage selected by PRICE_STORAGE.
+    In the 'intervals' storage an unchanged price only extends the validity
+    of the current interval, and a changed price opens a new one. A region that
+    failed to be retrieved keeps the price of the current interval there,
+    so a failed request does not open an interval
+
+    Args:
+        connection (extensions.connection): The database connection
+        schema_name (str): The platform schema
+        data (List[List[Any]]): Rows of [gameid, usd, eur, gbp, jpy, rub, date, failed],
+                                failed flagging the price columns that were not retrieved
+
+    Returns:
+        List[int]: Ids of the games whose price changed (every game in the 'daily' storage)
+    """
+    if PRICE_STORAGE != 'intervals':
+        # DATABASE_TABLES[5] = 'prices'
+        insert_data(connection, schema_name, DATABASE_TABLES[5], [row[:-1] for row in data])
+        return [row[0] for row in data]
+
+    if not data:
+        raise IndexError(f'Attempt to insert an empty number of rows into the database "{schema_name}.price_intervals"')
+
+    id_column = ID_COLUMNS[schema_name]
+    query = f"""
+        WITH received (id, usd, eur, gbp, jpy, rub, day, failed) AS (VALUES %s),
+        latest AS (
+            SELECT DISTINCT ON (p.{id_column}) p.*
+            FROM {schema_name}.price_intervals p
+            JOIN received r ON r.id = p.{id_column}
+            ORDER BY p.{id_column}, p.valid_from DESC
+        ),
+        -- Failed regions carry the price of the current interval
+        incoming AS (
+            SELECT r.id, r.day,
+                   CASE WHEN r.failed[1] THEN l.usd ELSE r.usd END AS usd,
+                   CASE WHEN r.failed[2] THEN l.eur ELSE r.eur END AS eur,
+                   CASE WHEN r.failed[3] THEN l.gbp ELSE r.gbp END AS gbp,
+                   CASE WHEN r.failed[4] THEN l.jpy ELSE r.jpy END AS jpy,
+                   CASE WHEN r.failed[5] THEN l.rub ELSE r.rub END AS rub
+            FROM received r
+            LEFT JOIN latest l ON l.{id_column} = r.id
+        ),
+        extended AS (
+            UPDATE {schema_name}.price_intervals p
+            SET valid_to = i.day
+            FROM incoming i, latest l
+            WHERE p.{id_column} = i.id AND l.{id_column} = i.id AND
+                  p.valid_from = l.valid_from AND i.day > p.valid_to AND
+                  (p.usd, p.eur, p.gbp, p.jpy, p.rub) IS NOT DISTINCT FROM
+                  (i.usd, i.eur, i.gbp, i.jpy, i.rub)
+        )
+        INSERT INTO {schema_name}.price_intervals ({id_column}, {PRICE_COLUMNS}, valid_from, valid_to)
+        SELECT i.id, i.usd, i.eur, i.gbp, i.jpy, i.rub, i.day, i.day
+        FROM incoming i
+        LEFT JOIN latest l ON l.{id_column} = i.id
+        WHERE l.{id_column} IS NULL OR
+              (l.usd, l.eur, l.gbp, l.jpy, l.rub) IS DISTINCT FROM
+              (i.usd, i.eur, i.gbp, i.jpy, i.rub)
+        ON CONFLICT DO NOTHING
+        RETURNING {id_column};
+    """
+    try:
+        with connection.cursor() as cursor:
+            changed = execute_values(cursor, query, data, fetch=True,
+                                     template='(%s, %s::NUMERIC, %s::NUMERIC, %s::NUMERIC, '
+                                              '%s::NUMERIC, %s::NUMERIC, %s::DATE, %s::BOOLEAN[])',
+                                     page_size=len(data))
+            connection.commit()
+            return [row[0] for row in changed]
+    except Error as e:
+        connection.rollback()
+        raise Error(f'Error inserting data into "{schema_name}.price_intervals": {str(e).strip()}')
+
+
+def compact_prices(connection: extensions.connection, schema_name: str, truncate: bool = False) -> int:
+    """
+    Migrates the daily rows of '<schema>.prices' into validity intervals.
+    Consecutive days with equal prices (gaps and islands) become one interval
+
+    Args:
+        connection (extensions.connection): The database connection
+        schema_name (str): The platform schema
+        truncate (bool): Whether to empty the daily table after the migration
+
+    Returns:
+        int: Number of intervals written
+    """
+    id_column = ID_COLUMNS[schema_name]
+    query = f"""
+        INSERT INTO {schema_name}.price_intervals ({id_column}, {PRICE_COLUMNS}, valid_from, valid_to)
+        SELECT {id_column}, {PRICE_COLUMNS}, MIN(date_acquired), MAX(date_acquired)
+        FROM (
+            -- Every price change starts a new island
+            SELECT *, SUM(changed) OVER (PARTITION BY {id_column} ORDER BY date_acquired) AS island
+            FROM (
+                SELECT p.*,
+                       CASE WHEN (usd, eur, gbp, jpy, rub) IS NOT DISTINCT FROM
+                                 (LAG(usd) OVER w, LAG(eur) OVER w, LAG(gbp) OVER w,
+                                  LAG(jpy) OVER w, LAG(rub) OVER w)
+                            THEN 0 ELSE 1 END AS changed
+                FROM {schema_name}.prices p
+                WINDOW w AS (PARTITION BY {id_column} ORDER BY date_acquired)
+            ) marked
+        ) islands
+        GROUP BY {id_column}, island, {PRICE_COLUMNS}
+        ON CONFLICT DO NOTHING;
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            written = cursor.rowcount
+            if truncate:
+                cursor.execute(f'TRUNCATE {schema_name}.prices;')
+            connection.commit()
+            LOGGER.info(f'Compacted "{schema_name}.prices" into "{written}" price intervals')
+            return written
+    except Error as e:
+        connection.rollback()
+        raise Error(f'Error compacting "{schema_name}.prices": {str(e).strip()}')
+
+
+if __name__ == '__main__':
+    # python -m utils.database.prices [--truncate]
+    with connect_to_database() as connection:
+        for schema_name in [PLAYSTATION_SCHEMA, STEAM_SCHEMA, XBOX_SCHEMA]:
+            compact_prices(connection, schema_name, truncate='--truncate' in sys.argv)
@@ -1,5 +1,6 @@
 from typing import Optional, Any
 import requests
+from utils.limiter import get_limiter
 
 
 class TooManyRequestsError(Exception):
@@ -8,16 +9,28 @@ class TooManyRequestsError(Exception):
 class ForbiddenError(Exception):
     pass
 
+class QuotaExceededError(Exception):
+    pass
+
 class Fetcher:
     def __init__(self):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
                           'Chrome/91.0.4472.124 Safari/537.36'
         }
+        # Daily call quota of the job (utils/quota.py), if the source has one
+        self.quota = None
 
     def fetch_data(self, url: str, content_type: str = 'html') -> Optional[Any]:
+        if self.quota is not None and self.quota.covers(url):
+            # Raises QuotaExceededError once the job has used up its share
+            self.quota.spend()
+        
         try:
-            response = requests.get(url, headers=self.headers)
+            # The number of concurrent requests to a host is capped by its adaptive limit
+            with get_limiter(url).slot() as slot:
+                response = requests.get(url, headers=self.headers)
+                slot.status = response.status_code
             response.raise_for_status()
             if content_type == 'json':
                 return response.json()   
@@ -0,0 +1,76 @@
+from typing import Optional, Dict, Union
+import threading
+import hashlib
+import pickle
+import re
+
+# Markers of the page sections read by ExophaseAPI.get_achievements/get_details
+SECTION_MARKERS = ('id="awards"', 'class="details"', 'class="game-info"')
+SCRIPTS = re.compile(r'<script.*?</script>', re.S | re.I)
+
+
+class FingerprintStore:
+    def __init__(self, filename: str):
+        self.path = './resources/' + filename
+        self._lock = threading.Lock()
+
+        # Pairs of (url, digest) for pages whose data is already in our database
+        try:
+            with open(self.path, 'rb') as file:
+                self._digests: Dict[str, str] = pickle.load(file)
+
+            if not isinstance(self._digests, dict):
+                raise FileNotFoundError
+        except FileNotFoundError:
+            self._digests = {}
+
+    @staticmethod
+    def digest(content: Union[str, bytes]) -> str:
+        """
+        Hashes the part of a game page that the parsers read from
+
+        Args:
+            content (Union[str, bytes]): The raw HTML content of the page
+
+        Returns:
+            str: A hex digest of the relevant sections
+        """
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'ignore')
+
+        # Plain string search is used so that an unchanged page never reaches BeautifulSoup.
+        # The section runs from the first known marker up to the footer; scripts are dropped
+        # because they carry tokens and counters that change on every request
+        positions = [content.find(marker) for marker in SECTION_MARKERS]
+        start = min([position for position in positions if position != -1], default=0)
+        end = content.find('<footer', start)
+        section = SCRIPTS.sub('', content[start:end if end != -1 else len(content)])
+
+        return hashlib.blake2b(section.encode('utf-8'), digest_size=16).hexdigest()
+
+    def changed(self, url: str, content: Union[str, bytes]) -> Optional[str]:
+        """
+        Compares the page with the fingerprint recorded for the url
+
+        Args:
+            url (str): The url the page was fetched from
+            content (Union[str, bytes]): The raw HTML content of the page
+
+        Returns:
+            Optional[str]: The new digest if the page has changed, otherwise None
+        """
+        digest = self.digest(content)
+        with self._lock:
+            if self._digests.get(url) == digest:
+                return None
+        return digest
+
+    def commit(self, url: str, digest: str):
+        # Called only after the parsed data has been written to the database,
+        # so a failed insert is retried the next time the page is fetched
+        with self._lock:
+            self._digests[url] = digest
+
+    def save(self):
+        with self._lock, open(self.path, 'wb') as file:
+            pickle.dump(self._digests, file)
@@ -0,0 +1,117 @@
+from typing import Iterable, List
+import sqlite3
+import os
+
+
+class BloomFilter:
+    def __init__(self, bits: int = 1 << 26, hashes: int = 7):
+        """
+        Bloom filter over 64-bit integers. With the default 8 MB of bits
+        about 5 million members keep the false positive rate near 1%
+
+        Args:
+            bits (int): Number of bits of the filter
+            hashes (int): Number of bits set for every member
+        """
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray(bits // 8)
+
+    def _positions(self, value: int) -> Iterable[int]:
+        # Double hashing: h1 + i * h2 with two multiplicative hashes
+        h1 = (value * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h2 = ((value ^ (value >> 31)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, value: int):
+        for position in self._positions(value):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: int) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class Frontier:
+    def __init__(self, filename: str):
+        """
+        Disk-backed BFS frontier with a persistent visited set. Players are
+        stored as 64-bit integers and popped by degree, i.e. by the number
+        of crawled players that list them as a friend
+
+        Args:
+            filename (str): Name of the SQLite file in ./resources/
+        """
+        self._connection = sqlite3.connect(os.path.join('./resources/', filename))
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                steamid INTEGER PRIMARY KEY,
+                degree INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS frontier_degree ON frontier (degree DESC);
+            CREATE TABLE IF NOT EXISTS visited (
+                steamid INTEGER PRIMARY KEY
+            ) WITHOUT ROWID;
+        """)
+
+        # Most discovered players are new, so the filter answers the visited
+        # check without touching the disk; only its positives are confirmed
+        self._visited = BloomFilter()
+        for (steamid,) in self._connection.execute('SELECT steamid FROM visited;'):
+            self._visited.add(steamid)
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM frontier;').fetchone()[0]
+
+    def is_empty(self) -> bool:
+        return self._connection.execute(
+            'SELECT NOT EXISTS (SELECT 1 FROM frontier) AND NOT EXISTS (SELECT 1 FROM visited);'
+        ).fetchone()[0] == 1
+
+    def _is_visited(self, steamid: int) -> bool:
+        if steamid not in self._visited:
+            return False
+        return self._connection.execute(
+            'SELECT 1 FROM visited WHERE steamid = ?;', (steamid,)).fetchone() is not None
+
+    def push(self, steamids: Iterable[str]):
+        """
+        Adds unvisited players to the frontier. A player that is already
+        queued has its degree increased instead
+
+        Args:
+            steamids (Iterable[str]): SteamID64 strings
+        """
+        rows = [(int(steamid),) for steamid in steamids if not self._is_visited(int(steamid))]
+        with self._connection:
+            self._connection.executemany("""
+                INSERT INTO frontier (steamid) VALUES (?)
+                ON CONFLICT (steamid) DO UPDATE SET degree = degree + 1;
+            """, rows)
+
+    def peek(self, size: int) -> List[str]:
+        """
+        Returns the queued players with the highest degree. They stay queued
+        until done() is called, so an interrupted batch is crawled again
+
+        Args:
+            size (int): Maximum number of players
+
+        Returns:
+            List[str]: SteamID64 strings
+        """
+        cursor = self._connection.execute(
+            'SELECT steamid FROM frontier ORDER BY degree DESC LIMIT ?;', (size,))
+        return [str(steamid) for (steamid,) in cursor.fetchall()]
+
+    def done(self, steamids: Iterable[str]):
+        # Moves crawled players from the frontier to the visited set
+        rows = [(int(steamid),) for steamid in steamids]
+        with self._connection:
+            self._connection.executemany('DELETE FROM frontier WHERE steamid = ?;', rows)
+            self._connection.executemany('INSERT OR IGNORE INTO visited (steamid) VALUES (?);', rows)
+        for (steamid,) in rows:
+            self._visited.add(steamid)
+
+    def close(self):
+        self._connection.close()
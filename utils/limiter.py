@@ -0,0 +1,141 @@
+from typing import Optional, Generator, Dict, Set, Any
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import threading
+import time
+
+
+class _Slot:
+    def __init__(self):
+        # HTTP status of the response; 0 means the connection failed
+        self.status: int = 200
+
+
+class AdaptiveLimiter:
+    def __init__(self, host: str, initial: int = 4, minimum: int = 1,
+                 maximum: int = 64, spike: float = 3.0,
+                 throttle_statuses: Set[int] = frozenset({403, 429})):
+        """
+        AIMD concurrency limit for a single host. The limit grows by one per
+        window of successful requests and is halved when the host throttles,
+        fails or responds much slower than usual
+
+        Args:
+            host (str): The host the limit applies to
+            initial (int): Number of concurrent requests allowed at start
+            minimum (int): The limit never drops below this value
+            maximum (int): The limit never grows above this value
+            spike (float): A response slower than spike times the usual latency counts as congestion
+            throttle_statuses (Set[int]): Client error statuses the host uses for throttling
+        """
+        self.host = host
+        self.minimum = minimum
+        self.maximum = maximum
+        self.spike = spike
+        self.throttle_statuses = throttle_statuses
+
+        self._limit = float(initial)
+        self._in_flight = 0
+        # Exponentially weighted average latency of successful requests
+        self._latency: Optional[float] = None
+        self._samples = 0
+        self._last_decrease = .0
+        self._condition = threading.Condition()
+
+        # Counters exposed through metrics()
+        self.requests = 0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _congested(self, status: int, latency: float) -> bool:
+        if status == 0 or status in self.throttle_statuses or status >= 500:
+            return True
+        # Latency spikes are only trusted once the average has settled
+        return self._samples >= 20 and latency > self.spike * self._latency
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    def release(self, status: int, latency: float):
+        with self._condition:
+            self._in_flight -= 1
+            self.requests += 1
+
+            now = time.monotonic()
+            if self._congested(status, latency):
+                self.throttled += 1
+                # Responses of requests sent before the last decrease reflect the old limit,
+                # so the limit is decreased at most once per average round trip
+                if now - self._last_decrease > (self._latency or .0):
+                    self._limit = max(self.minimum, self._limit / 2)
+                    self._last_decrease = now
+            else:
+                self._latency = latency if self._latency is None else .9 * self._latency + .1 * latency
+                self._samples += 1
+                # One step per limit successful responses, i.e. about one per round trip
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self) -> Generator[_Slot, None, None]:
+        """
+        Holds one unit of concurrency for the duration of a request.
+        The caller records the response status in the yielded slot
+
+        Yields:
+            _Slot: Holder for the HTTP status of the response
+        """
+        self.acquire()
+        slot, started = _Slot(), time.perf_counter()
+        try:
+            yield slot
+        except Exception:
+            if slot.status == 200:
+                slot.status = 0
+            raise
+        finally:
+            self.release(slot.status, time.perf_counter() - started)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            return {'limit': self.limit, 'in_flight': self._in_flight,
+                    'latency': round(self._latency or .0, 3),
+                    'requests': self.requests, 'throttled': self.throttled}
+
+
+# The Steam Web API answers 403 for private profiles, which is not throttling
+_THROTTLE_STATUSES: Dict[str, Set[int]] = {
+    'api.steampowered.com': {429}
+}
+
+_LIMITERS: Dict[str, AdaptiveLimiter] = {}
+_LOCK = threading.Lock()
+
+
+def get_limiter(url: str) -> AdaptiveLimiter:
+    """
+    Returns the limiter shared by all requests to the host of the url
+
+    Args:
+        url (str): The URL of a request
+
+    Returns:
+        AdaptiveLimiter: The limiter of the host
+    """
+    host = urlsplit(url).netloc
+    with _LOCK:
+        if host not in _LIMITERS:
+            _LIMITERS[host] = AdaptiveLimiter(host, throttle_statuses=_THROTTLE_STATUSES.get(host, {403, 429}))
+        return _LIMITERS[host]
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    # Current limit and counters of every host contacted by this process
+    with _LOCK:
+        limiters = list(_LIMITERS.values())
+    return {limiter.host: limiter.metrics() for limiter in limiters}
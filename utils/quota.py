@@ -0,0 +1,182 @@
+from typing import Optional, Iterable, Dict, Tuple
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlsplit
+import threading
+import hashlib
+import sqlite3
+import os
+from utils.constants import STEAM_DAILY_QUOTA, QUOTA_PRIORITIES, CACHE_QUOTA
+from utils.fetcher import QuotaExceededError
+
+# Hosts whose calls are counted against the Steam quota. The store (appdetails)
+# does not take the Web API key, so its calls do not count
+STEAM_HOSTS: Tuple[str, ...] = ('api.steampowered.com',)
+
+
+class QuotaPlanner:
+    def __init__(self, key: str, budget: int = STEAM_DAILY_QUOTA,
+                 priorities: Dict[str, int] = QUOTA_PRIORITIES, filename: str = CACHE_QUOTA):
+        """
+        Ledger of the calls made with an API key per job and per day (UTC), kept
+        in SQLite so that jobs running in other processes see each other's usage.
+        The daily budget is split across jobs by priority; the unspent share of a job
+        stays reserved until the job declares a smaller demand or reports that it is done.
+        The share of a job that reports no demand is released while neither the job
+        nor any job with a higher priority is running (started today and not done)
+
+        Args:
+            key (str): The API key; only a digest of it is stored
+            budget (int): Number of calls allowed per day
+            priorities (Dict[str, int]): Relative shares of the budget by job name
+            filename (str): Name of the SQLite file in ./resources/
+        """
+        self.key = hashlib.sha256(key.encode()).hexdigest()[:16]
+        self.budget = budget
+        self.priorities = priorities
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(os.path.join('./resources/', filename),
+                                           check_same_thread=False, timeout=30)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS ledger (
+                    key TEXT NOT NULL,
+                    job TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    demand INTEGER,
+                    PRIMARY KEY (key, job, day)
+                );
+            """)
+            # The ledger only needs the current day; a week is kept for inspection
+            self._connection.execute('DELETE FROM ledger WHERE day < ?;', (self._day(-7),))
+
+    @staticmethod
+    def _day(offset: int = 0) -> str:
+        # Steam resets the daily limit at midnight UTC
+        return (datetime.now(timezone.utc) + timedelta(days=offset)).strftime('%Y-%m-%d')
+
+    def _usage(self) -> Dict[str, Tuple[int, Optional[int]]]:
+        cursor = self._connection.execute(
+            'SELECT job, calls, demand FROM ledger WHERE key = ? AND day = ?;', (self.key, self._day()))
+        return {job: (calls, demand) for job, calls, demand in cursor.fetchall()}
+
+    def _update(self, job: str, assignment: str, value: Optional[int] = None):
+        with self._connection:
+            self._connection.execute(
+                'INSERT OR IGNORE INTO ledger (key, job, day) VALUES (?, ?, ?);', (self.key, job, self._day()))
+            self._connection.execute(
+                f'UPDATE ledger SET {assignment} WHERE key = ? AND job = ? AND day = ?;',
+                (*(() if value is None else (value,)), self.key, job, self._day()))
+
+    def available(self, job: str) -> int:
+        """
+        Number of calls the job may spend now: what is left of the daily budget
+        minus the unspent shares still reserved for the other jobs
+
+        Args:
+            job (str): The job name, e.g. 'steam.history'
+
+        Returns:
+            int: The number of calls
+        """
+        with self._lock:
+            usage = self._usage()
+
+        total = sum(self.priorities.values())
+        reserved = 0
+        for other, priority in self.priorities.items():
+            if other == job:
+                continue
+            calls, demand = usage.get(other, (0, None))
+            share = self.budget * priority / total
+            if demand is not None:
+                need = min(share, demand)
+            elif any(self._working(*usage.get(ahead, (0, None)))
+                     for ahead, ahead_priority in self.priorities.items()
+                     if ahead == other or ahead_priority > priority):
+                # Without a declared demand the whole share is reserved while
+                # the job itself or a job ahead of it is running
+                need = share
+            else:
+                need = 0
+            reserved += max(0, need - calls)
+
+        spent = sum(calls for calls, _ in usage.values())
+        return max(0, int(self.budget - spent - reserved))
+
+    @staticmethod
+    def _working(calls: int, demand: Optional[int]) -> bool:
+        # A job has started today and has not reported that it is done
+        return calls > 0 if demand is None else calls < demand
+
+    def spend(self, job: str, calls: int = 1):
+        # Records calls that are about to be made
+        with self._lock:
+            self._update(job, 'calls = calls + ?', calls)
+
+    def demand(self, job: str, calls: int):
+        # Declares how many calls the job needs today in total
+        with self._lock:
+            self._update(job, 'demand = ?', calls)
+
+    def done(self, job: str):
+        # Releases the unspent share of the job for the rest of the day
+        with self._lock:
+            self._update(job, 'demand = calls')
+
+    def job(self, job: str, hosts: Iterable[str] = STEAM_HOSTS) -> 'JobQuota':
+        return JobQuota(self, job, hosts)
+
+    def close(self):
+        self._connection.close()
+
+
+class JobQuota:
+    def __init__(self, planner: QuotaPlanner, job: str, hosts: Iterable[str]):
+        """
+        The quota of a single job, assigned to Fetcher.quota
+
+        Args:
+            planner (QuotaPlanner): The shared ledger
+            job (str): The job name, e.g. 'steam.history'
+            hosts (Iterable[str]): Hosts whose calls are counted
+        """
+        self.planner = planner
+        self.job = job
+        self.hosts = set(hosts)
+        # Calls granted by the last read of the ledger
+        self._allowed = 0
+        self._lock = threading.Lock()
+
+    def covers(self, url: str) -> bool:
+        return urlsplit(url).netloc in self.hosts
+
+    def available(self) -> int:
+        return self.planner.available(self.job)
+
+    def spend(self, calls: int = 1):
+        """
+        Records calls of the job
+
+        Args:
+            calls (int): Number of calls about to be made
+
+        Raises:
+            QuotaExceededError: The job has no calls left for today
+        """
+        with self._lock:
+            # Reading the ledger on every call would double the cost of a call,
+            # so the availability is checked in steps of up to a hundred calls
+            if self._allowed < calls:
+                self._allowed = min(100, self.available())
+                if self._allowed < calls:
+                    raise QuotaExceededError(f'The daily Steam quota of "{self.job}" is exhausted')
+            self._allowed -= calls
+        self.planner.spend(self.job, calls)
+
+    def demand(self, calls: int):
+        self.planner.demand(self.job, calls)
+
+    def done(self):
+        self.planner.done(self.job)
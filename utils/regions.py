@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Callable, Iterable, Generator, Tuple, List, Dict, Set, Any
+import threading
+from utils.constants import CURRENCY, MAX_WORKERS
+
+
+class RegionRows:
+    def __init__(self, platform: str, skip: Iterable[str] = ()):
+        """
+        Assembles one price row per game from regions fetched concurrently.
+        Columns follow the order of CURRENCY[platform]; a failed or skipped
+        region stays NULL, and a game without any retrieved region yields no row.
+        Failed regions are flagged, so the storage can tell them from a missing price
+
+        Args:
+            platform (str): Key of CURRENCY, e.g. 'steam'
+            skip (Iterable[str]): Regions that are never requested
+        """
+        self.regions = CURRENCY[platform]
+        self._skip = set(skip)
+        self._rows: Dict[Any, List[Optional[float]]] = {}
+        self._failed: Dict[Any, List[bool]] = {}
+        self._pending: Dict[Any, int] = {}
+        self._parsed: Set[Any] = set()
+        self._lock = threading.Lock()
+
+        # Number of regions that failed to be retrieved
+        self.failed = 0
+
+    def expect(self, key: Any) -> List[Tuple[int, str]]:
+        """
+        Registers a game and returns the regions to request for it
+
+        Args:
+            key (Any): The game id
+
+        Returns:
+            List[Tuple[int, str]]: Pairs of (column index, region)
+        """
+        regions = [(index, region) for index, region in enumerate(self.regions)
+                   if region not in self._skip]
+        with self._lock:
+            self._rows[key] = [None] * len(self.regions)
+            self._failed[key] = [False] * len(self.regions)
+            self._pending[key] = len(regions)
+        return regions
+
+    def resolve(self, key: Any, index: int,
+                price: Any) -> Optional[Tuple[List[Optional[float]], List[bool]]]:
+        """
+        Records the result of one region of a game
+
+        Args:
+            key (Any): The game id
+            index (int): The column index returned by expect()
+            price (Any): The price, or the exception raised while retrieving it
+
+        Returns:
+            Optional[Tuple[List[Optional[float]], List[bool]]]: The prices of every region and
+                                                                whether each region failed, once
+                                                                the last region of the game is
+                                                                resolved, otherwise None
+        """
+        with self._lock:
+            if isinstance(price, Exception):
+                self._failed[key][index] = True
+                self.failed += 1
+            else:
+                self._rows[key][index] = price
+                self._parsed.add(key)
+
+            self._pending[key] -= 1
+            if self._pending[key] > 0:
+                return None
+
+            del self._pending[key]
+            row, failed = self._rows.pop(key), self._failed.pop(key)
+            if key not in self._parsed:
+                return None
+            self._parsed.discard(key)
+            return row, failed
+
+
+def fetch_regions(fetch: Callable[[str], Any], requests: Iterable[Tuple[Any, str]],
+                  max_workers: Optional[int] = None) -> Generator[Tuple[Any, Any], None, None]:
+    """
+    Requests every url concurrently. The number of requests actually
+    in flight per host is set by the adaptive limiter
+
+    Args:
+        fetch (Callable[[str], Any]): Downloads a url
+        requests (Iterable[Tuple[Any, str]]): Pairs of (key, url)
+        max_workers (Optional[int]): Number of threads (defaults to MAX_WORKERS)
+
+    Yields:
+        Tuple[Any, Any]: The key and the response in completion order,
+                         or the exception raised by fetch
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch, url): key for key, url in requests}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
@@ -0,0 +1,213 @@
+from concurrent.futures import (ThreadPoolExecutor, ProcessPoolExecutor,
+                                FIRST_COMPLETED, Future, wait)
+from typing import Optional, Callable, Iterable, Generator, Tuple, List, Dict, Any
+import multiprocessing
+import threading
+import queue
+from utils.constants import MAX_WORKERS
+
+_DONE = object()
+
+
+class FetchParsePool:
+    def __init__(self, fetch: Callable[[str], Any], parse: Callable[..., Any],
+                 io_workers: Optional[int] = None, cpu_workers: Optional[int] = None,
+                 queue_size: int = 64):
+        """
+        Two-stage pipeline: threads download pages, worker processes parse them
+
+        Args:
+            fetch (Callable[[str], Any]): Downloads a url; returning None drops the task
+            parse (Callable[..., Any]): Module-level function called as parse(content, *args)
+                                        in a worker process; it must return picklable data
+            io_workers (Optional[int]): Number of download threads (defaults to MAX_WORKERS)
+            cpu_workers (Optional[int]): Number of parser processes (defaults to the number of cores)
+            queue_size (int): Maximum number of downloaded pages waiting to be parsed
+                              and of pages being parsed at once
+        """
+        self.fetch = fetch
+        self.parse = parse
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.queue_size = queue_size
+
+    def _download(self, tasks: Iterable[Tuple[Any, str, Tuple[Any, ...]]],
+                  raw: queue.Queue, errors: list):
+        # Each slot is a page that is being downloaded or waits in the queue,
+        # so the task iterable is consumed only as fast as the parsers keep up
+        slots = threading.BoundedSemaphore(self.queue_size)
+
+        def fetch(key: Any, url: str, args: Tuple[Any, ...]):
+            try:
+                content, error = self.fetch(url), None
+            except Exception as e:
+                content, error = None, e
+            raw.put((key, args, content, error))
+            slots.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.io_workers or MAX_WORKERS) as executor:
+                for key, url, args in tasks:
+                    slots.acquire()
+                    executor.submit(fetch, key, url, args)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            raw.put(_DONE)
+
+    @staticmethod
+    def _result(future: Future) -> Any:
+        try:
+            return future.result()
+        except Exception as e:
+            return e
+
+    def map(self, tasks: Iterable[Tuple[Any, str, Tuple[Any, ...]]]) -> Generator[Tuple[Any, Any], None, None]:
+        """
+        Downloads and parses every task, yielding results in completion order
+
+        Args:
+            tasks (Iterable[Tuple[Any, str, Tuple[Any, ...]]]): Triples of (key, url, parse arguments)
+
+        Yields:
+            Tuple[Any, Any]: The task key and the parsed result. The result is an exception
+                             if the download or parsing failed, or None if fetch returned None
+        """
+        raw, errors = queue.Queue(maxsize=self.queue_size), []
+        threading.Thread(target=self._download, args=(tasks, raw, errors), daemon=True).start()
+
+        # Workers are spawned rather than forked, because forking a process
+        # while download threads hold locks can deadlock the child
+        with ProcessPoolExecutor(max_workers=self.cpu_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            parsing = {}
+            while True:
+                item = raw.get()
+                if item is _DONE:
+                    break
+
+                key, args, content, error = item
+                if error is not None or content is None:
+                    yield key, error
+                    continue
+
+                parsing[executor.submit(self.parse, content, *args)] = key
+                if len(parsing) >= self.queue_size:
+                    done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield parsing.pop(future), self._result(future)
+
+            for future in list(parsing):
+                yield parsing.pop(future), self._result(future)
+
+        if errors:
+            raise errors[0]
+
+
+class TaskGroup:
+    def __init__(self, graph: 'TaskGraph', key: Any,
+                 on_done: Optional[Callable[['TaskGroup'], None]]):
+        """
+        Tasks belonging to one root item (e.g. a player). The group is flushed
+        by on_done once its last task has finished
+
+        Args:
+            graph (TaskGraph): The graph whose pool runs the tasks
+            key (Any): Identifier of the root item
+            on_done (Optional[Callable[[TaskGroup], None]]): Called once after all tasks have finished
+        """
+        self.key = key
+        # Data shared by the tasks of the group, e.g. flags read by on_done
+        self.state: Dict[str, Any] = {}
+        # Exceptions raised by the tasks of the group
+        self.errors: List[Exception] = []
+        self._graph = graph
+        self._on_done = on_done
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def spawn(self, fn: Callable[..., Any], *args: Any):
+        """
+        Schedules fn(group, *args) on the shared pool. A task may spawn further tasks
+
+        Args:
+            fn (Callable[..., Any]): The task; it receives the group as the first argument
+            *args (Any): Arguments passed to the task
+        """
+        with self._lock:
+            self._pending += 1
+        self._graph._executor.submit(self._run, fn, args)
+
+    def _run(self, fn: Callable[..., Any], args: Tuple[Any, ...]):
+        try:
+            fn(self, *args)
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                done = self._pending == 0
+            if done:
+                self._graph._finish(self)
+
+
+class TaskGraph:
+    def __init__(self, max_workers: Optional[int] = None, max_groups: int = 16):
+        """
+        A long-lived thread pool shared by many task groups. Groups are admitted
+        until max_groups of them are in flight, which caps the memory held by
+        partially collected results
+
+        Args:
+            max_workers (Optional[int]): Number of threads in the pool (defaults to MAX_WORKERS)
+            max_groups (int): Maximum number of groups in flight
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS)
+        self._slots = threading.BoundedSemaphore(max_groups)
+        self._idle = threading.Condition()
+        self._active = 0
+
+    def submit(self, key: Any, fn: Callable[..., Any], *args: Any,
+               on_done: Optional[Callable[[TaskGroup], None]] = None) -> TaskGroup:
+        """
+        Starts a new group with fn(group, *args) as its first task. Blocks while
+        the maximum number of groups is in flight
+
+        Args:
+            key (Any): Identifier of the root item
+            fn (Callable[..., Any]): The first task of the group
+            *args (Any): Arguments passed to the task
+            on_done (Optional[Callable[[TaskGroup], None]]): Called once after all tasks have finished
+
+        Returns:
+            TaskGroup: The started group
+        """
+        self._slots.acquire()
+        with self._idle:
+            self._active += 1
+
+        group = TaskGroup(self, key, on_done)
+        group.spawn(fn, *args)
+        return group
+
+    def _finish(self, group: TaskGroup):
+        try:
+            if group._on_done is not None:
+                group._on_done(group)
+        finally:
+            self._slots.release()
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def join(self):
+        # Waits until every submitted group has been flushed
+        with self._idle:
+            self._idle.wait_for(lambda: self._active == 0)
+
+    def __enter__(self) -> 'TaskGraph':
+        return self
+
+    def __exit__(self, *exc: Any):
+        self.join()
+        self._executor.shutdown()